@@ -0,0 +1,2 @@
+# Password of every user seeded by benchmarks.datagen; the load clients log in with it.
+BENCHMARK_PASSWORD = 'benchmark'
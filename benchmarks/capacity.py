@@ -0,0 +1,80 @@
+"""
+Concurrent-connection capacity of one worker, WSGI vs the asyncio read path.
+
+Start one worker of each against the same database, e.g.
+
+    DATABASE_URL=sqlite:////tmp/bench.db flask --app src run --port 5000 --with-threads
+    DATABASE_URL=sqlite:////tmp/bench.db uvicorn src.asgi:application --port 5001 --workers 1
+
+then
+
+    python -m benchmarks.capacity --target wsgi=http://localhost:5000 --target asgi=http://localhost:5001
+
+Each target gets the read-only mix at every --concurrency level. A target's capacity
+is the highest level it served with no errors and p99 within --slo-ms.
+"""
+from benchmarks import BENCHMARK_PASSWORD
+from benchmarks.load import HttpTarget, auth_header, parse_mix, run_load
+
+import argparse
+import json
+import sys
+
+READ_MIX = 'active=30,active_optimized=30,history=20,history_optimized=20'
+DEFAULT_LEVELS = '1,8,32,64,128'
+DEFAULT_SLO_MS = 250
+
+
+def warm_up(url, users):
+    """Log every user in once so password hashing does not land in the measured levels."""
+    target = HttpTarget(url)
+    for user_id in range(1, users + 1):
+        target.request('GET', '/subscriptions/active', auth_header(user_id, BENCHMARK_PASSWORD))
+
+
+def measure(url, levels, requests, users, mix, slo_seconds):
+    """Run the mix at each concurrency level; returns per-level stats and the capacity."""
+    warm_up(url, users)
+    rows = []
+    capacity = 0
+    for level in levels:
+        result = run_load(url, workers=level, mode='thread', requests=requests, users=users, mix=mix)
+        routes = result['routes'].values()
+        p99 = max(stats['p99'] for stats in routes)
+        error_rate = sum(stats['error_rate'] * stats['requests'] for stats in routes) / sum(stats['requests'] for stats in routes)
+        rows.append({'concurrency': level, 'throughput': result['throughput'], 'p99': p99, 'error_rate': error_rate})
+        if error_rate == 0 and p99 <= slo_seconds:
+            capacity = level
+    return {'levels': rows, 'capacity': capacity}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='name=url, repeatable.')
+    parser.add_argument('--concurrency', default=DEFAULT_LEVELS, help='Comma-separated client counts.')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client per level.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--mix', default=READ_MIX)
+    parser.add_argument('--slo-ms', type=float, default=DEFAULT_SLO_MS)
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    mix = parse_mix(args.mix)
+    results = {}
+    for target in args.target:
+        name, _, url = target.partition('=')
+        results[name] = measure(url, levels, args.requests, args.users, mix, args.slo_ms / 1000)
+        print(f"{name} ({url}): capacity {results[name]['capacity']} concurrent clients at p99 <= {args.slo_ms:g}ms")
+        for row in results[name]['levels']:
+            print(f"  {row['concurrency']:>5} clients {row['throughput']:>9.1f} req/s  p99 {row['p99'] * 1000:>8.2f}ms"
+                  f"  errors {row['error_rate']:.1%}")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
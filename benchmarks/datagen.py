@@ -0,0 +1,110 @@
+from sqlalchemy import event, insert
+from werkzeug.security import generate_password_hash
+from benchmarks import BENCHMARK_PASSWORD
+from datetime import datetime, timedelta
+from src.models import Base, SubscriptionPlan, SubscriptionStatus, User, UserSubscription, UserSubscriptionVersion
+from src.utils.current_subscription import refresh_current_subscriptions
+
+import random
+
+DEFAULT_CHUNK_SIZE = 20000
+HISTORY_DAYS = 730
+
+PLANS = (
+    ('Basic', 10, 30),
+    ('Standard', 20, 30),
+    ('Premium', 30, 30),
+    ('Annual', 200, 365),
+    ('Quarterly', 55, 90),
+)
+
+
+def _fast_sqlite(dbapi_connection, connection_record):
+    # Seeding only: the database is disposable, so trade durability for speed.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=OFF')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.close()
+
+
+def _subscriptions_for(user_id, plans, rng, now):
+    """
+    Chronological history for one user:
+    - About 10% of users never subscribed, the rest have 1-6 subscriptions
+    - Earlier subscriptions ran to term (INACTIVE) or were cancelled early (CANCELLED)
+    - The latest is ACTIVE when it has not reached its end_date yet, INACTIVE otherwise
+    """
+    if rng.random() < 0.1:
+        return []
+    count = min(1 + int(rng.expovariate(0.6)), 6)
+    start = now - timedelta(days=rng.uniform(0, HISTORY_DAYS))
+    rows = []
+    for index in range(count):
+        plan = plans[rng.randrange(len(plans))]
+        end = start + timedelta(days=plan.duration_days)
+        latest = index == count - 1
+        if latest and end > now:
+            status = SubscriptionStatus.ACTIVE
+        elif not latest and rng.random() < 0.3:
+            end = start + timedelta(days=rng.uniform(0, plan.duration_days))
+            status = SubscriptionStatus.CANCELLED
+        else:
+            status = SubscriptionStatus.INACTIVE
+        rows.append({
+            'user_id': user_id,
+            'plan_id': plan.id,
+            'start_date': start,
+            'end_date': end,
+            'status': status,
+            'created_at': start,
+            'updated_at': end if end < now else start,
+        })
+        start = end + timedelta(days=rng.uniform(0, 30))
+        if start > now:
+            break
+    return rows
+
+
+def generate(engine, users, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, now=None):
+    """
+    Seed users, plans and subscriptions (plus the current-subscription projection and
+    a subscription version per user) with executemany in chunks. Every user's password is BENCHMARK_PASSWORD.
+    Returns a dict of row counts.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _fast_sqlite)
+    Base.metadata.create_all(engine)
+
+    password = generate_password_hash(BENCHMARK_PASSWORD)
+    counts = {'users': 0, 'plans': len(PLANS), 'subscriptions': 0}
+    with engine.begin() as connection:
+        connection.execute(insert(SubscriptionPlan), [
+            {'id': plan_id, 'name': name, 'price': price, 'duration_days': days}
+            for plan_id, (name, price, days) in enumerate(PLANS, start=1)
+        ])
+    plans = [SubscriptionPlan(id=plan_id, duration_days=days) for plan_id, (_, _, days) in enumerate(PLANS, start=1)]
+
+    for first in range(1, users + 1, chunk_size):
+        user_ids = range(first, min(first + chunk_size, users + 1))
+        subscriptions = []
+        for user_id in user_ids:
+            subscriptions.extend(_subscriptions_for(user_id, plans, rng, now))
+        with engine.begin() as connection:
+            connection.execute(insert(User), [
+                {'id': user_id, 'username': f'user{user_id}', 'password': password, 'email': f'user{user_id}@example.com'}
+                for user_id in user_ids
+            ])
+            if subscriptions:
+                connection.execute(insert(UserSubscription), subscriptions)
+            active = {row['user_id']: row['end_date'] for row in subscriptions if row['status'] == SubscriptionStatus.ACTIVE}
+            connection.execute(insert(UserSubscriptionVersion), [
+                {'user_id': user_id, 'version': 1, 'expires_at': active.get(user_id)} for user_id in user_ids
+            ])
+        counts['users'] += len(user_ids)
+        counts['subscriptions'] += len(subscriptions)
+
+    with engine.begin() as connection:
+        refresh_current_subscriptions(connection)
+    return counts
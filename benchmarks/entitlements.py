@@ -0,0 +1,125 @@
+"""
+Memory, load time and lookup rate of the in-memory entitlement index.
+
+    python -m benchmarks.entitlements --db /tmp/entitlements.db --users 1000000 --seed-data
+    python -m benchmarks.entitlements --db /tmp/entitlements.db --lookups 200000
+
+- load: one scan of the ACTIVE rows into the array (what a pre-forking master does)
+- memory: bytes held by the index, and per million user ids
+- lookup: EntitlementIndex.lookup() for random users, no database
+- route: GET /internal/entitlements/<id> through the app, against
+  GET /subscriptions/active/optimized for the same users (Basic credentials already
+  in the credential cache, active-subscription cache cleared before every call)
+"""
+from datetime import datetime
+from benchmarks import BENCHMARK_PASSWORD
+from benchmarks.load import auth_header
+from benchmarks.run import summarize
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+SERVICE_TOKEN = 'benchmark-service-token'
+
+
+def run_index(users, lookups, seed=0):
+    """Load the index from the app's database, then time lookups; returns a dict of results."""
+    from src import app, db
+    from src.utils.entitlements import load_entitlement_index
+
+    started = time.perf_counter()
+    index = load_entitlement_index(app, db)
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    user_ids = [rng.randint(1, users) for _ in range(lookups)]
+    now = time.time()
+    started = time.perf_counter()
+    active = sum(1 for user_id in user_ids if index.lookup(user_id, now) is not None)
+    lookup_seconds = time.perf_counter() - started
+    memory = index.memory_bytes()
+    return {
+        'users': users,
+        'load_seconds': load_seconds,
+        'memory_bytes': memory,
+        'bytes_per_million_users': memory / max(len(index.slots) - 1, 1) * 1_000_000,
+        'lookups_per_second': lookups / lookup_seconds,
+        'active_share': active / lookups,
+    }
+
+
+def run_routes(users, requests, seed=0):
+    """Per-request seconds of the entitlement route and of the optimized active-subscription route."""
+    from src import app
+    from src.utils.active_subscription_cache import get_active_subscription_cache
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    results = {}
+    for name, path in (('entitlement_route', '/internal/entitlements/{}'), ('active_optimized_route', '/subscriptions/active/optimized')):
+        samples = []
+        for _ in range(requests):
+            user_id = rng.randint(1, users)
+            if name == 'entitlement_route':
+                url, headers = path.format(user_id), {'X-Service-Token': SERVICE_TOKEN}
+            else:
+                url, headers = path, auth_header(user_id, BENCHMARK_PASSWORD)
+                client.get(url, headers=headers)  # authenticate once: the comparison is the lookup, not scrypt
+                with app.app_context():
+                    get_active_subscription_cache().clear()
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            samples.append(time.perf_counter() - started)
+            assert response.status_code in (200, 404), (url, response.status_code)
+        results[name] = summarize(samples)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='entitlements.db', help='SQLite file to benchmark against.')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--seed-data', action='store_true', help='(Re)create the database with synthetic data first.')
+    parser.add_argument('--lookups', type=int, default=1_000_000, help='In-process index lookups to time.')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per route.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    os.environ['ENTITLEMENT_SERVICE_TOKENS'] = SERVICE_TOKEN
+    os.environ['ENTITLEMENT_REFRESH_SECONDS'] = '0'
+    os.environ['ADMISSION_CONTROL_ENABLED'] = 'false'
+    os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+    from src import app, db
+
+    if args.seed_data:
+        from benchmarks.datagen import generate
+
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        with app.app_context():
+            started = time.perf_counter()
+            rows = generate(db.engine, args.users)
+            print(f'Seeded {rows} in {time.perf_counter() - started:.1f}s')
+
+    index = run_index(args.users, args.lookups)
+    print(f"index: loaded in {index['load_seconds']:.2f}s, {index['memory_bytes'] / 2 ** 20:.1f} MiB "
+          f"({index['bytes_per_million_users'] / 2 ** 20:.2f} MiB per million users), "
+          f"{index['lookups_per_second']:,.0f} lookups/s")
+    routes = run_routes(args.users, args.requests)
+    for name, stats in routes.items():
+        print(f"{name:>23}: p50 {stats['p50'] * 1000:.3f}ms  p95 {stats['p95'] * 1000:.3f}ms  "
+              f"({1 / stats['mean']:,.0f} requests/s on one thread)")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'db': args.db, 'index': index, 'routes': routes}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
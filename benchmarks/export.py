@@ -0,0 +1,113 @@
+"""
+Rows/s and peak RSS of the subscription export on a seeded SQLite file.
+
+    python -m benchmarks.export --db /tmp/export.db --users 1000000 --seed-data
+    python -m benchmarks.export --db /tmp/export.db --variant csv --variant ndjson-gzip
+
+Each variant runs in its own process, so its peak RSS is its own:
+- materialized: fetch every row, build a dict per row and one JSON array, as the
+  per-user history endpoints do (the baseline)
+- ndjson / csv / ndjson-gzip / csv-gzip: iter_export() with a streaming cursor
+Output goes to a byte counter, so disk speed does not enter into it.
+"""
+from datetime import datetime
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+VARIANTS = ('materialized', 'ndjson', 'csv', 'ndjson-gzip', 'csv-gzip')
+DEFAULT_VARIANTS = ('materialized', 'ndjson', 'csv', 'ndjson-gzip')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_variant(variant, chunk_size):
+    """Export everything once with one variant; returns rows, bytes, seconds and peak RSS."""
+    from src import app, db
+    from src.models import ArchivedSubscription, UserSubscription
+    from src.utils.export import EXPORT_FIELDS, export_query, gzip_chunks, iter_export, parse_export_filters
+
+    filters = parse_export_filters()
+    with app.app_context():
+        baseline_rss = peak_rss_mb()
+        started = time.perf_counter()
+        size = rows = 0
+        if variant == 'materialized':
+            records = [dict(zip(EXPORT_FIELDS, row)) for model in (UserSubscription, ArchivedSubscription)
+                       for row in db.session.execute(export_query(filters, model)).all()]
+            rows = len(records)
+            size = len(app.json.dumps(records))
+        else:
+            fmt, _, compress = variant.partition('-')
+            chunks = iter_export(db.session, filters, fmt, chunk_size)
+            chunks = gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
+            for chunk in chunks:
+                size += len(chunk)
+            rows = sum(db.session.execute(export_query(filters, model).with_only_columns(db.func.count()).order_by(None)).scalar()
+                       for model in (UserSubscription, ArchivedSubscription))
+        elapsed = time.perf_counter() - started
+    return {
+        'variant': variant,
+        'rows': rows,
+        'bytes': size,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - baseline_rss,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='export.db', help='SQLite file to export from.')
+    parser.add_argument('--users', type=int, default=1000000, help='Users to seed; about 2.4 subscriptions each.')
+    parser.add_argument('--seed-data', action='store_true', help='(Re)create the database with synthetic data first.')
+    parser.add_argument('--variant', action='append', choices=VARIANTS, help='Repeatable (default: all but csv-gzip).')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    if args.child:
+        print(json.dumps(run_variant(args.variant[0], args.chunk_size)))
+        return 0
+
+    if args.seed_data:
+        from sqlalchemy import create_engine
+        from benchmarks.datagen import generate
+
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        started = time.perf_counter()
+        counts = generate(create_engine(os.environ['DATABASE_URL']), args.users)
+        print(f'Seeded {counts} in {time.perf_counter() - started:.1f}s')
+
+    results = []
+    for variant in args.variant or DEFAULT_VARIANTS:
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.export', '--db', args.db, '--variant', variant, '--chunk-size', str(args.chunk_size), '--child'],
+            capture_output=True, text=True, check=True,
+        )
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{variant:>12}: {result['rows']} rows in {result['seconds']:.1f}s ({result['rows_per_second']:,.0f} rows/s), "
+              f"{result['bytes'] / 1e6:.1f} MB out, peak RSS {result['peak_rss_mb']:.0f} MB (+{result['rss_growth_mb']:.0f} MB)")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'db': args.db, 'results': results}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
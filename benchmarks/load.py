@@ -0,0 +1,259 @@
+"""
+Concurrent mixed read/write load against the subscription API.
+
+    python -m benchmarks.load --db /tmp/bench.db --workers 16 --requests 200
+    python -m benchmarks.load --url http://localhost:5000 --db /tmp/bench.db --mode process --hot-users 20
+
+Without --url, every client drives the Flask test client in-process against --db.
+Users come from benchmarks.datagen (username userN, password BENCHMARK_PASSWORD).
+--hot-users narrows clients down to a small set of users to provoke contention on
+the check-then-insert write paths. Writes carry an Idempotency-Key, reused across
+retries of the same operation, as a mobile client would send.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from benchmarks import BENCHMARK_PASSWORD
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+import uuid
+
+DEFAULT_MIX = 'active=30,active_optimized=30,history=10,history_optimized=10,subscribe=8,upgrade=6,cancel=6'
+DEFAULT_PLANS = 5
+MAX_RETRIES = 3
+# Statuses a client backs off on and retries, honoring Retry-After when present.
+RETRY_STATUSES = (409, 423, 429, 503)
+# A 400/409 on a write means it lost a race or raced another client's state change.
+CONFLICT_STATUSES = (400, 409)
+
+ROUTES = {
+    'active': ('GET', '/subscriptions/active'),
+    'active_optimized': ('GET', '/subscriptions/active/optimized'),
+    'history': ('GET', '/subscriptions/history'),
+    'history_optimized': ('GET', '/subscriptions/history/optimized'),
+    'subscribe': ('POST', '/subscribe/{plan_id}'),
+    'upgrade': ('POST', '/subscriptions/upgrade/{plan_id}'),
+    'cancel': ('POST', '/subscriptions/cancel'),
+}
+WRITES = ('subscribe', 'upgrade', 'cancel')
+
+_server_timing_db = re.compile(r'\bdb;dur=([\d.]+)')
+
+
+def parse_mix(mix):
+    """'active=30,subscribe=10' -> {'active': 30, 'subscribe': 10}; raises ValueError."""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ROUTES:
+            raise ValueError(f"Unknown operation {name!r}, expected one of {', '.join(ROUTES)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class AppTarget:
+    """Flask test client for the in-process app."""
+
+    def __init__(self):
+        from src import app
+
+        self.client = app.test_client()
+
+    def request(self, method, path, headers):
+        response = self.client.open(path, method=method, headers=headers)
+        return response.status_code, response.headers, response.get_data()
+
+
+class HttpTarget:
+    """A running server, one connection per request."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, headers):
+        try:
+            with urlopen(Request(self.base_url + path, method=method, headers=headers), timeout=30) as response:
+                return response.status, response.headers, response.read()
+        except HTTPError as exc:
+            return exc.code, exc.headers, exc.read()
+        except OSError:
+            return 0, {}, b''
+
+
+def make_target(url):
+    return HttpTarget(url) if url else AppTarget()
+
+
+def auth_header(user_id, password):
+    token = base64.b64encode(f'user{user_id}:{password}'.encode('utf-8')).decode('ascii')
+    return {'Authorization': f'Basic {token}'}
+
+
+def _backoff(headers, attempt, rng):
+    retry_after = headers.get('Retry-After') if headers else None
+    if retry_after:
+        try:
+            return min(float(retry_after), 1.0)
+        except ValueError:
+            pass
+    return rng.uniform(0, 0.01 * 2 ** attempt)
+
+
+def run_client(worker, url, config):
+    """
+    One client's loop; returns samples of
+    (operation, status, seconds, retries, db_seconds or None).
+    """
+    target = make_target(url)
+    rng = random.Random(config['seed'] + worker)
+    operations, weights = zip(*config['mix'].items())
+    pool = config['hot_users'] or config['users']
+    samples = []
+    for _ in range(config['requests']):
+        operation = rng.choices(operations, weights)[0]
+        method, path = ROUTES[operation]
+        path = path.format(plan_id=rng.randint(1, config['plans']))
+        headers = auth_header(rng.randint(1, pool), config.get('password', BENCHMARK_PASSWORD))
+        if operation in WRITES:
+            headers['Idempotency-Key'] = uuid.uuid4().hex
+
+        retries = 0
+        started = time.perf_counter()
+        while True:
+            status, response_headers, _ = target.request(method, path, headers)
+            if status not in RETRY_STATUSES or retries >= MAX_RETRIES:
+                break
+            time.sleep(_backoff(response_headers, retries, rng))
+            retries += 1
+        elapsed = time.perf_counter() - started
+
+        match = _server_timing_db.search(response_headers.get('Server-Timing', '') if response_headers else '')
+        samples.append((operation, status, elapsed, retries, float(match.group(1)) / 1000 if match else None))
+    return samples
+
+
+def summarize(samples, wall_seconds):
+    from benchmarks.run import percentile
+
+    report = {}
+    for operation in ROUTES:
+        rows = [sample for sample in samples if sample[0] == operation]
+        if not rows:
+            continue
+        latencies = sorted(row[2] for row in rows)
+        db_times = sorted(row[4] for row in rows if row[4] is not None)
+        errors = sum(1 for row in rows if row[1] == 0 or row[1] >= 500)
+        conflicts = sum(1 for row in rows if operation in WRITES and row[1] in CONFLICT_STATUSES)
+        report[' '.join(ROUTES[operation])] = {
+            'requests': len(rows),
+            'throughput': round(len(rows) / wall_seconds, 2),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'error_rate': errors / len(rows),
+            'conflict_rate': conflicts / len(rows),
+            'retries': sum(row[3] for row in rows),
+            'db_p95': percentile(db_times, 95),
+            'statuses': dict(Counter(str(row[1]) for row in rows)),
+        }
+    return report
+
+
+def duplicate_active_users(session):
+    """Users left with more than one ACTIVE subscription: lost check-then-insert races."""
+    from sqlalchemy import func, select
+    from src.models import SubscriptionStatus, UserSubscription
+
+    return session.execute(
+        select(func.count()).select_from(
+            select(UserSubscription.user_id)
+            .where(UserSubscription.status == SubscriptionStatus.ACTIVE)
+            .group_by(UserSubscription.user_id)
+            .having(func.count() > 1)
+            .subquery()
+        )
+    ).scalar()
+
+
+def run_load(url=None, workers=8, mode='thread', **config):
+    """Run workers concurrent clients and return the per-route report."""
+    config = {'mix': parse_mix(DEFAULT_MIX), 'requests': 100, 'users': 1000, 'hot_users': 0,
+              'plans': DEFAULT_PLANS, 'seed': 0, **config}
+    if mode == 'process':
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        executor = ThreadPoolExecutor(workers)
+    started = time.perf_counter()
+    with executor:
+        futures = [executor.submit(run_client, worker, url, config) for worker in range(workers)]
+        samples = [sample for future in futures for sample in future.result()]
+    wall_seconds = time.perf_counter() - started
+    return {
+        'workers': workers,
+        'mode': mode,
+        'wall_seconds': wall_seconds,
+        'throughput': round(len(samples) / wall_seconds, 2),
+        'routes': summarize(samples, wall_seconds),
+    }
+
+
+def _report(result):
+    print(f"{result['workers']} {result['mode']} workers, {result['throughput']} req/s over {result['wall_seconds']:.1f}s")
+    print(f"{'route':<40}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'err%':>7}{'confl%':>8}{'retry':>7}{'db p95':>9}  statuses")
+    for route, stats in result['routes'].items():
+        db_p95 = f"{stats['db_p95'] * 1000:.2f}" if stats['db_p95'] is not None else '-'
+        print(f"{route:<40}{stats['requests']:>7}{stats['throughput']:>9.1f}{stats['p50'] * 1000:>9.2f}"
+              f"{stats['p95'] * 1000:>9.2f}{stats['p99'] * 1000:>9.2f}{stats['error_rate']:>7.1%}"
+              f"{stats['conflict_rate']:>8.1%}{stats['retries']:>7}{db_p95:>9}  {stats['statuses']}")
+    if result.get('duplicate_active_users') is not None:
+        print(f"users with more than one ACTIVE subscription: {result['duplicate_active_users']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running server; defaults to the in-process test client.')
+    parser.add_argument('--db', default='benchmark.db', help='SQLite file seeded by benchmarks.run --seed-data.')
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per worker.')
+    parser.add_argument('--users', type=int, default=1000, help='Seeded users to pick from.')
+    parser.add_argument('--hot-users', type=int, default=0, help='Only use users 1..N, to force contention.')
+    parser.add_argument('--plans', type=int, default=DEFAULT_PLANS)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Comma-separated operation=weight pairs.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the report to this JSON file.')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    result = run_load(args.url, args.workers, args.mode, mix=mix, requests=args.requests, users=args.users,
+                      hot_users=args.hot_users, plans=args.plans, seed=args.seed)
+    if os.path.exists(args.db):
+        from src import app, db
+
+        with app.app_context():
+            result['duplicate_active_users'] = duplicate_active_users(db.session)
+
+    _report(result)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(result, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
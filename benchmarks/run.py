@@ -0,0 +1,210 @@
+"""
+Time the ORM subscription endpoints against their /optimized counterparts, and the
+conditional GETs (If-None-Match with the current ETag, answered 304) of the same reads.
+
+    python -m benchmarks.run --db /tmp/bench.db --users 100000 --seed-data --output baseline.json
+    python -m benchmarks.run --db /tmp/bench.db --compare baseline.json --threshold 0.2
+
+Comparison exits 1 when any path's p95 (or --metric) regressed past the threshold.
+"""
+from datetime import datetime
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+DEFAULT_ITERATIONS = 500
+DEFAULT_WARMUP = 50
+DEFAULT_THRESHOLD = 0.2
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return None
+    rank = max(1, -(-pct * len(samples) // 100))
+    return samples[int(rank) - 1]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    summary = {f'p{pct}': percentile(samples, pct) for pct in PERCENTILES}
+    summary.update(mean=sum(samples) / len(samples), iterations=len(samples))
+    return summary
+
+
+def benchmark_paths():
+    from src.routes import (
+        get_active_subscriptions_optimized_user,
+        get_active_subscriptions_user,
+        get_subscription_history_optimized_user,
+        get_subscription_history_user,
+    )
+
+    return {
+        'active_orm': ('/subscriptions/active', get_active_subscriptions_user),
+        'active_optimized': ('/subscriptions/active/optimized', get_active_subscriptions_optimized_user),
+        'history_orm': ('/subscriptions/history', get_subscription_history_user),
+        'history_optimized': ('/subscriptions/history/optimized', get_subscription_history_optimized_user),
+    }
+
+
+def revalidation_paths():
+    from src import db
+    from src.routes import get_active_subscriptions_user, get_all_plans_response, get_subscription_history_user
+    from src.utils.plan_catalog import get_plan_catalog
+    from src.utils.subscription_versions import subscription_etag
+
+    def user_etag(user_id):
+        return subscription_etag(db.session, user_id)
+
+    def plans_etag(user_id):
+        return get_plan_catalog().refresh(db.session).etag
+
+    return {
+        'active_304': ('/subscriptions/active', get_active_subscriptions_user, user_etag),
+        'history_304': ('/subscriptions/history', get_subscription_history_user, user_etag),
+        'plans_304': ('/plans', lambda user_id: get_all_plans_response(), plans_etag),
+    }
+
+
+def run_revalidations(app, users, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, seed=0):
+    """
+    Conditional GETs for random users whose client already holds the current ETag:
+    the view runs behind conditional_get, exactly as routed, and every call must end
+    in a 304. The tag is looked up outside the timed section.
+    """
+    from src import db
+    from src.utils.conditional_get import conditional_get
+
+    rng = random.Random(seed)
+    results = {}
+    for name, (path, view, current_etag) in revalidation_paths().items():
+        samples = []
+        for index in range(warmup + iterations):
+            user_id = rng.randint(1, users)
+            with app.test_request_context(path):
+                etag = current_etag(user_id)
+            db.session.remove()
+            conditional_view = conditional_get(lambda: current_etag(user_id))(lambda: view(user_id))
+            with app.test_request_context(path, headers={'If-None-Match': f'"{etag}"'}):
+                started = time.perf_counter()
+                response = conditional_view()
+                elapsed = time.perf_counter() - started
+            db.session.remove()
+            assert response.status_code == 304, (name, user_id, response.status_code)
+            if index >= warmup:
+                samples.append(elapsed)
+        results[name] = summarize(samples)
+    return results
+
+
+def run_benchmarks(app, users, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, seed=0):
+    """
+    Call each path for random users and record wall time per call, in seconds.
+    The active-subscription cache is cleared before every call, so the numbers
+    are for the database path rather than a cache hit.
+    """
+    from src import db
+    from src.utils.active_subscription_cache import get_active_subscription_cache
+
+    rng = random.Random(seed)
+    results = {}
+    for name, (path, view) in benchmark_paths().items():
+        samples = []
+        for index in range(warmup + iterations):
+            user_id = rng.randint(1, users)
+            with app.test_request_context(path):
+                get_active_subscription_cache().clear()
+                started = time.perf_counter()
+                view(user_id)
+                elapsed = time.perf_counter() - started
+            db.session.remove()
+            if index >= warmup:
+                samples.append(elapsed)
+        results[name] = summarize(samples)
+    return results
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, metric='p95'):
+    """Paths whose metric grew by more than threshold (a fraction) over the baseline."""
+    regressions = {}
+    for name, result in current.items():
+        before = baseline.get(name, {}).get(metric)
+        if before and result[metric] > before * (1 + threshold):
+            regressions[name] = {'baseline': before, 'current': result[metric], 'change': result[metric] / before - 1}
+    return regressions
+
+
+def _report(results):
+    print(f"{'path':<20}" + ''.join(f'{f"p{pct} ms":>12}' for pct in PERCENTILES) + f"{'mean ms':>12}")
+    for name, result in results.items():
+        print(f'{name:<20}' + ''.join(f"{result[f'p{pct}'] * 1000:>12.3f}" for pct in PERCENTILES) + f"{result['mean'] * 1000:>12.3f}")
+    for kind in ('active', 'history'):
+        orm, optimized = results.get(f'{kind}_orm'), results.get(f'{kind}_optimized')
+        if orm and optimized:
+            print(f"{kind}: optimized p50 is {orm['p50'] / optimized['p50']:.2f}x the ORM path")
+        revalidated = results.get(f'{kind}_304')
+        if orm and revalidated:
+            print(f"{kind}: a 304 p50 is {orm['p50'] / revalidated['p50']:.2f}x the full ORM response")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='benchmark.db', help='SQLite file to benchmark against.')
+    parser.add_argument('--users', type=int, default=10000, help='Users to seed (10^4 to 10^7).')
+    parser.add_argument('--seed-data', action='store_true', help='(Re)create the database with synthetic data first.')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--output', help='Write results to this JSON baseline file.')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed slowdown, e.g. 0.2 for 20%%.')
+    parser.add_argument('--metric', default='p95', choices=[f'p{pct}' for pct in PERCENTILES] + ['mean'])
+    args = parser.parse_args(argv)
+
+    # src builds its app from DATABASE_URL at import time.
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    from src import app, db
+
+    meta = {
+        'users': args.users,
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+    }
+    with app.app_context():
+        if args.seed_data:
+            from benchmarks.datagen import generate
+
+            if os.path.exists(args.db):
+                os.remove(args.db)
+            started = time.perf_counter()
+            meta['rows'] = generate(db.engine, args.users)
+            print(f"Seeded {meta['rows']} in {time.perf_counter() - started:.1f}s")
+        results = run_benchmarks(app, args.users, args.iterations, args.warmup)
+        results.update(run_revalidations(app, args.users, args.iterations, args.warmup))
+
+    _report(results)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'meta': meta, 'results': results}, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)['results']
+        regressions = compare(baseline, results, args.threshold, args.metric)
+        for name, regression in regressions.items():
+            print(f"REGRESSION {name}: {args.metric} {regression['baseline'] * 1000:.3f}ms -> "
+                  f"{regression['current'] * 1000:.3f}ms (+{regression['change']:.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Time the response encoders per 10k history rows, without a database.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+
+- jsonify: a dict per row, encoded by Flask's default (stdlib) JSON provider
+- orjson: a dict per row, encoded by FastJSONProvider on orjson (when installed)
+- compiled: the precompiled row encoder the routes use, straight from tuples
+"""
+from datetime import datetime, timedelta
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+DEFAULT_ROWS = 10000
+DEFAULT_REPEAT = 20
+FIELDS = ('id', 'name', 'price', 'duration_days', 'start_date', 'end_date', 'status')
+
+
+def sample_rows(count, seed=0):
+    """Tuples shaped like the /subscriptions/history/optimized SELECT."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    rows = []
+    for index in range(count):
+        start_date = start + timedelta(minutes=rng.randrange(2_000_000))
+        duration = rng.choice((30, 90, 365))
+        rows.append((index + 1, rng.choice(('Basic', 'Pro', 'Enterprise')), rng.choice((10, 20, 99)), duration,
+                     start_date, start_date + timedelta(days=duration), rng.choice(('ACTIVE', 'INACTIVE', 'CANCELLED'))))
+    return rows
+
+
+def encoders():
+    from flask import Flask
+    from src.utils.serialization import FastJSONProvider, compile_row_encoder, encode_rows, orjson
+
+    flask_app = Flask(__name__)
+    stdlib = flask_app.json
+    encode_row = compile_row_encoder(FIELDS, 'history_row')
+
+    candidates = {
+        'jsonify': lambda rows: stdlib.dumps([dict(zip(FIELDS, row)) for row in rows], separators=(',', ':')),
+        'compiled': lambda rows: encode_rows(rows, encode_row),
+    }
+    if orjson is not None:
+        flask_app.config['JSON_BACKEND'] = 'orjson'
+        fast = FastJSONProvider(flask_app)
+        candidates['orjson'] = lambda rows: fast.dumps([dict(zip(FIELDS, row)) for row in rows])
+    return candidates
+
+
+def run(rows=DEFAULT_ROWS, repeat=DEFAULT_REPEAT, seed=0):
+    """Best and median milliseconds per 10k rows for each encoder; all must produce the same JSON."""
+    data = sample_rows(rows, seed)
+    results = {}
+    reference = None
+    for name, encode in encoders().items():
+        decoded = json.loads(encode(data))
+        if reference is None:
+            reference = decoded
+        elif decoded != reference:
+            raise AssertionError(f'{name} output differs from jsonify')
+
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            encode(data)
+            samples.append((time.perf_counter() - started) * 1000 * 10000 / rows)
+        samples.sort()
+        results[name] = {'best_ms_per_10k': samples[0], 'median_ms_per_10k': samples[len(samples) // 2]}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    # Importing src builds the app; no query runs here, so any database URL will do.
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    results = run(args.rows, args.repeat)
+    baseline = results['jsonify']['median_ms_per_10k']
+    for name, result in results.items():
+        print(f"{name:>10}: median {result['median_ms_per_10k']:8.2f}ms  best {result['best_ms_per_10k']:8.2f}ms"
+              f"  per 10k rows  ({baseline / result['median_ms_per_10k']:.1f}x jsonify)")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Read latency while a burst of signups hashes passwords, per hashing executor.
+
+    python -m benchmarks.run --db /tmp/bench.db --users 10000 --seed-data --iterations 1
+    python -m benchmarks.signup_burst --db /tmp/bench.db --executor inline --executor process
+
+For each executor, reader threads poll a read endpoint through the in-process app:
+first alone (baseline), then while signup threads POST /register. Inline hashing
+runs scrypt on request threads and holds the GIL; the process pool does not.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from benchmarks import BENCHMARK_PASSWORD
+from benchmarks.load import auth_header
+from benchmarks.run import summarize
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+DEFAULT_READ_PATH = '/subscriptions/active/optimized'
+
+
+def _read_until(client, path, headers, stop):
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _sign_up(client, count, run_id):
+    statuses = []
+    for index in range(count):
+        name = f'burst-{run_id}-{index}'
+        response = client.post('/register', json={'username': name, 'password': 'burst-password', 'email': f'{name}@example.com'})
+        statuses.append(response.status_code)
+    return statuses
+
+
+def measure(app, executor, readers=8, signups=200, signup_workers=8, baseline_seconds=2.0, path=DEFAULT_READ_PATH):
+    """p50/p95/p99 of reads alone and during the signup burst, with one hashing executor."""
+    hasher = app.extensions.pop('password_hasher', None)
+    if hasher is not None:
+        hasher.shutdown()
+    app.config['PASSWORD_HASH_EXECUTOR'] = executor
+    client = app.test_client()
+    headers = [auth_header(reader + 1, BENCHMARK_PASSWORD) for reader in range(readers)]
+    for reader_headers in headers:
+        client.get(path, headers=reader_headers)  # credential cache and hasher warm-up
+
+    with ThreadPoolExecutor(readers + signup_workers) as pool:
+        stop = Event()
+        reads = [pool.submit(_read_until, app.test_client(), path, reader_headers, stop) for reader_headers in headers]
+        time.sleep(baseline_seconds)
+        stop.set()
+        baseline = [sample for future in reads for sample in future.result()]
+
+        stop = Event()
+        reads = [pool.submit(_read_until, app.test_client(), path, reader_headers, stop) for reader_headers in headers]
+        started = time.perf_counter()
+        run_id = uuid.uuid4().hex[:8]
+        per_worker = -(-signups // signup_workers)
+        burst = [pool.submit(_sign_up, app.test_client(), per_worker, f'{run_id}-{worker}') for worker in range(signup_workers)]
+        statuses = [status for future in burst for status in future.result()]
+        burst_seconds = time.perf_counter() - started
+        stop.set()
+        during = [sample for future in reads for sample in future.result()]
+
+    return {
+        'executor': executor,
+        'baseline': summarize(baseline),
+        'during_burst': summarize(during),
+        'signups': len(statuses),
+        'signups_per_second': len(statuses) / burst_seconds,
+        'signup_statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='benchmark.db', help='SQLite file seeded by benchmarks.run --seed-data.')
+    parser.add_argument('--executor', action='append', choices=('inline', 'thread', 'process'),
+                        help='Hashing executor to measure, repeatable (default: inline and process).')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--signups', type=int, default=200)
+    parser.add_argument('--signup-workers', type=int, default=8)
+    parser.add_argument('--path', default=DEFAULT_READ_PATH)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    from src import app
+
+    # Measure hashing contention, not the rate limiter rejecting the burst.
+    app.config['ADMISSION_CONTROL_ENABLED'] = False
+    results = []
+    for executor in args.executor or ['inline', 'process']:
+        result = measure(app, executor, args.readers, args.signups, args.signup_workers, path=args.path)
+        results.append(result)
+        print(f"{executor:>8}: reads p50/p99 {result['baseline']['p50'] * 1000:.2f}/{result['baseline']['p99'] * 1000:.2f}ms alone, "
+              f"{result['during_burst']['p50'] * 1000:.2f}/{result['during_burst']['p99'] * 1000:.2f}ms during burst; "
+              f"{result['signups_per_second']:.1f} signups/s {result['signup_statuses']}")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Cold-start import time and time-to-first-request, per way of starting a worker.
+
+    python -m benchmarks.run --db /tmp/bench.db --users 10000 --seed-data --iterations 1
+    python -m benchmarks.startup --db /tmp/bench.db --runs 5
+
+- cold: a fresh interpreter imports src, builds the app (src.wsgi: create_app and
+  warm_up) and serves its first request, as every non-preloaded worker does
+- preforked: src.wsgi is imported once in a master (gunicorn --preload); each worker
+  is forked from it and only pays for its first request
+Every phase is wall-clock time, so interpreter start-up counts towards "ready".
+"""
+from datetime import datetime
+from benchmarks import BENCHMARK_PASSWORD
+from benchmarks.load import auth_header
+from benchmarks.run import summarize
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+FIRST_REQUEST_PATH = '/subscriptions/active/optimized'
+
+
+def _first_requests(app, user_id):
+    """(first, second) request seconds: the first one connects, authenticates and warms caches."""
+    client = app.test_client()
+    headers = auth_header(user_id, BENCHMARK_PASSWORD)
+    timings = []
+    for _ in range(2):
+        started = time.perf_counter()
+        response = client.get(FIRST_REQUEST_PATH, headers=headers)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code in (200, 404), response.status_code
+    return timings
+
+
+def run_cold(spawned_at, user_id):
+    started = time.time()
+    import src  # noqa: F401
+    imported = time.time()
+    from src.wsgi import app
+    created = time.time()
+    first, second = _first_requests(app, user_id)
+    return {
+        'interpreter': started - spawned_at,
+        'import': imported - started,
+        'build': created - imported,
+        'first_request': first,
+        'second_request': second,
+        'ready': created - spawned_at,
+        'first_response': created + first - spawned_at,
+    }
+
+
+def run_preforked(workers, user_id):
+    from src.wsgi import app
+    results = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        forked_at = time.time()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            first, second = _first_requests(app, user_id)
+            os.write(write_end, json.dumps({
+                'ready': time.time() - forked_at - first - second,
+                'first_request': first,
+                'second_request': second,
+                'first_response': time.time() - forked_at - second,
+            }).encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as handle:
+            results.append(json.loads(handle.read()))
+        os.waitpid(pid, 0)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='bench.db', help='SQLite file seeded by benchmarks.run --seed-data.')
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts, and workers forked from one master.')
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--child', choices=('cold', 'preforked'), help=argparse.SUPPRESS)
+    parser.add_argument('--spawned-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    # Hash verification runs inline so the first request does not also start a process pool.
+    os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+    if args.child == 'cold':
+        print(json.dumps(run_cold(args.spawned_at, args.user_id)))
+        return 0
+    if args.child == 'preforked':
+        print(json.dumps(run_preforked(args.runs, args.user_id)))
+        return 0
+
+    def child(mode):
+        command = [sys.executable, '-m', 'benchmarks.startup', '--db', args.db, '--runs', str(args.runs),
+                   '--user-id', str(args.user_id), '--child', mode, '--spawned-at', repr(time.time())]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    cold = [child('cold') for _ in range(args.runs)]
+    preforked = child('preforked') if hasattr(os, 'fork') else []
+    results = {}
+    for mode, samples in (('cold', cold), ('preforked', preforked)):
+        if not samples:
+            continue
+        results[mode] = {phase: summarize([sample[phase] for sample in samples]) for phase in samples[0]}
+        phases = ', '.join(f"{phase} {stats['p50'] * 1000:.0f}ms" for phase, stats in results[mode].items())
+        print(f'{mode:>9} (p50 of {len(samples)}): {phases}')
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'db': args.db, 'runs': args.runs, 'results': results}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
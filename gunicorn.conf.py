@@ -0,0 +1,29 @@
+"""
+Production server: gunicorn -c gunicorn.conf.py
+
+- preload_app imports and builds the app once in the master; workers are forked
+  from it and start serving without re-importing anything. After the fork each
+  worker disposes the engines it inherited (src/utils/fork_safety.py), so no
+  worker ever uses a connection opened by the master or a sibling
+- WEB_CONCURRENCY workers (default 2 x cores + 1), each with GUNICORN_THREADS
+  threads; every worker has its own DB pool, so the database sees up to
+  WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+- Up to OUTBOX_FEED_MAX_WAITERS of a worker's threads may sit in /events long-polls;
+  it defaults to GUNICORN_THREADS - 1, so one thread is always left for other requests
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'src.wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then, jittered so they do not all restart at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
@@ -1,35 +1,237 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_httpauth import HTTPBasicAuth
-from werkzeug.security import check_password_hash
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from src.models import User
+from src.utils.credential_cache import get_credential_cache
+from src.utils.db_routing import RoutingSession, engine_options, replica_binds, track_writes
+from src.utils.expiry_sweeper import start_expiry_sweeper
+from src.utils.fork_safety import register_fork_safety
+from src.utils.identity import AuthenticatedUser
+from src.utils.instrumentation import init_instrumentation
+from src.utils.outbox import start_outbox_relay
+from src.utils.password_hashing import DEFAULT_WORKERS, HashingBusy, get_password_hasher, hashing_busy
+from src.utils.serialization import FastJSONProvider
+from src.utils.tokens import ACCESS_TOKEN, TokenError, decode_token, identity_from_claims
 from dotenv import load_dotenv
+from threading import Lock
 import os
 
 load_dotenv()
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Reads marked with read_replica go to DATABASE_REPLICA_URLS, everything else to the primary.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+# Routes accept either Basic credentials or a bearer access token.
+auth = MultiAuth(basic_auth, token_auth)
 
-db = SQLAlchemy(app)
-auth = HTTPBasicAuth()
+_default_app = None
+_default_app_lock = Lock()
+_background_lock = Lock()
 
 
-@auth.verify_password
+def load_config():
+    """Settings read from the environment (and .env), as a dict for app.config."""
+    config = {}
+    config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY')
+    config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('DATABASE_REPLICA_URLS'))
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    )
+    config['READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+    config['AUTH_CACHE_MAX_SIZE'] = int(os.environ.get('AUTH_CACHE_MAX_SIZE', 10000))
+    config['AUTH_CACHE_TTL_SECONDS'] = int(os.environ.get('AUTH_CACHE_TTL_SECONDS', 300))
+    config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY')
+    config['JWT_ACCESS_TOKEN_MINUTES'] = int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 30))
+    config['JWT_REFRESH_TOKEN_DAYS'] = int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 14))
+    config['JWT_REVOCATION_SYNC_SECONDS'] = int(os.environ.get('JWT_REVOCATION_SYNC_SECONDS', 5))
+    # How far back each sync re-reads, for revocations that committed late.
+    config['JWT_REVOCATION_SYNC_OVERLAP_SECONDS'] = int(os.environ.get('JWT_REVOCATION_SYNC_OVERLAP_SECONDS', 10))
+    config['PLAN_CATALOG_CHECK_SECONDS'] = int(os.environ.get('PLAN_CATALOG_CHECK_SECONDS', 5))
+    config['ACTIVE_SUBSCRIPTION_CACHE_MAX_SIZE'] = int(os.environ.get('ACTIVE_SUBSCRIPTION_CACHE_MAX_SIZE', 50000))
+    config['ACTIVE_SUBSCRIPTION_CACHE_TTL_SECONDS'] = int(os.environ.get('ACTIVE_SUBSCRIPTION_CACHE_TTL_SECONDS', 30))
+    config['ACTIVE_SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS'] = int(os.environ.get('ACTIVE_SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS', 10))
+    config['HISTORY_PAGE_SIZE'] = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+    config['HISTORY_MAX_PAGE_SIZE'] = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 500))
+    config['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+    config['BULK_MAX_OPERATIONS'] = int(os.environ.get('BULK_MAX_OPERATIONS', 50000))
+    config['EXPIRY_SWEEP_INTERVAL_SECONDS'] = int(os.environ.get('EXPIRY_SWEEP_INTERVAL_SECONDS', 0))
+    config['EXPIRY_SWEEP_BATCH_SIZE'] = int(os.environ.get('EXPIRY_SWEEP_BATCH_SIZE', 500))
+    config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+    config['ASYNC_DB_POOL_SIZE'] = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+    config['IDEMPOTENCY_KEY_TTL_SECONDS'] = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400))
+    config['IDEMPOTENCY_LEASE_SECONDS'] = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 60))
+    config['IDEMPOTENCY_CACHE_MAX_SIZE'] = int(os.environ.get('IDEMPOTENCY_CACHE_MAX_SIZE', 10000))
+    config['ADMISSION_CONTROL_ENABLED'] = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    config['RATE_LIMIT_PER_SECOND'] = float(os.environ.get('RATE_LIMIT_PER_SECOND', 20))
+    config['RATE_LIMIT_BURST'] = int(os.environ.get('RATE_LIMIT_BURST', 40))
+    # Per-endpoint overrides, e.g. "get_subscription_history=2/10,login=1/5" (rate per second/burst).
+    config['RATE_LIMIT_ROUTES'] = os.environ.get('RATE_LIMIT_ROUTES', '')
+    config['RATE_LIMIT_REDIS_URL'] = os.environ.get('RATE_LIMIT_REDIS_URL')
+    # Proxies in front of the app whose X-Forwarded-For is trusted for the client
+    # address (rate limits on unauthenticated routes). 0, the default, for clients that
+    # connect directly, as in docker-compose.yml: they could otherwise pick their own bucket.
+    config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+    # Defaults to the pool's capacity, so admitted handlers never queue for a connection.
+    config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get(
+        'ADMISSION_MAX_CONCURRENT', int(os.environ.get('DB_POOL_SIZE', 10)) + int(os.environ.get('DB_MAX_OVERFLOW', 20))))
+    config['ADMISSION_QUEUE_TIMEOUT'] = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0.05))
+    config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    config['PASSWORD_HASH_EXECUTOR'] = os.environ.get('PASSWORD_HASH_EXECUTOR', 'process')
+    config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS))
+    config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+    config['PASSWORD_HASH_QUEUE_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 0.5))
+    config['ROLLUP_SHARDS'] = int(os.environ.get('ROLLUP_SHARDS', 8))
+    config['ROLLUP_CATCHUP_BATCH_SIZE'] = int(os.environ.get('ROLLUP_CATCHUP_BATCH_SIZE', 1000))
+    config['ROLLUP_CATCHUP_OVERLAP_SECONDS'] = int(os.environ.get('ROLLUP_CATCHUP_OVERLAP_SECONDS', 300))
+    config['REPORT_MAX_DAYS'] = int(os.environ.get('REPORT_MAX_DAYS', 366))
+    config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', 5000))
+    config['EXPORT_GZIP_LEVEL'] = int(os.environ.get('EXPORT_GZIP_LEVEL', 6))
+    # History reads and the archival job must agree on this age; see src/utils/archival.py.
+    config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    # '' (feed only), 'ndjson:<path>' or 'queue'; see src/utils/outbox.py.
+    config['OUTBOX_SINK'] = os.environ.get('OUTBOX_SINK', '')
+    config['OUTBOX_RELAY_INTERVAL_SECONDS'] = float(os.environ.get('OUTBOX_RELAY_INTERVAL_SECONDS', 0))
+    config['OUTBOX_RELAY_BATCH_SIZE'] = int(os.environ.get('OUTBOX_RELAY_BATCH_SIZE', 500))
+    config['OUTBOX_RETENTION_DAYS'] = int(os.environ.get('OUTBOX_RETENTION_DAYS', 7))
+    config['OUTBOX_FEED_MAX_LIMIT'] = int(os.environ.get('OUTBOX_FEED_MAX_LIMIT', 1000))
+    config['OUTBOX_FEED_MAX_WAIT_SECONDS'] = float(os.environ.get('OUTBOX_FEED_MAX_WAIT_SECONDS', 20))
+    config['OUTBOX_FEED_POLL_SECONDS'] = float(os.environ.get('OUTBOX_FEED_POLL_SECONDS', 0.5))
+    # Long-polls each hold a request thread, so by default one gthread thread per worker
+    # is always left for everything else; keep it below GUNICORN_THREADS when setting it.
+    config['OUTBOX_FEED_MAX_WAITERS'] = int(os.environ.get(
+        'OUTBOX_FEED_MAX_WAITERS', max(0, int(os.environ.get('GUNICORN_THREADS', 4)) - 1)))
+    # Comma-separated shared secrets for /internal/entitlements; none disables it.
+    config['ENTITLEMENT_SERVICE_TOKENS'] = os.environ.get('ENTITLEMENT_SERVICE_TOKENS', '')
+    config['ENTITLEMENT_REFRESH_SECONDS'] = float(os.environ.get('ENTITLEMENT_REFRESH_SECONDS', 1))
+    config['ENTITLEMENT_REFRESH_BATCH_SIZE'] = int(os.environ.get('ENTITLEMENT_REFRESH_BATCH_SIZE', 5000))
+    config['ENTITLEMENT_REFRESH_OVERLAP_SECONDS'] = int(os.environ.get('ENTITLEMENT_REFRESH_OVERLAP_SECONDS', 10))
+    config['ENTITLEMENT_BATCH_MAX'] = int(os.environ.get('ENTITLEMENT_BATCH_MAX', 1000))
+    config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+    return config
+
+
+def create_app(config=None):
+    """
+    Build the app: load_config() updated with config, extensions, then the routes
+    and CLI commands. Nothing here opens a database connection or starts a pool or a
+    thread, so it is safe to call in a pre-forking server's master (gunicorn --preload):
+    - Each forked child disposes the engines and drops the worker pools it inherited
+      (src/utils/fork_safety.py), so workers never share a connection with the master
+    - The opt-in background threads start with the first request a process serves
+      (start_background_threads), so they run in the workers, never in the master
+    - The route modules are imported here rather than by `import src`
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    app.json = FastJSONProvider(app)
+    if app.config['TRUSTED_PROXY_HOPS']:
+        # Behind a proxy every request comes from the proxy's address; the client's
+        # is the one the trusted hops appended to X-Forwarded-For.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+
+    db.init_app(app)
+    init_instrumentation(app)
+    app.after_request(track_writes)
+    app.register_error_handler(HashingBusy, hashing_busy)
+
+    from src.commands import register_commands
+    from src.routes import api
+
+    app.register_blueprint(api)
+    register_commands(app)
+    register_fork_safety(app, db)
+
+    if app.config['EXPIRY_SWEEP_INTERVAL_SECONDS'] or app.config['OUTBOX_RELAY_INTERVAL_SECONDS']:
+        app.before_request(lambda: start_background_threads(app))
+    return app
+
+
+def start_background_threads(app):
+    """
+    Start the opt-in in-process jobs in this process, once: the expiry sweeper
+    (EXPIRY_SWEEP_INTERVAL_SECONDS) and the outbox relay (OUTBOX_RELAY_INTERVAL_SECONDS).
+    Under a pre-forking server every worker runs its own; both jobs tolerate that. For a
+    single instance, leave them off and run `flask sweep-expired` from cron and
+    `flask outbox relay --follow` as their own processes.
+    """
+    if 'background_threads' in app.extensions:
+        return
+    with _background_lock:
+        if 'background_threads' in app.extensions:
+            return
+        if app.config['EXPIRY_SWEEP_INTERVAL_SECONDS']:
+            start_expiry_sweeper(app, db)
+        if app.config['OUTBOX_RELAY_INTERVAL_SECONDS']:
+            start_outbox_relay(app, db)
+        app.extensions['background_threads'] = True
+
+
+def get_app():
+    """The app built from the environment alone, created on first use and shared."""
+    global _default_app
+    if _default_app is None:
+        with _default_app_lock:
+            if _default_app is None:
+                _default_app = create_app()
+    return _default_app
+
+
+def __getattr__(name):
+    # `from src import app` (scripts, benchmarks, `flask --app src`) gets the shared
+    # app, built on first access instead of as a side effect of importing src.
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+@basic_auth.verify_password
 def verify_password(username, password):
+    cache = get_credential_cache()
+    identity = cache.lookup(username, password)
+    if identity is not None:
+        return identity
+
     user = db.session.query(User).filter_by(username=username).first()
     if not user:
         return None
-    if check_password_hash(user.password, password):
-        return user
+    matches, new_hash = get_password_hasher().verify(user.password, password)
+    if matches:
+        if new_hash:
+            user.password = new_hash
+            db.session.commit()
+        identity = AuthenticatedUser(id=user.id, username=user.username)
+        cache.remember(username, password, identity)
+        return identity
     return None
 
 
-@auth.error_handler
+@token_auth.verify_token
+def verify_token(token):
+    try:
+        claims = decode_token(token, expected_type=ACCESS_TOKEN)
+    except TokenError:
+        return None
+    return identity_from_claims(claims)
+
+
 def auth_error():
     return {'message': 'Invalid credentials'}, 401
+
+
+basic_auth.error_handler(auth_error)
+token_auth.error_handler(auth_error)
@@ -0,0 +1,133 @@
+"""
+ASGI entry point with the read endpoints served on asyncio:
+
+    uvicorn src.asgi:application --host 0.0.0.0 --port 5000
+
+GET /plans, /subscriptions/active[/optimized] and /subscriptions/history[/optimized]
+run as coroutines on an async engine, so a request waiting on the database holds a
+pooled connection but no thread. Every other request (writes, auth, admin) goes to
+the regular Flask app through an ASGI-to-WSGI adapter and its thread pool.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from werkzeug.datastructures import Headers
+from werkzeug.test import EnvironBuilder
+
+import asyncio
+import base64
+import binascii
+import inspect
+
+from src import get_app, start_background_threads, verify_password, verify_token
+from src.routes.async_reads import ASYNC_ROUTES
+from src.utils.admission import MemoryRateLimitBackend, get_rate_limit_backend, rate_limit_retry_after, reject, route_name
+from src.utils.async_db import dispose_async_engines, get_async_sessionmaker
+from src.utils.credential_cache import get_credential_cache
+from src.utils.db_routing import wrote_recently
+from src.utils.password_hashing import HashingBusy, hashing_busy
+
+
+class AsyncReadApplication:
+
+    def __init__(self, flask_app, routes=ASYNC_ROUTES):
+        self.flask_app = flask_app
+        self.routes = routes
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        handler = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+        await self._serve(handler, scope, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Async reads skip Flask's before_request, so a read-only process starts them here.
+                start_background_threads(self.flask_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                with self.flask_app.app_context():
+                    await dispose_async_engines()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _serve(self, handler, scope, send):
+        headers = Headers([(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope['headers']])
+        environ = EnvironBuilder(
+            path=scope['path'],
+            method=scope['method'],
+            query_string=scope['query_string'].decode('latin-1'),
+            headers=headers,
+        ).get_environ()
+        # A request context gives the shared helpers (jsonify, request.args, caches,
+        # config) what they expect; it lives in this task's contextvars only.
+        with self.flask_app.request_context(environ):
+            try:
+                user = await _authenticate(headers.get('Authorization', ''))
+            except HashingBusy as exc:
+                return await _send_response(send, self.flask_app.make_response(hashing_busy(exc)), scope['method'])
+            if user is None:
+                response = self.flask_app.make_response(({'message': 'Invalid credentials'}, 401))
+                response.headers['WWW-Authenticate'] = 'Basic realm="Authentication Required"'
+                return await _send_response(send, response, scope['method'])
+
+            # Same per-user rate limits as the sync views. The worker concurrency cap does
+            # not apply: awaiting requests hold no thread, only an ASYNC_DB_POOL_SIZE connection.
+            if self.flask_app.config.get('ADMISSION_CONTROL_ENABLED', True):
+                endpoint = route_name(request.endpoint)
+                if isinstance(get_rate_limit_backend(), MemoryRateLimitBackend):
+                    retry_after = rate_limit_retry_after(endpoint, user)
+                else:
+                    retry_after = await asyncio.to_thread(rate_limit_retry_after, endpoint, user)
+                if retry_after:
+                    response = reject(429, 'Too many requests', retry_after, endpoint, 'throttled')
+                    return await _send_response(send, response, scope['method'])
+
+            # Same read-your-writes rule as the sync read_replica views.
+            async with get_async_sessionmaker(replica=not wrote_recently(user.id))() as session:
+                result = await handler(session, user)
+                if inspect.isasyncgen(result):
+                    response = self.flask_app.response_class(mimetype='application/json')
+                    return await _send_response(send, response, scope['method'], chunks=result)
+                await _send_response(send, self.flask_app.make_response(result), scope['method'])
+
+
+async def _authenticate(authorization):
+    """
+    Basic credentials already in the credential cache are checked inline. Anything
+    needing the database or a password hash runs the sync verifiers on a worker
+    thread, which inherits this request's context.
+    """
+    scheme, _, value = authorization.partition(' ')
+    if scheme.lower() == 'basic':
+        try:
+            username, _, password = base64.b64decode(value).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        identity = get_credential_cache().lookup(username, password)
+        return identity if identity is not None else await asyncio.to_thread(verify_password, username, password)
+    if scheme.lower() == 'bearer' and value:
+        return await asyncio.to_thread(verify_token, value)
+    return None
+
+
+async def _send_response(send, response, method, chunks=None):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in response.headers.items()],
+    })
+    if method == 'HEAD':
+        return await send({'type': 'http.response.body', 'body': b''})
+    if chunks is None:
+        return await send({'type': 'http.response.body', 'body': response.get_data()})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+application = AsyncReadApplication(get_app())
@@ -0,0 +1,213 @@
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from src import db
+from src.models import UserCurrentSubscription
+from src.utils.archival import archive_subscriptions
+from src.utils.current_subscription import refresh_current_subscriptions, verify_current_subscriptions
+from src.utils.expiry_sweeper import DEFAULT_BATCH_SIZE, sweep_expired_subscriptions
+from src.utils.export import FORMATS, gzip_chunks, iter_export, parse_export_filters
+from src.utils.idempotency import purge_expired_idempotency_keys
+from src.utils.outbox import make_sink, purge_published_events, relay_outbox
+from src.utils.query_optimizer import analyze_workload, capture_route_workload, create_index_if_not_exists
+from src.utils.rollups import catch_up_rollups, rebuild_rollups, verify_rollups
+
+import click
+import sys
+import time
+
+
+@click.command('sweep-expired')
+@with_appcontext
+@click.option('--batch-size', type=int, default=None, help='Rows flipped per transaction.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+def sweep_expired_command(batch_size, max_batches):
+    """Mark ACTIVE subscriptions past their end_date as INACTIVE."""
+    batch_size = batch_size or current_app.config.get('EXPIRY_SWEEP_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    result = sweep_expired_subscriptions(db.session, batch_size=batch_size, max_batches=max_batches)
+    click.echo(f"Expired {result['rows']} subscriptions in {result['batches']} batches "
+               f"(lag {result['lag_seconds']:.0f}s, {result['duration_seconds']:.2f}s)")
+
+
+@click.command('archive-subscriptions')
+@with_appcontext
+@click.option('--batch-size', type=int, default=None, help='Rows moved per transaction.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches; rerun to continue.')
+def archive_subscriptions_command(batch_size, max_batches):
+    """Move CANCELLED/INACTIVE subscriptions older than ARCHIVE_AFTER_DAYS to the archive table."""
+    # The age comes from config only: history reads rely on the same ARCHIVE_AFTER_DAYS.
+    result = archive_subscriptions(
+        db.session,
+        older_than_days=current_app.config['ARCHIVE_AFTER_DAYS'],
+        batch_size=batch_size or current_app.config['ARCHIVE_BATCH_SIZE'],
+        max_batches=max_batches,
+        shards=current_app.config['ROLLUP_SHARDS'],
+    )
+    click.echo(f"Archived {result['rows']} subscriptions that ended before {result['cutoff']:%Y-%m-%d %H:%M} "
+               f"in {result['batches']} batches ({result['duration_seconds']:.2f}s)")
+
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete Idempotency-Key responses past IDEMPOTENCY_KEY_TTL_SECONDS."""
+    click.echo(f'Purged {purge_expired_idempotency_keys(db.session)} idempotency keys')
+
+
+@click.command('export-subscriptions')
+@with_appcontext
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='ndjson')
+@click.option('--status', help='Comma-separated statuses, e.g. ACTIVE,CANCELLED.')
+@click.option('--date-field', default='start_date', help='Column --from/--to filter on.')
+@click.option('--from', 'since', help='Inclusive lower bound, ISO 8601.')
+@click.option('--to', 'until', help='Exclusive upper bound, ISO 8601.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', type=click.Path(dir_okay=False), help='File to write; stdout by default.')
+def export_subscriptions_command(fmt, status, date_field, since, until, compress, output):
+    """Stream user_subscriptions joined with users and plans as NDJSON or CSV."""
+    try:
+        filters = parse_export_filters(status, date_field, since, until)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+    chunks = iter_export(db.session, filters, fmt, current_app.config['EXPORT_CHUNK_SIZE'])
+    if compress:
+        chunks = gzip_chunks(chunks, current_app.config['EXPORT_GZIP_LEVEL'])
+    else:
+        chunks = (chunk.encode('utf-8') for chunk in chunks)
+    handle = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            handle.write(chunk)
+    finally:
+        if output:
+            handle.close()
+
+
+@click.group('current-subscriptions', cls=AppGroup)
+def current_subscriptions_group():
+    """Maintain the user_current_subscriptions projection."""
+
+
+@current_subscriptions_group.command('rebuild')
+def rebuild_current_subscriptions_command():
+    """Recompute every projection row from user_subscriptions."""
+    refresh_current_subscriptions(db.session)
+    db.session.commit()
+    click.echo(f'Rebuilt {db.session.query(UserCurrentSubscription).count()} current subscriptions')
+
+
+@current_subscriptions_group.command('verify')
+def verify_current_subscriptions_command():
+    """Report projection rows that disagree with user_subscriptions; exits 1 on drift."""
+    report = verify_current_subscriptions(db.session)
+    click.echo(f"missing={report['missing']} stale={report['stale']} sample_user_ids={report['sample_user_ids']}")
+    if report['missing'] or report['stale']:
+        raise SystemExit(1)
+
+
+@click.group('rollups', cls=AppGroup)
+def rollups_group():
+    """Maintain the subscriber and daily reporting rollups."""
+
+
+@rollups_group.command('catch-up')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+def catch_up_rollups_command(max_batches):
+    """Fold subscriptions changed since the watermark into the rollups."""
+    result = catch_up_rollups(
+        db.session,
+        shards=current_app.config['ROLLUP_SHARDS'],
+        batch_size=current_app.config['ROLLUP_CATCHUP_BATCH_SIZE'],
+        overlap_seconds=current_app.config['ROLLUP_CATCHUP_OVERLAP_SECONDS'],
+        max_batches=max_batches,
+    )
+    click.echo(f"Read {result['rows']} subscriptions in {result['batches']} batches, "
+               f"{result['changed']} changed (watermark {result['watermark']})")
+
+
+@rollups_group.command('rebuild')
+def rebuild_rollups_command():
+    """Recompute the rollups from user_subscriptions."""
+    result = rebuild_rollups(db.session, shards=current_app.config['ROLLUP_SHARDS'])
+    click.echo(f"Rebuilt rollups from {result['subscriptions']} subscriptions "
+               f"({result['plans']} plan counters, {result['days']} daily counters)")
+
+
+@rollups_group.command('verify')
+def verify_rollups_command():
+    """Report rollup counters that disagree with user_subscriptions; exits 1 on drift."""
+    report = verify_rollups(db.session)
+    click.echo(f"plans={report['plans']} days={report['days']} "
+               f"sample_plan_ids={report['sample_plan_ids']} sample_days={report['sample_days']}")
+    if report['plans'] or report['days']:
+        raise SystemExit(1)
+
+
+@click.group('outbox', cls=AppGroup)
+def outbox_group():
+    """Publish and prune the subscription event outbox."""
+
+
+@outbox_group.command('relay')
+@click.option('--sink', help="Overrides OUTBOX_SINK: 'none', 'ndjson:<path>' or 'queue'.")
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+@click.option('--follow', is_flag=True, help='Keep relaying every --interval seconds until interrupted.')
+@click.option('--interval', type=float, default=0.5, help='Seconds between relay runs with --follow.')
+def relay_outbox_command(sink, max_batches, follow, interval):
+    """Number unpublished events for the feed and hand them to the sink."""
+    try:
+        sink = make_sink(sink if sink is not None else current_app.config['OUTBOX_SINK'])
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+    while True:
+        result = relay_outbox(db.session, sink, batch_size=current_app.config['OUTBOX_RELAY_BATCH_SIZE'], max_batches=max_batches)
+        if result['rows'] or not follow:
+            click.echo(f"Published {result['rows']} events in {result['batches']} batches "
+                       f"(last sequence {result['last_sequence']}, {result['duration_seconds']:.2f}s)")
+        if not follow:
+            return
+        time.sleep(interval)
+
+
+@outbox_group.command('purge')
+def purge_outbox_command():
+    """Delete events published more than OUTBOX_RETENTION_DAYS ago."""
+    deleted = purge_published_events(db.session, older_than_days=current_app.config['OUTBOX_RETENTION_DAYS'])
+    click.echo(f'Purged {deleted} published events')
+
+
+@click.command('analyze-queries')
+@with_appcontext
+@click.option('--user-id', type=int, required=True, help='User whose read paths are exercised.')
+@click.option('--emit', is_flag=True, help='Create the suggested indexes.')
+def analyze_queries_command(user_id, emit):
+    """EXPLAIN the statements the read routes emit and suggest composite indexes."""
+    try:
+        reports = analyze_workload(capture_route_workload(current_app._get_current_object(), user_id))
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    for report in reports:
+        flags = [f"full scan of {table}" for table in report['full_scans']]
+        flags += [name for name in ('filesort', 'temporary') if report[name]]
+        click.echo(f"[{report['dialect']}] {report['statement']}")
+        click.echo(f"  findings: {', '.join(flags) or 'none'}")
+        for suggestion in report['suggestions']:
+            click.echo(f"  suggest: {suggestion['ddl']}")
+            if emit and create_index_if_not_exists(suggestion['columns'], suggestion['table']):
+                click.echo('  created')
+
+
+COMMANDS = (
+    sweep_expired_command,
+    archive_subscriptions_command,
+    purge_idempotency_keys_command,
+    export_subscriptions_command,
+    current_subscriptions_group,
+    rollups_group,
+    outbox_group,
+    analyze_queries_command,
+)
+
+
+def register_commands(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
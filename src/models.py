@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index
+from sqlalchemy import Boolean, Column, Computed, Date, Integer, String, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import enum
@@ -12,7 +12,8 @@ class User(Base):
 
     id = Column(Integer, primary_key=True)
     username = Column(String(80), unique=True, nullable=False)
-    password = Column(String(120), nullable=False)
+    # Room for werkzeug's scrypt hashes (162 characters with the default parameters).
+    password = Column(String(255), nullable=False)
     email = Column(String(120), unique=True, nullable=False)
     subscriptions = relationship("UserSubscription", back_populates="user")
 
@@ -53,6 +54,9 @@ class UserSubscription(Base):
     status = Column(Enum(SubscriptionStatus), default=SubscriptionStatus.ACTIVE)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # user_id while the row is ACTIVE, NULL otherwise. Generated by the database, so
+    # ORM writes, bulk executemany and the sweeper all keep it right without help.
+    active_user_id = Column(Integer, Computed("CASE WHEN status = 'ACTIVE' THEN user_id END"))
 
     user = relationship("User", back_populates="subscriptions")
     plan = relationship("SubscriptionPlan", back_populates="subscriptions")
@@ -65,5 +69,183 @@ class UserSubscription(Base):
 
     __table_args__ = (
         Index('idx_user_subscriptions_user_id_status', 'user_id', 'status'),
-        Index('idx_user_subscriptions_status_end_date', 'status', 'end_date')
+        Index('idx_user_subscriptions_status_end_date', 'status', 'end_date'),
+        # Serves the history endpoints' ORDER BY start_date DESC, id DESC (and their
+        # keyset cursors) straight from the index, without a sort.
+        Index('idx_user_subscriptions_user_id_start_date', 'user_id', 'start_date', 'id'),
+        # At most one ACTIVE subscription per user, enforced by the database: NULLs never
+        # collide, so only a second ACTIVE row for the same user fails the insert/update.
+        Index('uq_user_subscriptions_one_active', 'active_user_id', unique=True),
+        # Keyset scan for the rollup catch-up job, which follows rows by updated_at.
+        Index('idx_user_subscriptions_updated_at', 'updated_at', 'id'),
+    )
+
+
+class ArchivedSubscription(Base):
+    __tablename__ = 'user_subscriptions_archive'
+
+    # CANCELLED / INACTIVE rows moved out of user_subscriptions by `flask archive-subscriptions`,
+    # keeping their ids. Only the history index: archived rows are never looked up by status.
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    plan_id = Column(Integer, ForeignKey('subscription_plans.id'), nullable=False)
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    status = Column(Enum(SubscriptionStatus), nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    plan = relationship("SubscriptionPlan", viewonly=True)
+
+    __table_args__ = (
+        Index('idx_user_subscriptions_archive_user_id_start_date', 'user_id', 'start_date', 'id'),
+    )
+
+
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(64), unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Rows are only needed until the token would have expired anyway, so the
+    # expires_at index keeps pruning cheap. Workers follow new rows by revoked_at.
+    __table_args__ = (
+        Index('idx_revoked_tokens_expires_at', 'expires_at'),
+        Index('idx_revoked_tokens_revoked_at', 'revoked_at'),
+    )
+
+
+class PlanCatalogVersion(Base):
+    __tablename__ = 'plan_catalog_version'
+
+    # Single row (id=1) bumped in the same transaction as any plan write. Workers
+    # compare it with the version of their in-memory catalog to know when to reload.
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class UserCurrentSubscription(Base):
+    __tablename__ = 'user_current_subscriptions'
+
+    # Optimization: one row per user with an ACTIVE subscription, holding everything the
+    # "what plan is this user on" reads need. It is written in the same transaction as
+    # user_subscriptions, so hot reads are a single primary-key fetch with no join.
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    subscription_id = Column(Integer, ForeignKey('user_subscriptions.id'), nullable=False)
+    plan_id = Column(Integer, ForeignKey('subscription_plans.id'), nullable=False)
+    plan_name = Column(String(50), nullable=False)
+    price = Column(Integer, nullable=False)
+    duration_days = Column(Integer, nullable=False)
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserSubscriptionVersion(Base):
+    __tablename__ = 'user_subscription_versions'
+
+    # Bumped in the same transaction as every change to a user's subscriptions, and
+    # served as the strong ETag of their subscription reads: a conditional GET costs one
+    # primary-key fetch. expires_at is the end_date of the ACTIVE subscription as of that
+    # change; past it the payloads differ without a write, so the tag stops validating
+    # until the expiry sweeper bumps the version. has_archive is set once the archival
+    # job has moved any of the user's rows, so history reads skip the archive without it.
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    expires_at = Column(DateTime)
+    has_archive = Column(Boolean, nullable=False, default=False)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    # First response to a write sent with an Idempotency-Key, replayed for retries of the
+    # same request until expires_at. status_code is NULL while that first request runs;
+    # claim is a random token naming the request that holds the row.
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    claim = Column(String(32), nullable=False)
+    status_code = Column(Integer)
+    body = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+
+class PlanSubscriberRollup(Base):
+    __tablename__ = 'plan_subscriber_rollups'
+
+    # ACTIVE subscriptions per plan, split over a few shards (user_id % ROLLUP_SHARDS) so
+    # concurrent subscribes to the same plan do not all queue on one counter row.
+    plan_id = Column(Integer, ForeignKey('subscription_plans.id'), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    active_subscribers = Column(Integer, nullable=False, default=0)
+
+
+class DailySubscriptionRollup(Base):
+    __tablename__ = 'daily_subscription_rollups'
+
+    # Subscriptions started and ended per day and plan; ended rows are split by how they
+    # ended: cancelled (churn), upgraded away from the plan, or expired.
+    day = Column(Date, primary_key=True)
+    plan_id = Column(Integer, ForeignKey('subscription_plans.id'), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    started = Column(Integer, nullable=False, default=0)
+    cancelled = Column(Integer, nullable=False, default=0)
+    upgraded = Column(Integer, nullable=False, default=0)
+    expired = Column(Integer, nullable=False, default=0)
+
+
+class SubscriptionRollupState(Base):
+    __tablename__ = 'subscription_rollup_states'
+
+    # What each subscription currently contributes to the rollups. Writers apply the
+    # difference between this and the row's new state, so the request paths and the
+    # catch-up job can both see a change without counting it twice.
+    # No foreign key: archived subscriptions leave user_subscriptions but keep their state.
+    subscription_id = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(Integer, nullable=False)
+    plan_id = Column(Integer, nullable=False)
+    status = Column(Enum(SubscriptionStatus), nullable=False)
+    start_day = Column(Date, nullable=False)
+    end_day = Column(Date)
+    upgraded = Column(Boolean, nullable=False, default=False)
+
+
+class RollupWatermark(Base):
+    __tablename__ = 'rollup_watermark'
+
+    # Single row (id=1): the (updated_at, id) of the last user_subscriptions row the
+    # catch-up job has folded into the rollups.
+    id = Column(Integer, primary_key=True)
+    updated_at = Column(DateTime)
+    subscription_id = Column(Integer)
+
+
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+
+    # Subscription and plan changes, inserted in the same transaction as the change.
+    # sequence stays NULL until the relay publishes the row; only the relay assigns it,
+    # densely and in order, so a feed read by sequence never skips a row that committed
+    # late with a lower id. The unique index serves both the relay (sequence IS NULL,
+    # in id order) and the feed (sequence > cursor).
+    id = Column(Integer, primary_key=True)
+    sequence = Column(Integer)
+    event_type = Column(String(40), nullable=False)
+    user_id = Column(Integer)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    published_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('uq_outbox_events_sequence', 'sequence', unique=True),
     )
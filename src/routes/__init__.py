@@ -1,7 +1,14 @@
-from flask import jsonify
-
-from src.routes.authen import register, login
-from src import app, auth
+from flask import Blueprint, jsonify
+
+from src.routes.authen import register, login as authenticate_user, refresh, logout as revoke_tokens
+from src import auth, db, token_auth
+from src.utils.admission import admission_control
+from src.utils.conditional_get import conditional_get
+from src.utils.db_routing import read_replica
+from src.utils.entitlements import service_token_required
+from src.utils.idempotency import idempotent
+from src.utils.plan_catalog import get_plan_catalog
+from src.utils.subscription_versions import subscription_etag
 
 from .subscriptions import (
     subscribe_user,
@@ -10,38 +17,72 @@ from .subscriptions import (
     upgrade_subscription,
     cancel_subscription,
 )
-from .plans import create_plan, get_all_plans
+from .bulk_subscriptions import bulk_apply_subscriptions
+from .entitlements import get_entitlement, get_entitlements
+from .events import get_event_feed
+from .export import export_subscriptions as stream_subscription_export
+from .metrics import export_metrics
+from .plans import create_plan as add_plan, get_all_plans, get_all_plans_response
+from .reports import get_daily_report, get_subscriber_report
 from .optimized_subscriptions import get_active_subscriptions_optimized_user, get_subscription_history_optimized_user
 
+# Registered by create_app(); endpoints are 'api.<view>'.
+api = Blueprint('api', __name__)
+
+
+def plans_etag():
+    return get_plan_catalog().refresh(db.session).etag
+
 
-@app.route('/plans', methods=['GET'])
+def user_subscriptions_etag():
+    return subscription_etag(db.session, auth.current_user().id)
+
+
+@api.route('/plans', methods=['GET'])
 @auth.login_required
+@admission_control
+@read_replica
+@conditional_get(plans_etag)
 def list_plans():
-    plans = get_all_plans()
-    return jsonify(plans)
+    return get_all_plans_response()
 
 
-@app.route('/plans', methods=['POST'])
+@api.route('/plans', methods=['POST'])
 @auth.login_required
+@admission_control
 def create_plan():
-    plan = create_plan()
-    return plan
+    return add_plan()
 
 
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
+@admission_control
 def register_user():
-    user_info = register()
-    return jsonify(user_info)
+    return register()
 
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
+@admission_control
 def login():
-    token = login()
-    return jsonify(token)
+    return authenticate_user()
+
+
+@api.route('/token/refresh', methods=['POST'])
+@admission_control
+def refresh_token():
+    return refresh()
 
 
-@app.route('/subscribe/<int:plan_id>', methods=['POST'])
+@api.route('/logout', methods=['POST'])
+@token_auth.login_required
+@admission_control
+def logout():
+    return revoke_tokens()
+
+
+@api.route('/subscribe/<int:plan_id>', methods=['POST'])
 @auth.login_required
+@admission_control
+@idempotent
 def subscribe(plan_id):
     user = auth.current_user()
     if not plan_id:
@@ -49,43 +90,118 @@ def subscribe(plan_id):
     return subscribe_user(user, plan_id)
 
 
-@app.route('/subscriptions/active', methods=['GET'])
+@api.route('/subscriptions/active', methods=['GET'])
 @auth.login_required
+@admission_control
+@read_replica
+@conditional_get(user_subscriptions_etag)
 def get_active_subscriptions():
     user = auth.current_user()
     return get_active_subscriptions_user(user.id)
 
 
-@app.route('/subscriptions/history', methods=['GET'])
+@api.route('/subscriptions/history', methods=['GET'])
 @auth.login_required
+@admission_control
+@read_replica
+@conditional_get(user_subscriptions_etag)
 def get_subscription_history():
     user = auth.current_user()
-    return get_subscription_history(user.id)
+    return get_subscription_history_user(user.id)
 
 
-@app.route('/subscriptions/upgrade/<int:plan_id>', methods=['POST'])
+@api.route('/subscriptions/upgrade/<int:plan_id>', methods=['POST'])
 @auth.login_required
-def upgrade(new_plan_id):
+@admission_control
+@idempotent
+def upgrade(plan_id):
     user = auth.current_user()
-    return upgrade_subscription(user, new_plan_id)
+    return upgrade_subscription(user, plan_id)
 
 
-@app.route('/subscriptions/cancel', methods=['POST'])
+@api.route('/subscriptions/cancel', methods=['POST'])
 @auth.login_required
+@admission_control
+@idempotent
 def cancel():
     user = auth.current_user()
     return cancel_subscription(user)
 
 
-@app.route('/subscriptions/history/optimized', methods=['GET'])
+@api.route('/subscriptions/history/optimized', methods=['GET'])
 @auth.login_required
+@admission_control
+@read_replica
+@conditional_get(user_subscriptions_etag)
 def get_subscription_history_optimized():
     user = auth.current_user()
     return get_subscription_history_optimized_user(user.id)
 
 
-@app.route('/subscriptions/active/optimized', methods=['GET'])
+@api.route('/subscriptions/active/optimized', methods=['GET'])
 @auth.login_required
+@admission_control
+@read_replica
+@conditional_get(user_subscriptions_etag)
 def get_active_subscriptions_optimized():
     user = auth.current_user()
     return get_active_subscriptions_optimized_user(user.id)
+
+
+@api.route('/admin/subscriptions/bulk', methods=['POST'])
+@auth.login_required
+@admission_control
+def bulk_subscriptions():
+    return bulk_apply_subscriptions()
+
+
+@api.route('/admin/subscriptions/export', methods=['GET'])
+@auth.login_required
+@admission_control
+@read_replica
+def export_subscriptions():
+    return stream_subscription_export()
+
+
+@api.route('/admin/reports/subscribers', methods=['GET'])
+@auth.login_required
+@admission_control
+@read_replica
+def subscriber_report():
+    return get_subscriber_report()
+
+
+@api.route('/admin/reports/daily', methods=['GET'])
+@auth.login_required
+@admission_control
+@read_replica
+def daily_report():
+    return get_daily_report()
+
+
+# No admission_control: a long-poll would hold a concurrency slot while it waits. The
+# wait holds no connection, and FeedNotifier caps how many requests wait at once.
+@api.route('/events', methods=['GET'])
+@auth.login_required
+@read_replica
+def event_feed():
+    return get_event_feed()
+
+
+# Service-to-service: a shared token instead of user credentials, and no admission_control,
+# whose limits are per user. Answered from the in-memory entitlement index, no database.
+@api.route('/internal/entitlements/<int:user_id>', methods=['GET'])
+@service_token_required
+def entitlement(user_id):
+    return get_entitlement(user_id)
+
+
+@api.route('/internal/entitlements', methods=['GET'])
+@service_token_required
+def entitlements():
+    return get_entitlements()
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return export_metrics()
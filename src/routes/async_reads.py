@@ -0,0 +1,134 @@
+from flask import current_app, jsonify
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from src.models import ArchivedSubscription, UserCurrentSubscription, UserSubscription
+from src.utils.active_subscription_cache import get_active_subscription_cache
+from src.utils.archival import archive_horizon, merge_history, page_needs_archive, stream_history_async
+from src.utils.conditional_get import conditional_get_async
+from src.utils.pagination import STREAM_BATCH_SIZE, keyset_before, paginated_response, parse_page_args, stream_json_array_async
+from src.utils.plan_catalog import get_plan_catalog
+from datetime import datetime
+
+from src.utils.serialization import json_response
+from src.utils.subscription_versions import has_archive_async, subscription_etag_async
+from .optimized_subscriptions import (
+    ARCHIVE_TABLE,
+    _cache_subscriptions,
+    _history_sql,
+    active_subscription_sql,
+    encode_history_row,
+    history_row_key,
+)
+from .subscriptions import _cache_active_subscription, _encode_history_item, _history_key
+
+# Asyncio twins of the read views, run by src/asgi.py on an AsyncSession. They share
+# SQL, caches and response shapes with the sync views; streamed responses are
+# returned as async iterators of bytes.
+
+
+async def get_all_plans_response_async(session, user):
+    catalog = await get_plan_catalog().refresh_async(session)
+    return current_app.response_class(catalog.body, mimetype='application/json')
+
+
+async def get_active_subscriptions_user_async(session, user):
+    cache = get_active_subscription_cache()
+    cached = cache.get(user.id, 'orm')
+    if cached is None:
+        cached = _cache_active_subscription(cache, user.id, await session.get(UserCurrentSubscription, user.id))
+
+    body, status_code = cached
+    return json_response(body), status_code
+
+
+async def get_active_subscriptions_optimized_user_async(session, user):
+    cache = get_active_subscription_cache()
+    body = cache.get(user.id, 'optimized')
+    if body is None:
+        result = await session.execute(active_subscription_sql, {"user_id": user.id, "now": datetime.utcnow()})
+        body = _cache_subscriptions(cache, user.id, result.fetchall())
+    return json_response(body)
+
+
+async def get_subscription_history_user_async(session, user):
+    try:
+        page = parse_page_args()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    horizon = archive_horizon()
+    has_archived = await has_archive_async(session, user.id)
+    query = _history_select(UserSubscription, user.id, page)
+    archived = _history_select(ArchivedSubscription, user.id, page)
+    if page.stream:
+        rows = await session.stream_scalars(query.filter(UserSubscription.start_date >= horizon).execution_options(yield_per=STREAM_BATCH_SIZE))
+        return stream_json_array_async(stream_history_async(
+            rows,
+            lambda: _all_scalars(session, query.filter(UserSubscription.start_date < horizon)),
+            (lambda: _all_scalars(session, archived)) if has_archived else None,
+            _history_key,
+        ), _encode_history_item)
+
+    history = await _all_scalars(session, query.limit(page.limit + 1))
+    if page_needs_archive(history, page, _history_key, horizon, has_archived):
+        history = merge_history(history, await _all_scalars(session, archived.limit(page.limit + 1)), _history_key, page.limit + 1)
+    return paginated_response(history, page, _encode_history_item, _history_key)
+
+
+def _history_select(model, user_id, page):
+    # Lazy loads cannot run under asyncio, so the plan comes with a join.
+    query = select(model).options(joinedload(model.plan)).filter_by(user_id=user_id)
+    if page.cursor:
+        query = query.filter(keyset_before(model.start_date, model.id, page.cursor))
+    return query.order_by(model.start_date.desc(), model.id.desc())
+
+
+async def _all_scalars(session, query):
+    return (await session.scalars(query)).all()
+
+
+async def _all_rows(session, sql, params):
+    return (await session.execute(sql, params)).fetchall()
+
+
+async def get_subscription_history_optimized_user_async(session, user):
+    try:
+        page = parse_page_args()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    horizon = archive_horizon()
+    has_archived = await has_archive_async(session, user.id)
+    if page.stream:
+        rows = await session.stream(*_history_sql(user.id, page, started_since=horizon), execution_options={"yield_per": STREAM_BATCH_SIZE})
+        return stream_json_array_async(stream_history_async(
+            rows,
+            lambda: _all_rows(session, *_history_sql(user.id, page, started_before=horizon)),
+            (lambda: _all_rows(session, *_history_sql(user.id, page, table=ARCHIVE_TABLE))) if has_archived else None,
+            history_row_key,
+        ), encode_history_row)
+
+    result = await _all_rows(session, *_history_sql(user.id, page))
+    if page_needs_archive(result, page, history_row_key, horizon, has_archived):
+        archived = await _all_rows(session, *_history_sql(user.id, page, table=ARCHIVE_TABLE))
+        result = merge_history(result, archived, history_row_key, page.limit + 1)
+    return paginated_response(result, page, encode_history_row, history_row_key)
+
+
+async def plans_etag_async(session, user):
+    return (await get_plan_catalog().refresh_async(session)).etag
+
+
+async def user_subscriptions_etag_async(session, user):
+    return await subscription_etag_async(session, user.id)
+
+
+subscriptions_conditional = conditional_get_async(user_subscriptions_etag_async)
+
+ASYNC_ROUTES = {
+    '/plans': conditional_get_async(plans_etag_async)(get_all_plans_response_async),
+    '/subscriptions/active': subscriptions_conditional(get_active_subscriptions_user_async),
+    '/subscriptions/active/optimized': subscriptions_conditional(get_active_subscriptions_optimized_user_async),
+    '/subscriptions/history': subscriptions_conditional(get_subscription_history_user_async),
+    '/subscriptions/history/optimized': subscriptions_conditional(get_subscription_history_optimized_user_async),
+}
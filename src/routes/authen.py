@@ -1,24 +1,25 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from src.models import User
-from src import db
-from datetime import datetime, timedelta
-
-import jwt
-import os
+from src import db, token_auth
+from src.utils.password_hashing import get_password_hasher
+from src.utils.tokens import (
+    ACCESS_TOKEN,
+    REFRESH_TOKEN,
+    TokenError,
+    decode_token,
+    issue_token,
+    revoke_token,
+)
 
 auth_bp = Blueprint('auth', __name__)
 
-SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
-TOKEN_EXPIRATION_MINUTES = 30
-
 
 def generate_token(user):
-    payload = {
-        'user_id': user.id,
-        'exp': datetime.utcnow() + timedelta(minutes=TOKEN_EXPIRATION_MINUTES)
-    }
-    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+    return issue_token(user, ACCESS_TOKEN)
+
+
+def generate_refresh_token(user):
+    return issue_token(user, REFRESH_TOKEN)
 
 
 def register():
@@ -30,12 +31,12 @@ def register():
     if not username or not password or not email:
         return jsonify({'message': 'Username, password, and email are required'}), 400
 
-    if User.query.filter_by(username=username).first():
+    if db.session.query(User).filter_by(username=username).first():
         return jsonify({'message': 'Username already exists'}), 400
-    if User.query.filter_by(email=email).first():
+    if db.session.query(User).filter_by(email=email).first():
         return jsonify({'message': 'Email already exists'}), 400
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = get_password_hasher().hash(password)
     new_user = User(username=username, password=hashed_password, email=email)
     db.session.add(new_user)
     db.session.commit()
@@ -51,9 +52,52 @@ def login():
     if not username or not password:
         return jsonify({'message': 'Username and password are required'}), 400
 
-    user = User.query.filter_by(username=username).first()
-    if user and check_password_hash(user.password, password):
-        token = generate_token(user)
-        return jsonify({'token': token}), 200
+    user = db.session.query(User).filter_by(username=username).first()
+    matches, new_hash = get_password_hasher().verify(user.password, password) if user else (False, None)
+    if matches:
+        if new_hash:
+            # Stored with older hash parameters: upgrade it while the password is at hand.
+            user.password = new_hash
+            db.session.commit()
+        return jsonify({'token': generate_token(user), 'refresh_token': generate_refresh_token(user)}), 200
 
     return jsonify({'message': 'Invalid credentials'}), 401
+
+
+def refresh():
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return jsonify({'message': 'refresh_token is required'}), 400
+
+    try:
+        claims = decode_token(refresh_token, expected_type=REFRESH_TOKEN)
+    except TokenError:
+        return jsonify({'message': 'Invalid refresh token'}), 401
+
+    # Refreshing is rare, so this is the one place a bearer session is checked
+    # against the users table; a deleted user cannot keep extending access.
+    user = db.session.get(User, claims['user_id'])
+    if not user:
+        return jsonify({'message': 'Invalid refresh token'}), 401
+
+    # Refresh tokens are single use: rotating them limits the damage of a leak. Losing
+    # the revocation race means the token was already spent, here or on another worker.
+    if not revoke_token(claims):
+        return jsonify({'message': 'Invalid refresh token'}), 401
+    return jsonify({'token': generate_token(user), 'refresh_token': generate_refresh_token(user)}), 200
+
+
+def logout():
+    data = request.get_json(silent=True) or {}
+    token = token_auth.get_auth().token
+    for value, token_type in ((token, ACCESS_TOKEN), (data.get('refresh_token'), REFRESH_TOKEN)):
+        if not value:
+            continue
+        try:
+            # Already revoked elsewhere is as good as revoked here.
+            revoke_token(decode_token(value, expected_type=token_type))
+        except TokenError:
+            pass
+
+    return jsonify({'message': 'Tokens revoked'}), 200
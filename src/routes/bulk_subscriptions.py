@@ -0,0 +1,227 @@
+from flask import current_app, jsonify, request
+from sqlalchemy import bindparam, insert, select, update
+from src import auth, db
+from src.models import SubscriptionStatus, User, UserSubscription
+from src.utils.active_subscription_cache import get_active_subscription_cache
+from src.utils.current_subscription import refresh_current_subscriptions
+from src.utils.db_routing import note_write
+from src.utils.outbox import (
+    SUBSCRIPTION_CANCELLED,
+    SUBSCRIPTION_CREATED,
+    SUBSCRIPTION_UPGRADED,
+    record_events,
+    subscription_payload,
+)
+from src.utils.plan_catalog import get_plan_catalog
+from src.utils.subscription_versions import bump_subscription_versions
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import time
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_OPERATIONS = 50000
+OPERATIONS = ('subscribe', 'upgrade', 'cancel')
+
+subscriptions_table = UserSubscription.__table__
+
+cancel_statement = (
+    update(subscriptions_table)
+    .where(subscriptions_table.c.id == bindparam('b_id'))
+    .values(status=SubscriptionStatus.CANCELLED, end_date=bindparam('b_end_date'), updated_at=bindparam('b_end_date'))
+)
+
+
+def bulk_apply_subscriptions():
+    """
+    Apply a batch of subscribe/upgrade/cancel operations for many users:
+    - Plan ids are validated against the preloaded plan catalog
+    - Users and their active subscriptions are fetched once per chunk with IN queries
+    - Changes are written with executemany, one short transaction per chunk, together
+      with one outbox event per applied operation
+    """
+    if auth.current_user().username != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    max_operations = current_app.config.get('BULK_MAX_OPERATIONS', DEFAULT_MAX_OPERATIONS)
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > max_operations:
+        return jsonify({'message': f'At most {max_operations} operations per request'}), 413
+
+    chunk_size = current_app.config.get('BULK_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    plans = get_plan_catalog().refresh(db.session).plans
+    started = time.perf_counter()
+    results = []
+    for offset in range(0, len(operations), chunk_size):
+        results.extend(_apply_chunk(operations[offset:offset + chunk_size], offset, plans))
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for result in results if result['status'] == 'ok')
+    return jsonify({
+        'results': results,
+        'processed': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed_seconds': round(elapsed, 6),
+        'operations_per_second': round(len(results) / elapsed, 2) if elapsed else None,
+    }), 200
+
+
+def _validate(operation, plans):
+    if not isinstance(operation, dict):
+        return 'Operation must be an object'
+    if operation.get('op') not in OPERATIONS:
+        return f"op must be one of {', '.join(OPERATIONS)}"
+    # type() rather than isinstance(): booleans are ints, and lists or dicts would
+    # make the plan lookup below raise instead of failing just this item.
+    if type(operation.get('user_id')) is not int:
+        return 'user_id must be an integer'
+    if operation['op'] != 'cancel':
+        if type(operation.get('plan_id')) is not int:
+            return 'plan_id must be an integer'
+        if operation['plan_id'] not in plans:
+            return 'Subscription plan not found'
+    return None
+
+
+def _apply_chunk(chunk, offset, plans):
+    now = datetime.utcnow()
+    results = [None] * len(chunk)
+    user_ids = set()
+    for index, operation in enumerate(chunk):
+        error = _validate(operation, plans)
+        if error:
+            results[index] = {'index': offset + index, 'status': 'error', 'message': error}
+        else:
+            user_ids.add(operation['user_id'])
+
+    known_users = set(db.session.execute(select(User.id).where(User.id.in_(user_ids))).scalars()) if user_ids else set()
+    existing = {row.id: row for row in db.session.execute(
+        select(UserSubscription.id, UserSubscription.user_id, UserSubscription.plan_id, UserSubscription.start_date)
+        .where(UserSubscription.user_id.in_(known_users), UserSubscription.status == SubscriptionStatus.ACTIVE)
+        .order_by(UserSubscription.id)
+    )} if known_users else {}
+    # Current ACTIVE subscription per user: an existing row id, or the dict of a row
+    # queued for insert earlier in this chunk.
+    active = {row.user_id: row.id for row in existing.values()}
+
+    inserts = []
+    cancels = []
+    # One per applied operation, in request order: (user_id, event type, payload, the
+    # subscription it is about, the previous one). Payloads are taken when the operation
+    # applies; ids of rows queued for insert are filled in once they exist.
+    events = []
+    for index, operation in enumerate(chunk):
+        if results[index] is not None:
+            continue
+        user_id = operation['user_id']
+        current = active.get(user_id)
+        op = operation['op']
+        error = None
+        if user_id not in known_users:
+            error = 'User not found'
+        elif op == 'subscribe' and current is not None:
+            error = 'User already has an active subscription'
+        elif op in ('upgrade', 'cancel') and current is None:
+            error = f'No active subscription to {op}'
+        if error:
+            results[index] = {'index': offset + index, 'status': 'error', 'message': error}
+            continue
+
+        ended = None
+        if current is not None:
+            if isinstance(current, dict):
+                current.update(status=SubscriptionStatus.CANCELLED, end_date=now)
+                ended = current
+            else:
+                cancels.append({'b_id': current, 'b_end_date': now})
+                ended = dict(existing[current]._mapping, status=SubscriptionStatus.CANCELLED, end_date=now)
+            active[user_id] = None
+        row = None
+        if op != 'cancel':
+            plan = plans[operation['plan_id']]
+            row = {
+                'user_id': user_id,
+                'plan_id': plan.id,
+                'start_date': now,
+                'end_date': now + timedelta(days=plan.duration_days),
+                'status': SubscriptionStatus.ACTIVE,
+                'created_at': now,
+                'updated_at': now,
+            }
+            inserts.append(row)
+            active[user_id] = row
+        if op == 'cancel':
+            events.append((user_id, SUBSCRIPTION_CANCELLED, _payload(ended), ended, None))
+        elif op == 'upgrade':
+            events.append((user_id, SUBSCRIPTION_UPGRADED, _payload(row, ended), row, ended))
+        else:
+            events.append((user_id, SUBSCRIPTION_CREATED, _payload(row), row, None))
+        results[index] = {'index': offset + index, 'status': 'ok', 'op': op, 'user_id': user_id}
+
+    changed_users = {result['user_id'] for result in results if result['status'] == 'ok'}
+    try:
+        if cancels:
+            db.session.execute(cancel_statement, cancels)
+        if inserts:
+            db.session.execute(insert(subscriptions_table), inserts)
+            _assign_inserted_ids(inserts, now)
+        record_events(db.session, [_with_ids(*event) for event in events], now)
+        refresh_current_subscriptions(db.session, changed_users)
+        # Every changed user ends with either a row inserted above or no ACTIVE row.
+        bump_subscription_versions(db.session, {
+            user_id: active[user_id]['end_date'] if isinstance(active[user_id], dict) else None
+            for user_id in changed_users
+        })
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception('Bulk subscription chunk at offset %s failed', offset)
+        return [
+            result if result['status'] == 'error' else
+            {'index': result['index'], 'status': 'error', 'message': f'Chunk failed: {exc.__class__.__name__}'}
+            for result in results
+        ]
+
+    cache = get_active_subscription_cache()
+    for user_id in changed_users:
+        cache.invalidate(user_id)
+        note_write(user_id)
+    return results
+
+
+def _assign_inserted_ids(inserts, now):
+    """
+    Set the id of each row just inserted by executemany, which returns none. They are
+    their user's newest rows: ids increase in insert order, and this transaction's view
+    holds no later row for the same users. created_at is compared to the whole second,
+    since MySQL DATETIME stores no fraction, so only today's rows of each user are read.
+    """
+    rows_by_user = {}
+    for row in inserts:
+        rows_by_user.setdefault(row['user_id'], []).append(row)
+    ids_by_user = {}
+    for user_id, subscription_id in db.session.execute(
+        select(subscriptions_table.c.user_id, subscriptions_table.c.id)
+        .where(subscriptions_table.c.user_id.in_(rows_by_user), subscriptions_table.c.created_at >= now.replace(microsecond=0))
+        .order_by(subscriptions_table.c.id)
+    ):
+        ids_by_user.setdefault(user_id, []).append(subscription_id)
+    for user_id, rows in rows_by_user.items():
+        for row, subscription_id in zip(rows, ids_by_user[user_id][-len(rows):]):
+            row['id'] = subscription_id
+
+
+def _payload(row, previous=None):
+    return subscription_payload(SimpleNamespace(**{'id': None, **row}),
+                                SimpleNamespace(**{'id': None, **previous}) if previous is not None else None)
+
+
+def _with_ids(user_id, event_type, payload, subscription, previous):
+    payload['subscription_id'] = subscription['id']
+    if previous is not None:
+        payload['previous_subscription_id'] = previous['id']
+    return event_type, payload, user_id
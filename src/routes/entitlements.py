@@ -0,0 +1,52 @@
+from flask import current_app, jsonify, request
+from src.utils.entitlements import EPOCH, get_entitlement_index
+from datetime import timedelta
+
+import time
+
+DEFAULT_BATCH_MAX = 1000
+
+
+def _entitlement(index, user_id, now):
+    found = index.lookup(user_id, now)
+    if found is None:
+        return {'user_id': user_id, 'active': False, 'plan_id': None, 'end_date': None}
+    plan_id, end = found
+    return {
+        'user_id': user_id,
+        'active': True,
+        'plan_id': plan_id,
+        'end_date': (EPOCH + timedelta(seconds=end)).isoformat() if end is not None else None,
+    }
+
+
+def _with_age(response, index):
+    # How far behind the database the answer may be: seconds since the last refresh.
+    response.headers['X-Entitlements-Age-Seconds'] = f'{time.time() - index.refreshed_at:.3f}'
+    return response
+
+
+def get_entitlement(user_id):
+    """Whether user_id has an ACTIVE subscription, and on which plan, from the in-memory index."""
+    index = get_entitlement_index()
+    return _with_age(jsonify(_entitlement(index, user_id, time.time())), index)
+
+
+def get_entitlements():
+    """
+    Entitlements of up to ENTITLEMENT_BATCH_MAX users in one call, from the in-memory index:
+    - user_ids: comma-separated user ids
+    """
+    max_ids = current_app.config.get('ENTITLEMENT_BATCH_MAX', DEFAULT_BATCH_MAX)
+    try:
+        user_ids = [int(value) for value in request.args.get('user_ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'message': 'user_ids must be comma-separated integers'}), 400
+    if not user_ids:
+        return jsonify({'message': 'user_ids is required'}), 400
+    if len(user_ids) > max_ids:
+        return jsonify({'message': f'At most {max_ids} user_ids per request'}), 400
+
+    index = get_entitlement_index()
+    now = time.time()
+    return _with_age(jsonify({'entitlements': [_entitlement(index, user_id, now) for user_id in user_ids]}), index)
@@ -0,0 +1,47 @@
+from flask import current_app, jsonify, request
+from src import auth, db
+from src.utils.outbox import (
+    DEFAULT_FEED_LIMIT,
+    DEFAULT_FEED_MAX_LIMIT,
+    DEFAULT_FEED_MAX_WAIT_SECONDS,
+    encode_event,
+    get_feed_notifier,
+    latest_sequence,
+    read_feed,
+)
+from src.utils.serialization import json_response
+
+
+def get_event_feed():
+    """
+    Published subscription and plan events after a sequence cursor, oldest first:
+    - after: last sequence the consumer has processed (0 to start from the oldest kept)
+    - wait: seconds to long-poll when nothing is newer, up to OUTBOX_FEED_MAX_WAIT_SECONDS
+    X-Next-Cursor is the sequence to pass as after next time.
+    """
+    if auth.current_user().username != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+
+    max_limit = current_app.config.get('OUTBOX_FEED_MAX_LIMIT', DEFAULT_FEED_MAX_LIMIT)
+    max_wait = current_app.config.get('OUTBOX_FEED_MAX_WAIT_SECONDS', DEFAULT_FEED_MAX_WAIT_SECONDS)
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_FEED_LIMIT, type=int)
+    wait = request.args.get('wait', 0, type=float)
+    if after is None or after < 0:
+        return jsonify({'message': 'after must be a sequence number'}), 400
+    if limit is None or not 1 <= limit <= max_limit:
+        return jsonify({'message': f'limit must be between 1 and {max_limit}'}), 400
+    if wait is None or not 0 <= wait <= max_wait:
+        return jsonify({'message': f'wait must be between 0 and {max_wait}'}), 400
+
+    rows = read_feed(db.session, after, limit)
+    if not rows and wait:
+        # End the read transaction first: the wait holds no connection, and the
+        # re-read must not come from the old snapshot.
+        db.session.rollback()
+        if get_feed_notifier().wait(after, wait, lambda: latest_sequence(db.session)):
+            rows = read_feed(db.session, after, limit)
+
+    response = json_response('[' + ','.join(encode_event(*row) for row in rows) + ']')
+    response.headers['X-Next-Cursor'] = str(rows[-1].sequence if rows else after)
+    return response
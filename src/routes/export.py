@@ -0,0 +1,32 @@
+from flask import current_app, jsonify, request, stream_with_context
+from src import auth, db
+from src.utils.export import DEFAULT_CHUNK_SIZE, DEFAULT_GZIP_LEVEL, FORMATS, gzip_chunks, iter_export, parse_export_filters
+from datetime import datetime
+
+
+def export_subscriptions():
+    """
+    Stream every subscription matching the filters as NDJSON (default) or CSV:
+    - ?format=ndjson|csv&status=ACTIVE,CANCELLED&date_field=start_date&from=...&to=...
+    - Rows are fetched and encoded in chunks of EXPORT_CHUNK_SIZE; nothing is buffered
+    - Compressed on the fly when the client sends Accept-Encoding: gzip
+    """
+    if auth.current_user().username != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(FORMATS)}"}), 400
+    try:
+        filters = parse_export_filters(
+            request.args.get('status'), request.args.get('date_field'), request.args.get('from'), request.args.get('to'))
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    chunks = iter_export(db.session, filters, fmt, current_app.config.get('EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    headers = {'Content-Disposition': f'attachment; filename="subscriptions-{datetime.utcnow():%Y%m%d%H%M%S}.{fmt}"'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks, current_app.config.get('EXPORT_GZIP_LEVEL', DEFAULT_GZIP_LEVEL))
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return current_app.response_class(stream_with_context(chunks), mimetype=FORMATS[fmt], headers=headers)
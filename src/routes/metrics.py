@@ -0,0 +1,42 @@
+from flask import current_app
+from src.utils.admission import admission_metrics, get_concurrency_limiter
+from src.utils.db_routing import pool_metrics
+from src.utils.expiry_sweeper import metrics as sweep_metrics
+from src.utils.instrumentation import get_metrics_registry, render_gauges
+
+import time
+
+
+def export_metrics():
+    """Prometheus text exposition of request/SQL histograms, cache counters, pool, admission, sweeper and entitlement index stats."""
+    lines = get_metrics_registry().render()
+
+    caches = {
+        name: current_app.extensions[name].stats()
+        for name in ('credential_cache', 'active_subscription_cache')
+        if name in current_app.extensions
+    }
+    for field in ('hits', 'misses', 'evictions', 'size'):
+        render_gauges(lines, f'cache_{field}', f'Cache {field} per cache.', {name: stats[field] for name, stats in caches.items()}, labels='cache')
+
+    catalog = current_app.extensions.get('plan_catalog')
+    if catalog is not None and catalog.version is not None:
+        render_gauges(lines, 'plan_catalog_version', 'Plan catalog version loaded by this worker.', {None: catalog.version})
+
+    index = current_app.extensions.get('entitlement_index')
+    if index is not None:
+        stats = index.stats()
+        render_gauges(lines, 'entitlement_index_slots', 'User id slots in the entitlement index.', {None: stats['slots']})
+        render_gauges(lines, 'entitlement_index_memory_bytes', 'Memory held by the entitlement index.', {None: stats['memory_bytes']})
+        render_gauges(lines, 'entitlement_index_age_seconds', 'Seconds since the entitlement index was last refreshed.',
+                      {None: time.time() - stats['refreshed_at']})
+
+    pool_metrics.render(lines)
+    admission_metrics.render(lines, get_concurrency_limiter())
+
+    sweep = sweep_metrics.snapshot()
+    render_gauges(lines, 'expiry_sweep_last_rows', 'Rows expired by the last sweep.', {None: sweep['last_rows']})
+    render_gauges(lines, 'expiry_sweep_last_lag_seconds', 'Age of the oldest expired row found by the last sweep.', {None: sweep['last_lag_seconds']})
+    render_gauges(lines, 'expiry_sweep_rows_total', 'Rows expired since start.', {None: sweep['rows_total']})
+
+    return current_app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -1,44 +1,117 @@
 from flask import jsonify
 
 from src import db
-from sqlalchemy import text
+from src.utils.active_subscription_cache import get_active_subscription_cache
+from src.utils.archival import archive_horizon, merge_history, page_needs_archive, stream_history
+from src.utils.pagination import STREAM_BATCH_SIZE, paginated_response, parse_page_args, stream_json_array
+from src.utils.serialization import compile_row_encoder, encode_rows, json_response
+from src.utils.subscription_versions import has_archive
+from sqlalchemy import DateTime, bindparam, text
 from datetime import datetime
 
 
+active_subscription_sql = text("""
+    SELECT ucs.subscription_id AS id, ucs.plan_name AS name, ucs.price, ucs.duration_days, ucs.start_date, ucs.end_date
+    FROM user_current_subscriptions ucs
+    WHERE ucs.user_id = :user_id
+    AND (ucs.end_date IS NULL OR ucs.end_date > :now)
+""").columns(start_date=DateTime, end_date=DateTime)
+
+HOT_TABLE = 'user_subscriptions'
+ARCHIVE_TABLE = 'user_subscriptions_archive'
+
+# Row encoders follow the SELECT column order of the statements they serialize.
+encode_active_row = compile_row_encoder(('id', 'name', 'price', 'duration_days', 'start_date', 'end_date'), 'active_row')
+encode_history_row = compile_row_encoder(('id', 'name', 'price', 'duration_days', 'start_date', 'end_date', 'status'), 'history_row')
+
+
 def get_active_subscriptions_optimized_user(user_id):
     """
     Optimized query for active subscriptions using:
-    - Proper indexing (status, end_date, user_id)
+    - Primary-key lookup on the user_current_subscriptions projection (no join)
     - Minimal column selection
     - Parameterized queries
+    - Per-user result cache holding the encoded body, invalidated by the write paths
     """
-    sql = text("""
-        SELECT us.id, sp.name, sp.price, sp.duration_days, us.start_date, us.end_date
-        FROM user_subscriptions us
-        JOIN subscription_plans sp ON us.plan_id = sp.id
-        WHERE us.user_id = :user_id AND us.status = :active_status
-        AND (us.end_date IS NULL OR us.end_date > :now)
-    """)
-    result = db.session.execute(sql, {"user_id": user_id, "active_status": "active", "now": datetime.utcnow()}).fetchall()
-    subscriptions = [dict(row) for row in result]
+    cache = get_active_subscription_cache()
+    body = cache.get(user_id, 'optimized')
+    if body is None:
+        result = db.session.execute(active_subscription_sql, {"user_id": user_id, "now": datetime.utcnow()}).fetchall()
+        body = _cache_subscriptions(cache, user_id, result)
+    return json_response(body)
+
 
-    return jsonify(subscriptions)
+def _cache_subscriptions(cache, user_id, rows):
+    body = encode_rows(rows, encode_active_row)
+    if rows:
+        end_dates = [row.end_date for row in rows if isinstance(row.end_date, datetime)]
+        cache.store_active(user_id, 'optimized', body, min(end_dates, default=None))
+    else:
+        cache.store_missing(user_id, 'optimized', body)
+    return body
 
 
 def get_subscription_history_optimized_user(user_id):
     """
-    Optimized query for active subscriptions using:
-    - Proper indexing (status, end_date, user_id)
-    - Minimal column selection
-    - Parameterized queries
+    Optimized query for subscription history using:
+    - idx_user_subscriptions_user_id_start_date, which serves the ORDER BY without a sort
+    - Keyset pagination on (start_date, id) instead of loading the whole history
+    - Server-side cursor when streaming
+    - user_subscriptions_archive is read only for users marked has_archive, and then only
+      for pages reaching past the archive horizon
     """
-    sql = text("""
+    try:
+        page = parse_page_args()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    horizon = archive_horizon()
+    archived = has_archive(db.session, user_id)
+    if page.stream:
+        sql, params = _history_sql(user_id, page, started_since=horizon)
+        result = db.session.execute(sql, params, execution_options={"stream_results": True, "yield_per": STREAM_BATCH_SIZE})
+        return stream_json_array(stream_history(
+            result,
+            lambda: db.session.execute(*_history_sql(user_id, page, started_before=horizon)).fetchall(),
+            (lambda: db.session.execute(*_history_sql(user_id, page, table=ARCHIVE_TABLE)).fetchall()) if archived else None,
+            history_row_key,
+        ), encode_history_row)
+
+    result = db.session.execute(*_history_sql(user_id, page)).fetchall()
+    if page_needs_archive(result, page, history_row_key, horizon, archived):
+        archived = db.session.execute(*_history_sql(user_id, page, table=ARCHIVE_TABLE)).fetchall()
+        result = merge_history(result, archived, history_row_key, page.limit + 1)
+    return paginated_response(result, page, encode_history_row, history_row_key)
+
+
+def history_row_key(row):
+    return row.start_date, row.id
+
+
+def _history_sql(user_id, page, table=HOT_TABLE, started_since=None, started_before=None):
+    if table not in (HOT_TABLE, ARCHIVE_TABLE):
+        raise ValueError(f'Unknown history table {table}')
+    conditions = ""
+    params = {"user_id": user_id}
+    if page.cursor:
+        conditions += " AND (us.start_date < :cursor_start OR (us.start_date = :cursor_start AND us.id < :cursor_id))"
+        params.update(cursor_start=page.cursor[0], cursor_id=page.cursor[1])
+    if started_since is not None:
+        conditions += " AND us.start_date >= :started_since"
+        params["started_since"] = started_since
+    if started_before is not None:
+        conditions += " AND us.start_date < :started_before"
+        params["started_before"] = started_before
+    limit = "" if page.stream else "LIMIT :limit"
+    params["limit"] = page.limit + 1
+
+    sql = text(f"""
         SELECT us.id, sp.name, sp.price, sp.duration_days, us.start_date, us.end_date, us.status
-        FROM user_subscriptions us
+        FROM {table} us
         JOIN subscription_plans sp ON us.plan_id = sp.id
-        WHERE us.user_id = :user_id
-        ORDER BY us.start_date DESC
-    """)
-    result = db.session.execute(sql, {"user_id": user_id}).fetchall()
-    history = [dict(row) for row in result]
-    return jsonify(history)
+        WHERE us.user_id = :user_id{conditions}
+        ORDER BY us.start_date DESC, us.id DESC
+        {limit}
+    """).columns(start_date=DateTime, end_date=DateTime)
+    sql = sql.bindparams(*(bindparam(name, type_=DateTime) for name in ("cursor_start", "started_since", "started_before") if name in params))
+    return sql, params
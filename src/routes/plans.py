@@ -1,14 +1,18 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from src.models import SubscriptionPlan
 from src import auth, db
+from src.utils.outbox import PLAN_CREATED, plan_payload, record_event
+from src.utils.plan_catalog import bump_catalog_version, get_plan_catalog
 
 
 def get_all_plans():
-    plans = SubscriptionPlan.query.all()
-    return [
-        {'id': plan.id, 'name': plan.name, 'price': plan.price, 'description': plan.description, 'duration_days': plan.duration_days}
-        for plan in plans
-    ]
+    return get_plan_catalog().as_list(db.session)
+
+
+def get_all_plans_response():
+    # The catalog keeps the serialized body, so GET /plans neither queries nor encodes.
+    catalog = get_plan_catalog().refresh(db.session)
+    return current_app.response_class(catalog.body, mimetype='application/json')
 
 
 def create_plan():
@@ -18,17 +22,27 @@ def create_plan():
     data = request.get_json()
     name = data.get('name')
     price = data.get('price')
+    description = data.get('description')
     duration_days = data.get('duration_days')
 
     if not name or price is None or duration_days is None:
         return jsonify({'message': 'Name, price, and duration_days are required'}), 400
 
-    if SubscriptionPlan.query.filter_by(name=name).first():
+    if db.session.query(SubscriptionPlan).filter_by(name=name).first():
         return jsonify({'message': 'Subscription plan name already exists'}), 409
 
-    new_plan = SubscriptionPlan(name=name, price=price, duration_days=duration_days)
+    new_plan = SubscriptionPlan(name=name, price=price, description=description, duration_days=duration_days)
     db.session.add(new_plan)
+    bump_catalog_version(db.session)
+    db.session.flush()
+    record_event(db.session, PLAN_CREATED, plan_payload(new_plan))
     db.session.commit()
-
-    return jsonify(new_plan), 201
-
+    get_plan_catalog().invalidate()
+
+    return jsonify({
+        'id': new_plan.id,
+        'name': new_plan.name,
+        'price': new_plan.price,
+        'description': new_plan.description,
+        'duration_days': new_plan.duration_days
+    }), 201
@@ -0,0 +1,30 @@
+from flask import current_app, jsonify, request
+from src import auth, db
+from src.utils.plan_catalog import get_plan_catalog
+from src.utils.rollups import daily_report, subscriber_report
+
+DEFAULT_REPORT_DAYS = 30
+DEFAULT_MAX_DAYS = 366
+
+
+def get_subscriber_report():
+    """Active subscribers and MRR per plan, from the rollups (never user_subscriptions)."""
+    if auth.current_user().username != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+
+    plans = get_plan_catalog().refresh(db.session).plans
+    return jsonify(subscriber_report(db.session, plans)), 200
+
+
+def get_daily_report():
+    """Started / cancelled / upgraded / expired subscriptions and churn per day."""
+    if auth.current_user().username != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+
+    max_days = current_app.config.get('REPORT_MAX_DAYS', DEFAULT_MAX_DAYS)
+    days = request.args.get('days', DEFAULT_REPORT_DAYS, type=int)
+    plan_id = request.args.get('plan_id', type=int)
+    if days is None or not 1 <= days <= max_days:
+        return jsonify({'message': f'days must be between 1 and {max_days}'}), 400
+
+    return jsonify({'days': daily_report(db.session, days, plan_id=plan_id), 'plan_id': plan_id}), 200
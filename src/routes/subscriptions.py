@@ -1,11 +1,37 @@
-from flask import jsonify
+from flask import current_app, jsonify
 from src import db
-from src.models import SubscriptionPlan, UserSubscription, SubscriptionStatus
+from src.models import ArchivedSubscription, UserCurrentSubscription, UserSubscription, SubscriptionStatus
+from src.utils.active_subscription_cache import get_active_subscription_cache
+from src.utils.archival import archive_horizon, merge_history, page_needs_archive, stream_history
+from src.utils.current_subscription import clear_current_subscription, set_current_subscription
+from src.utils.pagination import (
+    STREAM_BATCH_SIZE,
+    keyset_before,
+    paginated_response,
+    parse_page_args,
+    stream_json_array,
+)
+from src.utils.outbox import (
+    SUBSCRIPTION_CANCELLED,
+    SUBSCRIPTION_CREATED,
+    SUBSCRIPTION_UPGRADED,
+    record_event,
+    subscription_payload,
+)
+from src.utils.plan_catalog import get_plan_catalog
+from src.utils.rollups import DEFAULT_SHARDS, record_subscription_changes
+from src.utils.serialization import compile_row_encoder, json_response
+from src.utils.subscription_versions import bump_subscription_versions, has_archive
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
+encode_active_subscription = compile_row_encoder(('plan_name', 'start_date', 'end_date'), 'active_subscription')
+encode_history_item = compile_row_encoder(('plan_name', 'start_date', 'end_date', 'status', 'created_at', 'updated_at'), 'history_item')
+
 
 def subscribe_user(user, plan_id):
-    plan = db.session.get(SubscriptionPlan, plan_id)
+    plan = get_plan_catalog().get(db.session, plan_id)
     if not plan:
         return jsonify({'message': 'Subscription plan not found'}), 404
 
@@ -14,46 +40,108 @@ def subscribe_user(user, plan_id):
     if existing_subscription:
         return jsonify({'message': 'User already has an active subscription. Cancel it first.'}), 400
 
-    end_date = datetime.utcnow() + timedelta(days=plan.duration_days)
-    new_subscription = UserSubscription(user_id=user.id, plan_id=plan.id, end_date=end_date)
+    now = datetime.utcnow()
+    end_date = now + timedelta(days=plan.duration_days)
+    new_subscription = UserSubscription(user_id=user.id, plan_id=plan.id, start_date=now, end_date=end_date)
     db.session.add(new_subscription)
-    db.session.commit()
+    try:
+        set_current_subscription(db.session, new_subscription, plan)
+        _record_rollups(new_subscription)
+        record_event(db.session, SUBSCRIPTION_CREATED, subscription_payload(new_subscription), user.id)
+        bump_subscription_versions(db.session, {user.id: end_date})
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request got its ACTIVE row in first (uq_user_subscriptions_one_active).
+        db.session.rollback()
+        return jsonify({'message': 'User already has an active subscription. Cancel it first.'}), 409
+    get_active_subscription_cache().invalidate(user.id)
 
     return jsonify({'message': f'Subscribed to {plan.name} until {end_date}'}), 201
 
 
+def _record_rollups(*changes):
+    # Same transaction as the write (as are the outbox events), so the reports never
+    # count a rolled-back change.
+    record_subscription_changes(db.session, *changes, shards=current_app.config.get('ROLLUP_SHARDS', DEFAULT_SHARDS))
+
+
 def get_active_subscriptions_user(user_id):
-    active_subscription = db.session.query(UserSubscription).filter(
-        UserSubscription.user_id == user_id,
-        UserSubscription.status == 'active',
-        UserSubscription.end_date > datetime.utcnow()
-    ).first()
-
-    if active_subscription:
-        return jsonify({
-            'plan_name': active_subscription.plan.name,
-            'start_date': active_subscription.start_date,
-            'end_date': active_subscription.end_date
-        }), 200
+    cache = get_active_subscription_cache()
+    cached = cache.get(user_id, 'orm')
+    if cached is None:
+        cached = _load_active_subscription(cache, user_id)
+
+    body, status_code = cached
+    return json_response(body), status_code
+
+
+def _load_active_subscription(cache, user_id):
+    # Primary-key fetch of the denormalized projection, no scan or join.
+    return _cache_active_subscription(cache, user_id, db.session.get(UserCurrentSubscription, user_id))
+
+
+def _cache_active_subscription(cache, user_id, active_subscription):
+    if active_subscription and (active_subscription.end_date is None or active_subscription.end_date > datetime.utcnow()):
+        # The cache keeps the encoded body, so hits skip serialization too.
+        body = encode_active_subscription((active_subscription.plan_name, active_subscription.start_date, active_subscription.end_date))
+        return cache.store_active(user_id, 'orm', (body, 200), active_subscription.end_date)
     else:
-        return jsonify({'message': 'No active subscription found'}), 404
+        return cache.store_missing(user_id, 'orm', (current_app.json.dumps({'message': 'No active subscription found'}), 404))
 
 
 def get_subscription_history_user(user_id):
-    history = db.session.query(UserSubscription).filter_by(user_id=user_id).order_by(UserSubscription.start_date.desc()).all()
-
-    return jsonify([{
-        'plan_name': sub.plan.name,
-        'start_date': sub.start_date,
-        'end_date': sub.end_date,
-        'status': 'Active' if sub.end_date > datetime.utcnow() else 'Inactive',
-        'created_at': sub.created_at,
-        'updated_at': sub.updated_at
-    } for sub in history]), 200
+    try:
+        page = parse_page_args()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    # Users with nothing archived never touch the archive, and the others only on pages
+    # reaching back past the horizon, which every archived row started before.
+    horizon = archive_horizon()
+    archived = has_archive(db.session, user_id)
+    query = _history_query(UserSubscription, user_id, page)
+    if page.stream:
+        return stream_json_array(stream_history(
+            query.filter(UserSubscription.start_date >= horizon).yield_per(STREAM_BATCH_SIZE),
+            lambda: query.filter(UserSubscription.start_date < horizon).all(),
+            (lambda: _history_query(ArchivedSubscription, user_id, page).all()) if archived else None,
+            _history_key,
+        ), _encode_history_item), 200
+
+    history = query.limit(page.limit + 1).all()
+    if page_needs_archive(history, page, _history_key, horizon, archived):
+        archived = _history_query(ArchivedSubscription, user_id, page).limit(page.limit + 1).all()
+        history = merge_history(history, archived, _history_key, page.limit + 1)
+    return paginated_response(history, page, _encode_history_item, _history_key), 200
+
+
+def _history_query(model, user_id, page):
+    # The plan comes with a join: a lazy load per row is N+1, and while a streamed
+    # (server-side cursor) result is open it would reuse the connection, which on
+    # MySQL silently discards the rest of the unbuffered result.
+    query = db.session.query(model).options(joinedload(model.plan)).filter_by(user_id=user_id)
+    if page.cursor:
+        query = query.filter(keyset_before(model.start_date, model.id, page.cursor))
+    return query.order_by(model.start_date.desc(), model.id.desc())
+
+
+def _history_key(sub):
+    return sub.start_date, sub.id
+
+
+def _encode_history_item(sub):
+    return encode_history_item((
+        sub.plan.name,
+        sub.start_date,
+        sub.end_date,
+        'Active' if sub.end_date > datetime.utcnow() else 'Inactive',
+        sub.created_at,
+        sub.updated_at,
+    ))
 
 
 def upgrade_subscription(user, new_plan_id):
-    new_plan = db.session.get(SubscriptionPlan, new_plan_id)
+    new_plan = get_plan_catalog().get(db.session, new_plan_id)
     if not new_plan:
         return jsonify({'message': 'New subscription plan not found'}), 404
 
@@ -61,12 +149,22 @@ def upgrade_subscription(user, new_plan_id):
     if not active_subscription:
         return jsonify({'message': 'No active subscription to upgrade'}), 400
 
+    now = datetime.utcnow()
     active_subscription.status = SubscriptionStatus.CANCELLED
-    active_subscription.end_date = datetime.utcnow()
-    end_date = datetime.utcnow() + timedelta(days=new_plan.duration_days)
-    new_user_subscription = UserSubscription(user_id=user.id, plan_id=new_plan.id, end_date=end_date)
+    active_subscription.end_date = now
+    end_date = now + timedelta(days=new_plan.duration_days)
+    new_user_subscription = UserSubscription(user_id=user.id, plan_id=new_plan.id, start_date=now, end_date=end_date)
     db.session.add(new_user_subscription)
-    db.session.commit()
+    try:
+        set_current_subscription(db.session, new_user_subscription, new_plan)
+        _record_rollups((active_subscription, True), new_user_subscription)
+        record_event(db.session, SUBSCRIPTION_UPGRADED, subscription_payload(new_user_subscription, active_subscription), user.id)
+        bump_subscription_versions(db.session, {user.id: end_date})
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Subscription changed by a concurrent request, retry'}), 409
+    get_active_subscription_cache().invalidate(user.id)
 
     return jsonify({'message': f'Upgraded to {new_plan.name} until {end_date}'}), 200
 
@@ -78,6 +176,11 @@ def cancel_subscription(user):
 
     active_subscription.status = SubscriptionStatus.CANCELLED
     active_subscription.end_date = datetime.utcnow()
+    clear_current_subscription(db.session, user.id)
+    _record_rollups(active_subscription)
+    record_event(db.session, SUBSCRIPTION_CANCELLED, subscription_payload(active_subscription), user.id)
+    bump_subscription_versions(db.session, {user.id: None})
     db.session.commit()
+    get_active_subscription_cache().invalidate(user.id)
 
     return jsonify({'message': 'Subscription cancelled'}), 200
@@ -0,0 +1,69 @@
+from flask import current_app
+from datetime import datetime
+from src.utils.cache import TTLCache
+from src.utils.conditional_get import request_etag
+
+DEFAULT_MAX_SIZE = 50000
+DEFAULT_TTL_SECONDS = 30
+DEFAULT_NEGATIVE_TTL_SECONDS = 10
+
+# Each active endpoint caches its own payload shape under (user_id, variant).
+VARIANTS = ('orm', 'optimized')
+
+
+class ActiveSubscriptionCache:
+    """
+    Per-user cache of the active-subscription payloads:
+    - Bounded LRU, with hit/miss/eviction stats
+    - Positive entries never outlive the subscription's end_date
+    - "No active subscription" answers are cached too, with a shorter TTL
+    - The write paths in src/routes/subscriptions.py drop a user's entries on commit;
+      other workers converge within the TTL
+    - Entries remember the request's ETag (request_etag()) and only hit under the same
+      one, so a response tagged with a newer version never carries an older body
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS, negative_ttl=DEFAULT_NEGATIVE_TTL_SECONDS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, user_id, variant):
+        entry = self._entries.get((user_id, variant))
+        if entry is None or entry[0] != request_etag():
+            return None
+        return entry[1]
+
+    def store_active(self, user_id, variant, payload, end_date):
+        ttl = self.ttl
+        if end_date is not None:
+            ttl = min(ttl, (end_date - datetime.utcnow()).total_seconds())
+        if ttl > 0:
+            self._entries.set((user_id, variant), (request_etag(), payload), ttl=ttl)
+        return payload
+
+    def store_missing(self, user_id, variant, payload):
+        self._entries.set((user_id, variant), (request_etag(), payload), ttl=self.negative_ttl)
+        return payload
+
+    def invalidate(self, user_id):
+        for variant in VARIANTS:
+            self._entries.pop((user_id, variant))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+def get_active_subscription_cache():
+    cache = current_app.extensions.get('active_subscription_cache')
+    if cache is None:
+        cache = ActiveSubscriptionCache(
+            max_size=current_app.config.get('ACTIVE_SUBSCRIPTION_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE),
+            ttl=current_app.config.get('ACTIVE_SUBSCRIPTION_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS),
+            negative_ttl=current_app.config.get('ACTIVE_SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS', DEFAULT_NEGATIVE_TTL_SECONDS),
+        )
+        current_app.extensions['active_subscription_cache'] = cache
+    return cache
@@ -0,0 +1,258 @@
+from collections import Counter
+from flask import current_app, jsonify, make_response, request
+from functools import lru_cache, wraps
+from threading import BoundedSemaphore, Lock
+from src.utils.cache import TTLCache
+from src.utils.instrumentation import render_gauges
+
+import logging
+import math
+import time
+
+DEFAULT_RATE = 20.0
+DEFAULT_BURST = 40
+DEFAULT_MAX_CONCURRENT = 30
+DEFAULT_QUEUE_TIMEOUT = 0.05
+BUCKETS_MAX_SIZE = 100000
+SHED_RETRY_AFTER_SECONDS = 1
+OUTCOMES = ('accepted', 'throttled', 'shed')
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def parse_route_limits(spec):
+    """'endpoint=rate/burst,...' (RATE_LIMIT_ROUTES) -> {endpoint: (rate, burst)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        endpoint, _, limit = item.partition('=')
+        rate, _, burst = limit.partition('/')
+        try:
+            limits[endpoint.strip()] = (float(rate), int(burst) if burst else max(1, math.ceil(float(rate))))
+        except ValueError as exc:
+            raise ValueError(f'Invalid rate limit {item!r}, expected endpoint=rate/burst') from exc
+    return limits
+
+
+def route_name(endpoint):
+    """'api.list_plans' -> 'list_plans': limits and metrics use the view's own name."""
+    return (endpoint or '').rpartition('.')[2]
+
+
+def take_token(state, rate, burst, now):
+    """
+    One token-bucket step: state is (tokens, updated_at) or None for a full bucket.
+    Returns the new state and 0 when a token was taken, else the seconds until one is.
+    """
+    tokens, updated_at = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """Buckets in this process; a bucket is forgotten once it would have refilled."""
+
+    def __init__(self, max_size=BUCKETS_MAX_SIZE, clock=time.monotonic):
+        self._buckets = TTLCache(max_size=max_size, clock=clock)
+        self._clock = clock
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        with self._lock:
+            state, retry_after = take_token(self._buckets.get(key), rate, burst, self._clock())
+            self._buckets.set(key, state, ttl=burst / rate)
+        return retry_after
+
+
+# KEYS[1] bucket; ARGV rate, burst. Uses the Redis clock, so worker clocks never disagree.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Buckets shared by every worker and host, one atomic script call per request.
+    client is anything with redis-py's eval(script, numkeys, *keys_and_args).
+    """
+
+    def __init__(self, client, prefix='rate_limit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst):
+        retry_after = self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst)
+        return float(retry_after.decode() if isinstance(retry_after, bytes) else retry_after)
+
+
+class LocalRedisStandIn:
+    """
+    In-process stand-in for the Redis client behind RedisRateLimitBackend, for tests
+    and single-process development. It only understands TOKEN_BUCKET_SCRIPT.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = Lock()
+        self.buckets = {}
+
+    def eval(self, script, numkeys, *keys_and_args):
+        if script != TOKEN_BUCKET_SCRIPT or numkeys != 1:
+            raise NotImplementedError('LocalRedisStandIn only runs TOKEN_BUCKET_SCRIPT')
+        key, rate, burst = keys_and_args
+        with self._lock:
+            self.buckets[key], retry_after = take_token(self.buckets.get(key), float(rate), int(burst), self._clock())
+        return str(retry_after).encode()
+
+
+def get_rate_limit_backend():
+    backend = current_app.extensions.get('rate_limit_backend')
+    if backend is None:
+        url = current_app.config.get('RATE_LIMIT_REDIS_URL')
+        if url:
+            import redis
+
+            backend = RedisRateLimitBackend(redis.Redis.from_url(url, socket_timeout=0.05))
+        else:
+            backend = MemoryRateLimitBackend()
+        current_app.extensions['rate_limit_backend'] = backend
+    return backend
+
+
+class ConcurrencyLimiter:
+    """Cap on DB-backed handlers running at once in this worker; waits at most queue_timeout."""
+
+    def __init__(self, limit, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots = BoundedSemaphore(limit)
+        self._lock = Lock()
+        self.in_flight = 0
+
+    def acquire(self):
+        if self.queue_timeout > 0:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+def get_concurrency_limiter():
+    limiter = current_app.extensions.get('concurrency_limiter')
+    if limiter is None:
+        limiter = ConcurrencyLimiter(
+            current_app.config.get('ADMISSION_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT),
+            current_app.config.get('ADMISSION_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT),
+        )
+        current_app.extensions['concurrency_limiter'] = limiter
+    return limiter
+
+
+class AdmissionMetrics:
+    """Accepted / throttled (429) / shed (503) requests per endpoint."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counts = Counter()
+
+    def record(self, endpoint, outcome):
+        with self._lock:
+            self.counts[(endpoint, outcome)] += 1
+
+    def render(self, lines, limiter=None):
+        lines.append('# HELP admission_requests_total Requests per endpoint by admission outcome.')
+        lines.append('# TYPE admission_requests_total counter')
+        with self._lock:
+            for (endpoint, outcome), value in sorted(self.counts.items()):
+                lines.append(f'admission_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {value}')
+        if limiter is not None:
+            render_gauges(lines, 'admission_in_flight', 'DB-backed handlers running in this worker.', {None: limiter.in_flight})
+            render_gauges(lines, 'admission_max_concurrent', 'Concurrency cap for DB-backed handlers.', {None: limiter.limit})
+
+
+admission_metrics = AdmissionMetrics()
+
+
+def rate_limit_retry_after(endpoint, user):
+    """Take a token for (user or client address, endpoint); returns 0 or seconds to wait."""
+    rate, burst = parse_route_limits(current_app.config.get('RATE_LIMIT_ROUTES', '')).get(endpoint, (
+        current_app.config.get('RATE_LIMIT_PER_SECOND', DEFAULT_RATE),
+        current_app.config.get('RATE_LIMIT_BURST', DEFAULT_BURST),
+    ))
+    client = f'user:{user.id}' if user is not None else f'addr:{request.remote_addr}'
+    try:
+        return get_rate_limit_backend().take(f'{client}:{endpoint}', rate, burst)
+    except Exception:
+        # A shared backend outage must not take the API down with it: fail open.
+        logger.warning('Rate limit backend unavailable, admitting request', exc_info=True)
+        return 0.0
+
+
+def reject(status_code, message, retry_after, endpoint, outcome):
+    admission_metrics.record(endpoint, outcome)
+    response = make_response(jsonify({'message': message}), status_code)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admission_control(view):
+    """
+    Admit a DB-backed view only when:
+    - The caller's token bucket for this route has a token, else 429
+    - A concurrency slot frees up within ADMISSION_QUEUE_TIMEOUT, else 503
+    Both carry Retry-After, so clients back off instead of piling onto the pool.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get('ADMISSION_CONTROL_ENABLED', True):
+            return view(*args, **kwargs)
+        from src import auth
+
+        endpoint = route_name(request.endpoint)
+        retry_after = rate_limit_retry_after(endpoint, auth.current_user())
+        if retry_after:
+            return reject(429, 'Too many requests', retry_after, endpoint, 'throttled')
+
+        limiter = get_concurrency_limiter()
+        if not limiter.acquire():
+            return reject(503, 'Server busy, retry shortly', SHED_RETRY_AFTER_SECONDS, endpoint, 'shed')
+        admission_metrics.record(endpoint, 'accepted')
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            limiter.release()
+            raise
+        # A streamed body keeps using the database until the client has read it.
+        if response.is_streamed:
+            response.call_on_close(limiter.release)
+        else:
+            limiter.release()
+        return response
+    return wrapper
@@ -0,0 +1,116 @@
+from flask import current_app
+from heapq import merge
+from itertools import islice
+from sqlalchemy import delete, exists, func, insert, literal, select
+from sqlalchemy.types import DateTime
+from datetime import datetime, timedelta
+from src.models import ArchivedSubscription, SubscriptionStatus, UserCurrentSubscription, UserSubscription
+from src.utils.rollups import DEFAULT_SHARDS, RollupState, apply_states, source_states
+from src.utils.subscription_versions import mark_archived_users
+
+import time
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+ARCHIVED_STATUSES = (SubscriptionStatus.CANCELLED, SubscriptionStatus.INACTIVE)
+ARCHIVE_COLUMNS = ('id', 'user_id', 'plan_id', 'start_date', 'end_date', 'status', 'created_at', 'updated_at')
+
+
+def archive_subscriptions(session, older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, batch_size=DEFAULT_BATCH_SIZE,
+                          max_batches=None, shards=DEFAULT_SHARDS, now=None):
+    """
+    Move CANCELLED / INACTIVE subscriptions that ended more than older_than_days ago
+    into user_subscriptions_archive:
+    - Candidates come from idx_user_subscriptions_status_end_date
+    - Each batch copies, folds the rows into the rollups, and deletes them in one short
+      transaction, so a crash or Ctrl-C leaves every row in exactly one table and a
+      rerun simply continues
+    - The newest row is never moved, so SQLite cannot hand its id out again
+    - The owners are marked has_archive in the same transaction; history reads of
+      everyone else never query the archive
+    Returns a dict with rows, batches, cutoff and duration.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    started = time.perf_counter()
+    newest_id = session.execute(select(func.max(UserSubscription.id))).scalar() or 0
+    rows = batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = session.execute(
+            select(UserSubscription.id, UserSubscription.user_id)
+            .where(
+                UserSubscription.status.in_(ARCHIVED_STATUSES),
+                UserSubscription.end_date < cutoff,
+                UserSubscription.id < newest_id,
+                ~exists().where(UserCurrentSubscription.subscription_id == UserSubscription.id),
+            )
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        ids = [row.id for row in batch]
+
+        # The catch-up job would never see these rows again once they are gone.
+        apply_states(session, [RollupState(*row) for row in session.execute(
+            source_states(shards).where(UserSubscription.id.in_(ids)))])
+        session.execute(insert(ArchivedSubscription).from_select(
+            [*ARCHIVE_COLUMNS, 'archived_at'],
+            select(*(getattr(UserSubscription, column) for column in ARCHIVE_COLUMNS), literal(now, DateTime))
+            .where(UserSubscription.id.in_(ids)),
+        ))
+        session.execute(delete(UserSubscription).where(UserSubscription.id.in_(ids)).execution_options(synchronize_session=False))
+        mark_archived_users(session, {row.user_id for row in batch}, now)
+        session.commit()
+        rows += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+
+    return {'rows': rows, 'batches': batches, 'cutoff': cutoff, 'duration_seconds': time.perf_counter() - started}
+
+
+def archive_horizon():
+    """
+    Every archived row ended, and so started, before this instant: the archival job
+    only moves rows older than ARCHIVE_AFTER_DAYS, measured when it ran.
+    """
+    days = current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def page_needs_archive(rows, page, key, horizon, archived):
+    """
+    rows is a hot page fetched with limit + 1 for a user whose has_archive marker is
+    archived. Archived rows can only belong to it when the user has any and the hot
+    rows ran out or the page reaches back past the horizon.
+    """
+    return archived and (len(rows) <= page.limit or key(rows[-1])[0] < horizon)
+
+
+def merge_history(hot, archived, key, limit=None):
+    """Merge two (start_date DESC, id DESC) sequences, keeping at most limit rows."""
+    merged = merge(hot, archived, key=key, reverse=True)
+    return list(islice(merged, limit)) if limit is not None else merged
+
+
+def stream_history(recent, older, archived, key):
+    """
+    Stream a history in order: recent hot rows (started at or after the horizon,
+    streamed), then the older hot rows merged with the archived ones. older and
+    archived are callables, run only once the recent rows are exhausted, so the
+    archive is read only by clients that scroll that far; archived is None for users
+    with nothing archived.
+    """
+    yield from recent
+    if archived is None:
+        yield from older()
+    else:
+        yield from merge(older(), archived(), key=key, reverse=True)
+
+
+async def stream_history_async(recent, older, archived, key):
+    """stream_history() for an async recent iterator and coroutine-returning callables."""
+    async for row in recent:
+        yield row
+    for row in merge(await older(), await archived() if archived is not None else [], key=key, reverse=True):
+        yield row
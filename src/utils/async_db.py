@@ -0,0 +1,53 @@
+from flask import current_app
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src.utils.db_routing import REPLICA_BIND_PREFIX
+
+import random
+
+DEFAULT_POOL_SIZE = 20
+
+# Sync driver in DATABASE_URL -> asyncio driver for the same database.
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    if url.drivername not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver configured for {url.drivername}')
+    return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+
+
+def get_async_sessionmaker(replica=False):
+    """
+    Lazily build the asyncio engine for the app's database (or, with replica=True,
+    one of SQLALCHEMY_BINDS' replicas when configured). One connection per awaiting
+    request instead of one thread, so the pool is sized separately.
+    """
+    url = current_app.config['SQLALCHEMY_DATABASE_URI']
+    replicas = [bind['url'] for key, bind in current_app.config.get('SQLALCHEMY_BINDS', {}).items()
+                if key.startswith(REPLICA_BIND_PREFIX)]
+    if replica and replicas:
+        url = random.choice(replicas)
+
+    sessionmakers = current_app.extensions.setdefault('async_sessionmakers', {})
+    sessionmaker = sessionmakers.get(url)
+    if sessionmaker is None:
+        async_url = async_database_url(url)
+        options = {} if async_url.get_backend_name() == 'sqlite' else {
+            'pool_size': current_app.config.get('ASYNC_DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+            'pool_pre_ping': True,
+        }
+        engine = create_async_engine(async_url, **options)
+        sessionmaker = sessionmakers[url] = async_sessionmaker(engine, expire_on_commit=False)
+    return sessionmaker
+
+
+async def dispose_async_engines():
+    for sessionmaker in current_app.extensions.pop('async_sessionmakers', {}).values():
+        await sessionmaker.kw['bind'].dispose()
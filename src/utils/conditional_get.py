@@ -0,0 +1,68 @@
+from flask import current_app, g, has_request_context, request
+from functools import wraps
+
+import inspect
+
+# Per-user (and authenticated) responses: only the client may store them, and it must
+# revalidate before each reuse, which the ETag makes a 304.
+CACHE_CONTROL = 'private, no-cache'
+
+
+def request_etag():
+    """ETag the current conditional_get view is answering under, None outside of one."""
+    return g.get('etag') if has_request_context() else None
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def tag_response(response, etag):
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def _matches(etag):
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def conditional_get(current_etag):
+    """
+    Answer a GET with 304 Not Modified when If-None-Match holds current_etag():
+    - The tag is read before the view runs, and on a match the view (its queries and
+      serialization) does not run at all
+    - 200 responses carry that same tag; a write landing in between pairs an older tag
+      with newer data, which only costs the client one more full response
+    - current_etag() returning None turns both off for the request
+    The tag is kept in g for request_etag(), so caches never serve a body older than it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = g.etag = current_etag()
+            if _matches(etag):
+                return not_modified(etag)
+            return tag_response(current_app.make_response(view(*args, **kwargs)), etag)
+        return wrapper
+    return decorator
+
+
+def conditional_get_async(current_etag):
+    """conditional_get() for the async read handlers: current_etag(session, user) is awaited."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(session, user):
+            etag = g.etag = await current_etag(session, user)
+            if _matches(etag):
+                return not_modified(etag)
+            result = await handler(session, user)
+            if inspect.isasyncgen(result):
+                return result
+            return tag_response(current_app.make_response(result), etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,86 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from src.models import User
+from src.utils.cache import TTLCache
+
+import hashlib
+import hmac
+import os
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL_SECONDS = 300
+
+
+class CredentialCache:
+    """
+    Cache of successful HTTP Basic verifications:
+    - Keyed by username, storing an HMAC digest of the presented password
+      (keyed with a per-process secret, so the cache never holds anything reusable)
+    - A hit skips both the users lookup and the password KDF
+    - Entries are dropped when the user's password changes in this process and
+      expire after the TTL otherwise, which bounds staleness across workers
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS):
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+        self._key = os.urandom(32)
+
+    def _digest(self, username, password):
+        message = f'{username}\0{password}'.encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def lookup(self, username, password):
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        digest, identity = entry
+        if hmac.compare_digest(digest, self._digest(username, password)):
+            return identity
+        return None
+
+    def remember(self, username, password, identity):
+        self._entries.set(username, (self._digest(username, password), identity))
+
+    def invalidate(self, username):
+        self._entries.pop(username)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+def get_credential_cache():
+    cache = current_app.extensions.get('credential_cache')
+    if cache is None:
+        cache = CredentialCache(
+            max_size=current_app.config.get('AUTH_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE),
+            ttl=current_app.config.get('AUTH_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS),
+        )
+        current_app.extensions['credential_cache'] = cache
+    return cache
+
+
+def invalidate_credentials(username):
+    if not has_app_context() or not username:
+        return
+    cache = current_app.extensions.get('credential_cache')
+    if cache is not None:
+        cache.invalidate(username)
+
+
+@event.listens_for(User.password, 'set')
+def _password_changed(target, value, oldvalue, initiator):
+    invalidate_credentials(target.username)
+
+
+@event.listens_for(User.username, 'set')
+def _username_changed(target, value, oldvalue, initiator):
+    if isinstance(oldvalue, str):
+        invalidate_credentials(oldvalue)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    invalidate_credentials(target.username)
@@ -0,0 +1,96 @@
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, select
+from datetime import datetime
+from src.models import SubscriptionPlan, SubscriptionStatus, UserCurrentSubscription, UserSubscription
+
+projection = UserCurrentSubscription.__table__
+
+
+def set_current_subscription(session, subscription, plan):
+    """Point the user's projection row at subscription, in the caller's transaction."""
+    if subscription.id is None:
+        session.flush()
+    session.merge(UserCurrentSubscription(
+        user_id=subscription.user_id,
+        subscription_id=subscription.id,
+        plan_id=plan.id,
+        plan_name=plan.name,
+        price=plan.price,
+        duration_days=plan.duration_days,
+        start_date=subscription.start_date,
+        end_date=subscription.end_date,
+        updated_at=datetime.utcnow(),
+    ))
+
+
+def clear_current_subscription(session, user_id):
+    session.execute(delete(UserCurrentSubscription).where(UserCurrentSubscription.user_id == user_id))
+
+
+def _active_rows(user_ids, now):
+    # Latest ACTIVE row per user; there should only ever be one.
+    latest = select(func.max(UserSubscription.id)).where(UserSubscription.status == SubscriptionStatus.ACTIVE)
+    if user_ids is not None:
+        latest = latest.where(UserSubscription.user_id.in_(user_ids))
+    latest = latest.group_by(UserSubscription.user_id)
+    return (
+        select(
+            UserSubscription.user_id,
+            UserSubscription.id,
+            SubscriptionPlan.id,
+            SubscriptionPlan.name,
+            SubscriptionPlan.price,
+            SubscriptionPlan.duration_days,
+            UserSubscription.start_date,
+            UserSubscription.end_date,
+            literal(now, DateTime),
+        )
+        .join(SubscriptionPlan, SubscriptionPlan.id == UserSubscription.plan_id)
+        .where(UserSubscription.id.in_(latest))
+    )
+
+
+def refresh_current_subscriptions(session, user_ids=None):
+    """
+    Recompute projection rows from user_subscriptions with set-based statements:
+    for the given users (bulk writes), or for everyone when user_ids is None (rebuild).
+    Runs in the caller's transaction.
+    """
+    stale = delete(projection)
+    if user_ids is not None:
+        if not user_ids:
+            return
+        stale = stale.where(projection.c.user_id.in_(user_ids))
+    session.execute(stale)
+    session.execute(insert(projection).from_select(
+        ['user_id', 'subscription_id', 'plan_id', 'plan_name', 'price', 'duration_days', 'start_date', 'end_date', 'updated_at'],
+        _active_rows(user_ids, datetime.utcnow())
+    ))
+
+
+def verify_current_subscriptions(session, sample_size=20):
+    """
+    Compare the projection with user_subscriptions, returns counts of:
+    - missing: users with an ACTIVE subscription but no projection row
+    - stale: projection rows not pointing at an ACTIVE subscription with matching plan/dates
+    """
+    missing = session.execute(
+        select(UserSubscription.user_id)
+        .outerjoin(projection, projection.c.user_id == UserSubscription.user_id)
+        .where(UserSubscription.status == SubscriptionStatus.ACTIVE, projection.c.user_id.is_(None))
+    ).scalars().all()
+    stale = session.execute(
+        select(projection.c.user_id)
+        .outerjoin(UserSubscription, and_(
+            UserSubscription.id == projection.c.subscription_id,
+            UserSubscription.user_id == projection.c.user_id,
+            UserSubscription.status == SubscriptionStatus.ACTIVE,
+            UserSubscription.plan_id == projection.c.plan_id,
+            UserSubscription.end_date == projection.c.end_date,
+        ))
+        .where(UserSubscription.id.is_(None))
+    ).scalars().all()
+    return {
+        'missing': len(missing),
+        'stale': len(stale),
+        'sample_user_ids': sorted(set(missing) | set(stale))[:sample_size],
+    }
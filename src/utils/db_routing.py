@@ -0,0 +1,158 @@
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from threading import Lock
+from src.utils.cache import TTLCache
+from src.utils.instrumentation import Histogram, LATENCY_BUCKETS, render_gauges, render_histograms
+
+import random
+import time
+
+REPLICA_BIND_PREFIX = 'replica_'
+PRIMARY_POOL_NAME = 'primary'
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+RECENT_WRITERS_MAX_SIZE = 100000
+# Clients that keep cookies carry their own read-your-writes window to every worker.
+READ_YOUR_WRITES_COOKIE = 'primary_until'
+
+
+def replica_binds(urls):
+    """DATABASE_REPLICA_URLS (comma-separated) -> SQLALCHEMY_BINDS entries."""
+    replicas = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {
+        f'{REPLICA_BIND_PREFIX}{index}': {'url': url, 'pool_logging_name': f'{REPLICA_BIND_PREFIX}{index}'}
+        for index, url in enumerate(replicas)
+    }
+
+
+def engine_options(url, pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS with an explicitly sized, timed QueuePool. In-memory
+    SQLite keeps Flask-SQLAlchemy's single static connection.
+    """
+    options = {'pool_pre_ping': pool_pre_ping, 'pool_logging_name': PRIMARY_POOL_NAME}
+    parsed = make_url(url) if url else None
+    if parsed is not None and parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+    )
+    return options
+
+
+class PoolMetrics:
+    """Checkout wait time and timeouts per pool, labelled by pool_logging_name."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.wait = {}
+        self.timeouts = {}
+        self.pools = {}
+
+    def observe(self, pool, seconds, timed_out=False):
+        name = pool.logging_name or PRIMARY_POOL_NAME
+        with self._lock:
+            self.pools[name] = pool
+            self.wait.setdefault(name, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if timed_out:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def render(self, lines):
+        with self._lock:
+            render_histograms(lines, 'db_pool_checkout_wait_seconds', 'Time waited for a pooled connection.', self.wait, labels='pool')
+            render_gauges(lines, 'db_pool_checkout_timeouts_total', 'Checkouts that gave up after pool_timeout.', self.timeouts, labels='pool')
+            pools = dict(self.pools)
+        for field, read in (('size', QueuePool.size), ('checked_out', QueuePool.checkedout), ('overflow', QueuePool.overflow)):
+            values = {name: max(read(pool), 0) for name, pool in sorted(pools.items())}
+            render_gauges(lines, f'db_pool_{field}', f'Pool {field} connections.', values, labels='pool')
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.observe(self, time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.observe(self, time.perf_counter() - started)
+        return connection
+
+
+class RoutingSession(Session):
+    """
+    db.session class that sends statements to a replica while the request is marked
+    read-only (see read_replica) and it is not flushing or running DML. Everything
+    else, including CLI commands and all write paths, stays on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False) \
+                and has_app_context() and g.get('read_replica'):
+            replicas = [engine for key, engine in self._db.engines.items() if key and key.startswith(REPLICA_BIND_PREFIX)]
+            if replicas:
+                return random.choice(replicas)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _recent_writers():
+    writers = current_app.extensions.get('recent_writers')
+    if writers is None:
+        writers = TTLCache(
+            max_size=RECENT_WRITERS_MAX_SIZE,
+            ttl=current_app.config.get('READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS),
+        )
+        current_app.extensions['recent_writers'] = writers
+    return writers
+
+
+def note_write(user_id):
+    """Keep user_id's reads on the primary for READ_YOUR_WRITES_SECONDS."""
+    _recent_writers().set(user_id, True)
+
+
+def wrote_recently(user_id):
+    if _recent_writers().get(user_id):
+        return True
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_replica(view):
+    """Serve an authenticated read-only view from a replica, unless the user just wrote."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from src import auth
+
+        user = auth.current_user()
+        g.read_replica = user is None or not wrote_recently(user.id)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def track_writes(response):
+    """after_request hook: start the read-your-writes window after a successful write."""
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+        return response
+    from src import auth
+
+    user = auth.current_user()
+    if user is not None:
+        window = current_app.config.get('READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS)
+        note_write(user.id)
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, f'{time.time() + window:.3f}', max_age=window, httponly=True)
+    return response
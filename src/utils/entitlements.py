@@ -0,0 +1,254 @@
+from array import array
+from flask import current_app, request
+from functools import wraps
+from sqlalchemy import and_, func, or_, select
+from threading import Event, Lock, Thread
+from datetime import datetime, timedelta
+from src.models import SubscriptionStatus, User, UserSubscription
+
+import hmac
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_OVERLAP_SECONDS = 10
+DEFAULT_REFRESH_SECONDS = 1.0
+SERVICE_TOKEN_HEADER = 'X-Service-Token'
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+# Slot layout: plan_id in the high 32 bits, end_date in the low 32 as epoch seconds.
+END_BITS = 32
+END_MASK = (1 << END_BITS) - 1
+NO_END = END_MASK
+# Slots added at a time when a user id past the end shows up.
+GROWTH = 4096
+
+_index_lock = Lock()
+
+
+def encode_slot(plan_id, end_date):
+    if end_date is None:
+        end = NO_END
+    else:
+        # Rounded up: an entitlement may outlive its end_date by under a second, never the reverse.
+        end = min(max(-((EPOCH - end_date) // SECOND), 1), NO_END - 1)
+    return plan_id << END_BITS | end
+
+
+class EntitlementIndex:
+    """
+    user_id -> (plan_id, end_date) of every ACTIVE subscription, answered from memory:
+    - One array('Q') slot per user id holding plan_id << 32 | end_date in epoch seconds
+      (0xFFFFFFFF: no end_date), 0 when the user has no ACTIVE row. 8 bytes per user
+      id up to the highest one and no Python object per user, so a preloaded index
+      stays shared, copy-on-write, between forked workers
+    - A slot is one machine word, read and written whole, so lookups take no lock
+    - load() builds a new array from one scan of the ACTIVE rows and swaps it in
+    - refresh() follows user_subscriptions from a (updated_at, id) watermark, starting
+      overlap_seconds before it so rows committed late with an older updated_at are
+      still seen, and re-reads the ACTIVE row of every user it sees change
+    - Expiry needs no refresh: lookup() compares end_date with the clock
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, overlap_seconds=DEFAULT_OVERLAP_SECONDS, clock=time.time):
+        self.batch_size = batch_size
+        self.overlap_seconds = overlap_seconds
+        self._clock = clock
+        self._lock = Lock()
+        self.slots = array('Q')
+        self.watermark = None
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    def lookup(self, user_id, now=None):
+        """(plan_id, end_date epoch seconds or None) of user_id's entitlement, or None."""
+        slots = self.slots
+        slot = slots[user_id] if 0 <= user_id < len(slots) else 0
+        if not slot:
+            return None
+        end = slot & END_MASK
+        if end == NO_END:
+            return slot >> END_BITS, None
+        if end <= (self._clock() if now is None else now):
+            return None
+        return slot >> END_BITS, end
+
+    def memory_bytes(self):
+        return len(self.slots) * self.slots.itemsize
+
+    def stats(self):
+        return {
+            'slots': len(self.slots),
+            'memory_bytes': self.memory_bytes(),
+            'loaded_at': self.loaded_at,
+            'refreshed_at': self.refreshed_at,
+        }
+
+    def _store(self, slots, user_id, value):
+        if user_id >= len(slots):
+            if not value:
+                return
+            slots.frombytes(bytes(slots.itemsize * (user_id + GROWTH - len(slots))))
+        slots[user_id] = value
+
+    def load(self, session):
+        """Rebuild from one scan of the ACTIVE rows; returns the number of entitlements."""
+        with self._lock:
+            # Taken before the scan: rows changing during it are picked up by the next refresh.
+            mark = session.execute(
+                select(UserSubscription.updated_at, UserSubscription.id)
+                .where(UserSubscription.updated_at.isnot(None))
+                .order_by(UserSubscription.updated_at.desc(), UserSubscription.id.desc())
+                .limit(1)
+            ).first()
+            highest = session.execute(select(func.max(User.id))).scalar() or 0
+            slots = array('Q', bytes(8 * (highest + 1)))
+            count = 0
+            rows = session.execute(
+                select(UserSubscription.user_id, UserSubscription.plan_id, UserSubscription.end_date)
+                .where(UserSubscription.status == SubscriptionStatus.ACTIVE),
+                execution_options={'yield_per': self.batch_size},
+            )
+            for user_id, plan_id, end_date in rows:
+                self._store(slots, user_id, encode_slot(plan_id, end_date))
+                count += 1
+            session.rollback()
+            self.slots = slots
+            self.watermark = tuple(mark) if mark else None
+            self.loaded_at = self.refreshed_at = self._clock()
+            return count
+
+    def refresh(self, session, max_batches=None):
+        """Apply rows changed since the watermark; returns a dict with rows, users and batches."""
+        with self._lock:
+            started = time.perf_counter()
+            cursor = (self.watermark[0] - timedelta(seconds=self.overlap_seconds), 0) if self.watermark else None
+            rows = batches = 0
+            users = set()
+            while max_batches is None or batches < max_batches:
+                query = select(UserSubscription.user_id, UserSubscription.updated_at, UserSubscription.id) \
+                    .where(UserSubscription.updated_at.isnot(None))
+                if cursor is not None:
+                    query = query.where(or_(
+                        UserSubscription.updated_at > cursor[0],
+                        and_(UserSubscription.updated_at == cursor[0], UserSubscription.id > cursor[1]),
+                    ))
+                batch = session.execute(
+                    query.order_by(UserSubscription.updated_at, UserSubscription.id).limit(self.batch_size)
+                ).all()
+                if not batch:
+                    break
+                changed = {row.user_id for row in batch}
+                # The rows say who changed; the users' current ACTIVE rows say what they have now.
+                active = {
+                    user_id: encode_slot(plan_id, end_date)
+                    for user_id, plan_id, end_date in session.execute(
+                        select(UserSubscription.user_id, UserSubscription.plan_id, UserSubscription.end_date)
+                        .where(UserSubscription.user_id.in_(changed), UserSubscription.status == SubscriptionStatus.ACTIVE)
+                    )
+                }
+                for user_id in changed:
+                    self._store(self.slots, user_id, active.get(user_id, 0))
+                last = batch[-1]
+                cursor = (last.updated_at, last.id)
+                if self.watermark is None or cursor > self.watermark:
+                    self.watermark = cursor
+                rows += len(batch)
+                users |= changed
+                batches += 1
+                if len(batch) < self.batch_size:
+                    break
+            session.rollback()
+            self.refreshed_at = self._clock()
+            return {'rows': rows, 'users': len(users), 'batches': batches, 'duration_seconds': time.perf_counter() - started}
+
+
+class EntitlementRefresher:
+    """Runs EntitlementIndex.refresh every interval seconds on a daemon thread."""
+
+    def __init__(self, app, db, index, interval):
+        self.app = app
+        self.db = db
+        self.index = index
+        self.interval = interval
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='entitlement-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        db = self.db
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.index.refresh(db.session)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Entitlement refresh failed')
+                finally:
+                    db.session.remove()
+
+
+def load_entitlement_index(app, db):
+    """Build and load app's index, e.g. in a pre-forking master so every worker inherits it."""
+    index = EntitlementIndex(
+        batch_size=app.config.get('ENTITLEMENT_REFRESH_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        overlap_seconds=app.config.get('ENTITLEMENT_REFRESH_OVERLAP_SECONDS', DEFAULT_OVERLAP_SECONDS),
+    )
+    with app.app_context():
+        try:
+            count = index.load(db.session)
+        finally:
+            db.session.remove()
+    logger.info('Loaded %s entitlements (%s bytes)', count, index.memory_bytes())
+    app.extensions['entitlement_index'] = index
+    return index
+
+
+def get_entitlement_index(app=None):
+    """
+    The app's index, loaded on first use if nothing preloaded it, with a refresher
+    running in this process. The refresher is per process (fork_safety drops it), so a
+    forked worker starts its own on its first lookup.
+    """
+    app = app or current_app
+    index = app.extensions.get('entitlement_index')
+    interval = app.config.get('ENTITLEMENT_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    if index is not None and (not interval or 'entitlement_refresher' in app.extensions):
+        return index
+    from src import db
+
+    with _index_lock:
+        index = app.extensions.get('entitlement_index') or load_entitlement_index(app, db)
+        if interval and 'entitlement_refresher' not in app.extensions:
+            app.extensions['entitlement_refresher'] = EntitlementRefresher(app, db, index, interval).start()
+    return index
+
+
+def service_tokens(app=None):
+    app = app or current_app
+    return [token.strip() for token in (app.config.get('ENTITLEMENT_SERVICE_TOKENS') or '').split(',') if token.strip()]
+
+
+def service_token_required(view):
+    """Admit callers sending one of ENTITLEMENT_SERVICE_TOKENS in X-Service-Token; none configured admits nobody."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        presented = request.headers.get(SERVICE_TOKEN_HEADER, '').encode('utf-8')
+        if not presented or not any(hmac.compare_digest(presented, token.encode('utf-8')) for token in service_tokens()):
+            return {'message': 'Invalid service token'}, 401
+        return view(*args, **kwargs)
+    return wrapper
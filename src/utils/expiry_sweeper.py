@@ -0,0 +1,173 @@
+from sqlalchemy import delete, select, update
+from threading import Event, Lock, Thread
+from datetime import datetime
+from types import SimpleNamespace
+from src.models import SubscriptionStatus, UserCurrentSubscription, UserSubscription
+from src.utils.outbox import SUBSCRIPTION_EXPIRED, record_events, subscription_payload
+from src.utils.subscription_versions import bump_subscription_versions
+
+import logging
+import time
+
+DEFAULT_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class SweepMetrics:
+    """Counters for the expiry sweeper, read by monitoring."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.sweeps = 0
+        self.rows_total = 0
+        self.last_rows = 0
+        self.last_batches = 0
+        self.last_lag_seconds = 0.0
+        self.last_duration_seconds = 0.0
+        self.last_run_at = None
+
+    def record(self, rows, batches, lag_seconds, duration_seconds, run_at):
+        with self._lock:
+            self.sweeps += 1
+            self.rows_total += rows
+            self.last_rows = rows
+            self.last_batches = batches
+            self.last_lag_seconds = lag_seconds
+            self.last_duration_seconds = duration_seconds
+            self.last_run_at = run_at
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'sweeps': self.sweeps,
+                'rows_total': self.rows_total,
+                'last_rows': self.last_rows,
+                'last_batches': self.last_batches,
+                'last_lag_seconds': self.last_lag_seconds,
+                'last_duration_seconds': self.last_duration_seconds,
+                'last_run_at': self.last_run_at,
+            }
+
+
+metrics = SweepMetrics()
+
+
+def expired_subscriptions_query(now, batch_size=DEFAULT_BATCH_SIZE):
+    """The sweeper's candidate SELECT: the oldest batch of ACTIVE rows past their end_date."""
+    return (
+        select(UserSubscription.id, UserSubscription.user_id, UserSubscription.end_date)
+        .where(UserSubscription.status == SubscriptionStatus.ACTIVE, UserSubscription.end_date <= now)
+        .order_by(UserSubscription.end_date)
+        .limit(batch_size)
+    )
+
+
+def sweep_expired_subscriptions(session, batch_size=DEFAULT_BATCH_SIZE, max_batches=None, now=None):
+    """
+    Flip ACTIVE subscriptions whose end_date has passed to INACTIVE:
+    - Candidates come from idx_user_subscriptions_status_end_date, oldest first
+    - Each batch is its own short transaction, so row locks are held briefly
+    - The candidates still ACTIVE are locked and re-read first, so rows cancelled or
+      replaced concurrently are left alone
+    - Only the owners of flipped rows get their subscription versions bumped, since
+      only their payloads just changed, and each flipped row gets a subscription.expired
+      event in the same transaction
+    Returns a dict with rows, batches and lag (age of the oldest expired row found).
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    rows = 0
+    batches = 0
+    lag_seconds = 0.0
+    while max_batches is None or batches < max_batches:
+        expired = session.execute(expired_subscriptions_query(now, batch_size)).all()
+        if not expired:
+            break
+        if batches == 0:
+            lag_seconds = (now - expired[0].end_date).total_seconds()
+
+        # A candidate cancelled (and perhaps replaced) since the SELECT above is no longer
+        # ACTIVE; bumping its owner would clear the expiry of their new subscription's ETag.
+        flipped = session.execute(
+            select(UserSubscription.id, UserSubscription.user_id, UserSubscription.plan_id,
+                   UserSubscription.start_date, UserSubscription.end_date)
+            .where(UserSubscription.id.in_([row.id for row in expired]), UserSubscription.status == SubscriptionStatus.ACTIVE)
+            .with_for_update()
+        ).all()
+        ids = [row.id for row in flipped]
+        if ids:
+            session.execute(
+                update(UserSubscription)
+                .where(UserSubscription.id.in_(ids))
+                .values(status=SubscriptionStatus.INACTIVE, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            session.execute(
+                delete(UserCurrentSubscription)
+                .where(UserCurrentSubscription.subscription_id.in_(ids), UserCurrentSubscription.end_date <= now)
+                .execution_options(synchronize_session=False)
+            )
+            bump_subscription_versions(session, {row.user_id: None for row in flipped})
+            record_events(session, [
+                (SUBSCRIPTION_EXPIRED, subscription_payload(SimpleNamespace(**row._mapping, status=SubscriptionStatus.INACTIVE)), row.user_id)
+                for row in flipped
+            ], now)
+        session.commit()
+        rows += len(ids)
+        batches += 1
+        if len(expired) < batch_size:
+            break
+
+    duration = time.perf_counter() - started
+    metrics.record(rows, batches, lag_seconds, duration, now)
+    return {'rows': rows, 'batches': batches, 'lag_seconds': lag_seconds, 'duration_seconds': duration}
+
+
+class ExpirySweeper:
+    """Runs sweep_expired_subscriptions every interval seconds on a daemon thread."""
+
+    def __init__(self, app, db, interval, batch_size=DEFAULT_BATCH_SIZE):
+        self.app = app
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        db = self.db
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    result = sweep_expired_subscriptions(db.session, batch_size=self.batch_size)
+                    if result['rows']:
+                        logger.info('Expired %s subscriptions in %s batches', result['rows'], result['batches'])
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Expiry sweep failed')
+                finally:
+                    db.session.remove()
+
+
+def start_expiry_sweeper(app, db):
+    sweeper = ExpirySweeper(
+        app,
+        db,
+        interval=app.config['EXPIRY_SWEEP_INTERVAL_SECONDS'],
+        batch_size=app.config.get('EXPIRY_SWEEP_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+    )
+    app.extensions['expiry_sweeper'] = sweeper
+    return sweeper.start()
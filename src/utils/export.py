@@ -0,0 +1,128 @@
+from collections import namedtuple
+from enum import Enum
+from sqlalchemy import select
+from datetime import date, datetime
+from src.models import ArchivedSubscription, SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.utils.serialization import compile_row_encoder
+
+import csv
+import io
+import zlib
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_GZIP_LEVEL = 6
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+DATE_FIELDS = ('start_date', 'end_date', 'created_at', 'updated_at')
+
+EXPORT_FIELDS = (
+    'subscription_id', 'user_id', 'username', 'email', 'plan_id', 'plan_name', 'price',
+    'status', 'start_date', 'end_date', 'created_at', 'updated_at',
+)
+encode_export_row = compile_row_encoder(EXPORT_FIELDS, 'export_row')
+
+ExportFilters = namedtuple('ExportFilters', ['statuses', 'date_field', 'since', 'until'])
+
+
+def _parse_datetime(value, name):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError as exc:
+        raise ValueError(f'{name} must be an ISO 8601 date or datetime') from exc
+
+
+def parse_export_filters(status=None, date_field=None, since=None, until=None):
+    """
+    Validate export filters, raises ValueError on bad input:
+    - status: comma-separated SubscriptionStatus names, e.g. "ACTIVE,CANCELLED"
+    - date_field: the column since (inclusive) and until (exclusive) apply to
+    """
+    statuses = []
+    for name in filter(None, (part.strip().upper() for part in (status or '').split(','))):
+        if name not in SubscriptionStatus.__members__:
+            raise ValueError(f"status must be among {', '.join(SubscriptionStatus.__members__)}")
+        statuses.append(SubscriptionStatus[name])
+    date_field = date_field or 'start_date'
+    if date_field not in DATE_FIELDS:
+        raise ValueError(f"date_field must be one of {', '.join(DATE_FIELDS)}")
+    return ExportFilters(tuple(statuses), date_field, _parse_datetime(since, 'from'), _parse_datetime(until, 'to'))
+
+
+def export_query(filters, model=UserSubscription):
+    """user_subscriptions (or its archive) joined with users and plans, in primary-key order (no sort)."""
+    query = (
+        select(
+            model.id, model.user_id, User.username, User.email,
+            model.plan_id, SubscriptionPlan.name, SubscriptionPlan.price, model.status,
+            model.start_date, model.end_date, model.created_at, model.updated_at,
+        )
+        .join(User, User.id == model.user_id)
+        .join(SubscriptionPlan, SubscriptionPlan.id == model.plan_id)
+        .order_by(model.id)
+    )
+    if filters.statuses:
+        query = query.where(model.status.in_(filters.statuses))
+    column = getattr(model, filters.date_field)
+    if filters.since:
+        query = query.where(column >= filters.since)
+    if filters.until:
+        query = query.where(column < filters.until)
+    return query
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _ndjson_chunk(rows):
+    return ''.join([encode_export_row(row) + '\n' for row in rows])
+
+
+def _csv_writer():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def write(rows):
+        writer.writerows([[_csv_value(value) for value in row] for row in rows])
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    return write
+
+
+def iter_export(session, filters, fmt='ndjson', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the export as text chunks, one per fetched batch of chunk_size rows:
+    - stream_results asks for a server-side cursor (MySQL SSCursor), so neither the
+      driver nor SQLAlchemy buffers the whole result; memory stays flat
+    - NDJSON rows use the same compiled encoder style (and HTTP dates) as the API;
+      CSV has a header row and ISO 8601 dates
+    - Hot rows come first, then archived ones, each in id order; one cursor at a time
+    """
+    if fmt == 'csv':
+        encode = _csv_writer()
+        yield encode([EXPORT_FIELDS])
+    else:
+        encode = _ndjson_chunk
+    for model in (UserSubscription, ArchivedSubscription):
+        result = session.execute(export_query(filters, model), execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            for rows in result.partitions():
+                yield encode(rows)
+        finally:
+            result.close()
+
+
+def gzip_chunks(chunks, level=DEFAULT_GZIP_LEVEL):
+    """Compress a stream of text chunks into one gzip member, chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,52 @@
+from weakref import WeakKeyDictionary
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# app.extensions entries owning processes, threads or connections of the process that
+# built them; a forked child drops them and builds its own on first use.
+PER_PROCESS_EXTENSIONS = (
+    'password_hasher', 'async_sessionmakers', 'entitlement_refresher',
+    'background_threads', 'expiry_sweeper', 'outbox_relay', 'outbox_queue',
+)
+
+_apps = WeakKeyDictionary()
+
+
+def reset_after_fork(app, db):
+    """
+    Run in a freshly forked child, before it serves anything:
+    - Every engine's pool is replaced without closing the inherited connections, which
+      still belong to the parent (engine.dispose(close=False)); the child opens its own
+    - Per-process extensions (the password hashing pool, async engines, the
+      entitlement refresher, sweeper and relay threads) are dropped
+    Caches and limiters stay: a copy-on-write warm cache is one point of preloading.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    for name in PER_PROCESS_EXTENSIONS:
+        app.extensions.pop(name, None)
+
+
+def _after_fork_in_child():
+    for app, db in list(_apps.items()):
+        try:
+            reset_after_fork(app, db)
+        except Exception:
+            logger.exception('Resetting %s after fork failed', app.name)
+
+
+def register_fork_safety(app, db):
+    """
+    Reset app in every child forked after this call: gunicorn --preload workers,
+    uWSGI without lazy-apps, multiprocessing's fork start method. Hooks os.fork itself,
+    so no server-specific post_fork hook is needed.
+    """
+    _apps[app] = db
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
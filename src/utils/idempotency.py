@@ -0,0 +1,145 @@
+from flask import current_app, jsonify, make_response, request
+from functools import wraps
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from src.models import IdempotencyKey
+from src.utils.cache import TTLCache
+
+import hashlib
+import secrets
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL_SECONDS = 86400
+# How long an unfinished claim holds its key. Longer than any request may run
+# (GUNICORN_TIMEOUT), so only a claim whose worker died is ever taken over.
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_CACHE_MAX_SIZE = 10000
+IN_PROGRESS_RETRY_AFTER_SECONDS = 1
+# Outcomes a client is expected to retry are not kept, so the retry can run for real.
+RETRYABLE_STATUSES = (409, 423, 429)
+
+
+def _request_fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_idempotency_cache():
+    cache = current_app.extensions.get('idempotency_cache')
+    if cache is None:
+        cache = TTLCache(
+            max_size=current_app.config.get('IDEMPOTENCY_CACHE_MAX_SIZE', DEFAULT_CACHE_MAX_SIZE),
+            ttl=current_app.config.get('IDEMPOTENCY_KEY_TTL_SECONDS', DEFAULT_TTL_SECONDS),
+        )
+        current_app.extensions['idempotency_cache'] = cache
+    return cache
+
+
+def _replay(fingerprint, status_code, body):
+    if fingerprint != _request_fingerprint():
+        return jsonify({'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+    response = current_app.response_class(body, status=status_code, mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _reserve(session, user_id, key, fingerprint, claim, now, lease):
+    """
+    Claim (user_id, key) with a committed in-progress row held for lease seconds and
+    tagged with the claim token.
+    Returns None when claimed, otherwise the stored row another request left
+    (finished or still running). A finished row past its TTL, or an in-progress one
+    past its lease (its worker was killed mid-request), is taken over.
+    """
+    for _ in range(2):
+        session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, claim=claim, created_at=now,
+                                   expires_at=now + timedelta(seconds=lease)))
+        try:
+            session.commit()
+            return None
+        except IntegrityError:
+            session.rollback()
+        stored = session.get(IdempotencyKey, (user_id, key), populate_existing=True)
+        if stored is None or stored.expires_at > now:
+            return stored
+        # Past its TTL or lease: drop it and claim the key afresh.
+        session.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.expires_at <= now))
+        session.commit()
+    return session.get(IdempotencyKey, (user_id, key))
+
+
+def idempotent(view):
+    """
+    Honor an Idempotency-Key header on an authenticated write view:
+    - The first request claims the key in idempotency_keys, then stores its response
+    - Retries with the same key and body get that response back without running the view,
+      from this worker's memory when possible, otherwise from the table
+    - A retry arriving while the first request still runs gets 409 with Retry-After; the
+      claim is a lease of IDEMPOTENCY_LEASE_SECONDS, so a request whose worker died
+      blocks its key only that long
+    - Server errors and retryable statuses release the key instead of being stored
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        from src import auth, db
+
+        user_id = auth.current_user().id
+        cache = get_idempotency_cache()
+        cached = cache.get((user_id, key))
+        if cached is not None:
+            return _replay(*cached)
+
+        fingerprint = _request_fingerprint()
+        ttl = current_app.config.get('IDEMPOTENCY_KEY_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+        lease = current_app.config.get('IDEMPOTENCY_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+        now = datetime.utcnow()
+        claim = secrets.token_hex(16)
+        stored = _reserve(db.session, user_id, key, fingerprint, claim, now, lease)
+        if stored is not None:
+            if stored.status_code is None:
+                response = make_response(({'message': 'A request with this Idempotency-Key is in progress'}, 409))
+                response.headers['Retry-After'] = str(IN_PROGRESS_RETRY_AFTER_SECONDS)
+                return response
+            return _replay(stored.fingerprint, stored.status_code, stored.body)
+
+        # The token tells this claim apart from one that took the key over after our lease ran
+        # out. Not created_at: MySQL DATETIME drops the microseconds it would be matched on.
+        claimed = (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.claim == claim)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(*claimed))
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+            db.session.execute(delete(IdempotencyKey).where(*claimed))
+        else:
+            body = response.get_data(as_text=True)
+            db.session.execute(update(IdempotencyKey).where(*claimed).values(
+                status_code=response.status_code, body=body, expires_at=now + timedelta(seconds=ttl)))
+            cache.set((user_id, key), (fingerprint, response.status_code, body))
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def purge_expired_idempotency_keys(session, now=None):
+    """Delete keys past their TTL; returns the number of rows removed."""
+    result = session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= (now or datetime.utcnow())))
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,7 @@
+from collections import namedtuple
+
+
+# Lightweight stand-in for the User row once credentials have been verified.
+# Routes only need id and username, so holding this instead of an ORM instance
+# lets it outlive the session it was loaded in (caches, token claims).
+AuthenticatedUser = namedtuple('AuthenticatedUser', ['id', 'username'])
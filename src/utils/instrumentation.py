@@ -0,0 +1,194 @@
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+
+import heapq
+import logging
+import re
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+DEFAULT_SLOW_REQUEST_SECONDS = 1.0
+SLOWEST_STATEMENTS = 3
+
+logger = logging.getLogger(__name__)
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_list = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|:\w+)\s*,?)+\)', re.IGNORECASE)
+_whitespace = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Normalize a statement so executions differing only in parameters compare equal."""
+    shape = _string_literal.sub('?', statement)
+    shape = _number_literal.sub('?', shape)
+    shape = _in_list.sub('IN (...)', shape)
+    return _whitespace.sub(' ', shape).strip()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class RequestQueryStats:
+    """SQL executed while serving one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+        self.slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement_shape(statement)] += 1
+        entry = (duration, statement)
+        if len(self.slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def repeated_shapes(self, threshold):
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+class MetricsRegistry:
+    """Per-endpoint request latency, query count and DB time, plus N+1 detections."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.latency = {}
+        self.queries = {}
+        self.db_time = {}
+        self.requests = Counter()
+        self.n_plus_one = Counter()
+
+    def observe_request(self, endpoint, status_code, duration, stats, repeated):
+        with self._lock:
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.count)
+            self.db_time.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(stats.total_time)
+            self.requests[(endpoint, status_code)] += 1
+            if repeated:
+                self.n_plus_one[endpoint] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            render_histograms(lines, 'http_request_duration_seconds', 'Request latency per endpoint.', self.latency)
+            render_histograms(lines, 'db_queries_per_request', 'SQL statements executed per request.', self.queries)
+            render_histograms(lines, 'db_time_per_request_seconds', 'Time spent in SQL per request.', self.db_time)
+            lines.append('# HELP http_requests_total Requests per endpoint and status.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, status_code), value in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",status="{status_code}"}} {value}')
+            lines.append('# HELP db_n_plus_one_requests_total Requests that repeated one statement shape past the threshold.')
+            lines.append('# TYPE db_n_plus_one_requests_total counter')
+            for endpoint, value in sorted(self.n_plus_one.items()):
+                lines.append(f'db_n_plus_one_requests_total{{endpoint="{endpoint}"}} {value}')
+        return lines
+
+
+def render_histograms(lines, name, help_text, histograms, labels='endpoint'):
+    """Append a histogram family; histograms maps a label value to a Histogram."""
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in sorted(histograms.items()):
+        for bound, value in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels}="{key}",le="{bound}"}} {value}')
+        lines.append(f'{name}_bucket{{{labels}="{key}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}="{key}"}} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}="{key}"}} {histogram.count}')
+
+
+def render_gauges(lines, name, help_text, values, labels=None):
+    """Append a gauge family; values maps a label value (or None) to a number."""
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} gauge')
+    for key, value in values.items():
+        label = f'{{{labels}="{key}"}}' if labels else ''
+        lines.append(f'{name}{label} {value}')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn.info['query_start_time'].pop(), statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time so the
+    # next statement on this connection is not timed from it.
+    started = context.connection.info.get('query_start_time') if context.connection is not None else None
+    if context.execution_context is not None and started:
+        _record_statement(started.pop(), context.statement)
+
+
+def _record_statement(started, statement):
+    if has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+
+def get_metrics_registry():
+    registry = current_app.extensions.get('metrics_registry')
+    if registry is None:
+        registry = current_app.extensions['metrics_registry'] = MetricsRegistry()
+    return registry
+
+
+def _start_request():
+    g.sql_stats = RequestQueryStats()
+    g.request_started = time.perf_counter()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    started = g.pop('request_started', None)
+    if stats is None or started is None:
+        return response
+
+    duration = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    repeated = stats.repeated_shapes(threshold)
+    for shape, count in repeated.items():
+        logger.warning('Possible N+1 on %s %s: statement ran %s times: %s', request.method, endpoint, count, shape)
+
+    get_metrics_registry().observe_request(endpoint, response.status_code, duration, stats, repeated)
+    if duration >= current_app.config.get('SLOW_REQUEST_SECONDS', DEFAULT_SLOW_REQUEST_SECONDS):
+        for query_duration, statement in sorted(stats.slowest, reverse=True):
+            logger.warning('Slow request %s %s (%.3fs): %.3fs in %s', request.method, endpoint, duration,
+                           query_duration, _whitespace.sub(' ', statement).strip())
+    response.headers['Server-Timing'] = f'db;dur={stats.total_time * 1000:.2f};desc="{stats.count} queries", app;dur={duration * 1000:.2f}'
+    return response
+
+
+def init_instrumentation(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,336 @@
+from collections import namedtuple
+from flask import current_app
+from queue import Queue
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
+from datetime import date, datetime, timedelta
+from src.models import OutboxEvent
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FEED_LIMIT = 100
+DEFAULT_FEED_MAX_LIMIT = 1000
+DEFAULT_FEED_MAX_WAIT_SECONDS = 20
+DEFAULT_FEED_POLL_SECONDS = 0.5
+DEFAULT_FEED_MAX_WAITERS = 3
+DEFAULT_RETENTION_DAYS = 7
+
+SUBSCRIPTION_CREATED = 'subscription.created'
+SUBSCRIPTION_UPGRADED = 'subscription.upgraded'
+SUBSCRIPTION_CANCELLED = 'subscription.cancelled'
+SUBSCRIPTION_EXPIRED = 'subscription.expired'
+PLAN_CREATED = 'plan.created'
+
+outbox = OutboxEvent.__table__
+FEED_COLUMNS = (outbox.c.id, outbox.c.sequence, outbox.c.event_type, outbox.c.user_id, outbox.c.created_at, outbox.c.payload)
+
+# What the relay hands to a sink: body is the event's wire JSON, the rest is routing
+# metadata (e.g. user_id as a partition key).
+PublishedEvent = namedtuple('PublishedEvent', ['id', 'sequence', 'event_type', 'user_id', 'created_at', 'body'])
+
+_notifier_lock = Lock()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def record_event(session, event_type, payload, user_id=None, now=None):
+    """
+    Queue one event in the caller's transaction, with a Core insert (no ORM object
+    to track). It commits or rolls back together with the change it describes.
+    """
+    record_events(session, [(event_type, payload, user_id)], now)
+
+
+def record_events(session, events, now=None):
+    """record_event() for many (event_type, payload, user_id) at once, as one executemany."""
+    if not events:
+        return
+    created_at = now or datetime.utcnow()
+    session.execute(insert(outbox), [{
+        'event_type': event_type,
+        'user_id': user_id,
+        'payload': json.dumps(payload, separators=(',', ':'), sort_keys=True, default=_json_default),
+        'created_at': created_at,
+    } for event_type, payload, user_id in events])
+
+
+def subscription_payload(subscription, previous=None):
+    payload = {
+        'subscription_id': subscription.id,
+        'user_id': subscription.user_id,
+        'plan_id': subscription.plan_id,
+        'status': subscription.status.name if subscription.status else None,
+        'start_date': subscription.start_date,
+        'end_date': subscription.end_date,
+    }
+    if previous is not None:
+        payload.update(previous_subscription_id=previous.id, previous_plan_id=previous.plan_id)
+    return payload
+
+
+def plan_payload(plan):
+    return {
+        'plan_id': plan.id,
+        'name': plan.name,
+        'price': plan.price,
+        'description': plan.description,
+        'duration_days': plan.duration_days,
+    }
+
+
+def encode_event(id, sequence, event_type, user_id, created_at, payload):
+    """Wire JSON of one event (FEED_COLUMNS order); payload is already JSON and is spliced in."""
+    return (
+        f'{{"created_at":{json.dumps(created_at.isoformat())},"data":{payload},"id":{id},'
+        f'"sequence":{json.dumps(sequence)},"type":{json.dumps(event_type)},"user_id":{json.dumps(user_id)}}}'
+    )
+
+
+class NDJSONFileSink:
+    """Appends each batch to a file, one event per line, synced before the batch commits."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, events):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(''.join(event.body + '\n' for event in events))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+class QueueSink:
+    """Puts each event, decoded, on an in-process queue; for local consumers and tests."""
+
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else Queue()
+
+    def publish(self, events):
+        for event in events:
+            self.queue.put(json.loads(event.body))
+
+
+class NullSink:
+    """Numbers events for the feed without sending them anywhere."""
+
+    def publish(self, events):
+        pass
+
+
+def make_sink(spec, app=None):
+    """
+    OUTBOX_SINK -> sink; anything with publish(events) can be passed to the relay instead:
+    - '' / 'none': feed only
+    - 'ndjson:<path>': append to a file
+    - 'queue': app.extensions['outbox_queue'], a queue.Queue shared within the process
+    """
+    kind, _, argument = (spec or 'none').partition(':')
+    if kind == 'none':
+        return NullSink()
+    if kind == 'ndjson' and argument:
+        return NDJSONFileSink(argument)
+    if kind == 'queue':
+        app = app or current_app
+        return QueueSink(app.extensions.setdefault('outbox_queue', Queue()))
+    raise ValueError(f"Unknown OUTBOX_SINK {spec!r}, expected 'none', 'ndjson:<path>' or 'queue'")
+
+
+def relay_outbox(session, sink, batch_size=DEFAULT_BATCH_SIZE, max_batches=None, now=None):
+    """
+    Publish unsequenced events in id order, one short transaction per batch:
+    - The batch is locked, numbered with the next run of sequence values, handed to
+      sink.publish() and only then committed: delivery is at-least-once, so consumers
+      dedupe on the event id (a failed commit means the batch is published again)
+    - sequence is unique: a second relay racing this one fails its commit and stops
+      rather than numbering the same rows twice
+    Returns a dict with rows, batches, last_sequence and duration.
+    """
+    started = time.perf_counter()
+    rows = batches = 0
+    last_sequence = None
+    while max_batches is None or batches < max_batches:
+        pending = session.execute(
+            select(*FEED_COLUMNS).where(outbox.c.sequence.is_(None)).order_by(outbox.c.id).limit(batch_size).with_for_update()
+        ).all()
+        if not pending:
+            session.rollback()
+            break
+        first = (session.execute(select(func.max(outbox.c.sequence))).scalar() or 0) + 1
+        published_at = now or datetime.utcnow()
+        events = [
+            PublishedEvent(row.id, first + offset, row.event_type, row.user_id, row.created_at,
+                           encode_event(row.id, first + offset, row.event_type, row.user_id, row.created_at, row.payload))
+            for offset, row in enumerate(pending)
+        ]
+        session.execute(
+            update(outbox).where(outbox.c.id == bindparam('b_id')).values(sequence=bindparam('b_sequence'), published_at=published_at),
+            [{'b_id': event.id, 'b_sequence': event.sequence} for event in events],
+        )
+        try:
+            sink.publish(events)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        rows += len(events)
+        batches += 1
+        last_sequence = events[-1].sequence
+        if len(events) < batch_size:
+            break
+    return {'rows': rows, 'batches': batches, 'last_sequence': last_sequence, 'duration_seconds': time.perf_counter() - started}
+
+
+def purge_published_events(session, older_than_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Delete events published more than older_than_days ago, in batches; returns the count."""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        ids = session.execute(
+            select(outbox.c.id).where(outbox.c.published_at < cutoff).order_by(outbox.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        session.execute(delete(outbox).where(outbox.c.id.in_(ids)))
+        session.commit()
+        deleted += len(ids)
+
+
+def read_feed(session, after, limit):
+    """Published events with sequence > after, oldest first, as feed rows."""
+    return session.execute(
+        select(*FEED_COLUMNS).where(outbox.c.sequence > after).order_by(outbox.c.sequence).limit(limit)
+    ).all()
+
+
+def latest_sequence(session):
+    """MAX(sequence) in its own short transaction, so a poller always sees fresh commits."""
+    try:
+        return session.execute(select(func.max(outbox.c.sequence))).scalar() or 0
+    finally:
+        session.rollback()
+
+
+class FeedNotifier:
+    """
+    Long-poll waits within one process:
+    - Waiters sleep on a condition the in-process relay signals as soon as it publishes
+    - Otherwise one waiter at a time re-reads latest_sequence() every poll_interval, so
+      any number of waiters cost one indexed MAX per interval, holding no connection
+      in between
+    - At most max_waiters requests wait at once; the rest get an empty answer at once
+      instead of tying up more request threads. Keep it below the server's threads per
+      process, or long-polls alone can take every thread (0 turns waiting off)
+    """
+
+    def __init__(self, poll_interval=DEFAULT_FEED_POLL_SECONDS, max_waiters=DEFAULT_FEED_MAX_WAITERS):
+        self.poll_interval = poll_interval
+        self.latest = 0
+        self._condition = Condition()
+        self._checked_at = None
+        self._waiters = BoundedSemaphore(max_waiters)
+
+    def notify(self, sequence):
+        with self._condition:
+            if sequence > self.latest:
+                self.latest = sequence
+            self._condition.notify_all()
+
+    def wait(self, after, timeout, read_latest):
+        """Block until an event past after is published or timeout passes; True if one was."""
+        if not self._waiters.acquire(blocking=False):
+            return False
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                with self._condition:
+                    now = time.monotonic()
+                    due = self._checked_at is None or now - self._checked_at >= self.poll_interval
+                    if due:
+                        self._checked_at = now
+                if due:
+                    self.notify(read_latest())
+                with self._condition:
+                    if self.latest > after:
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(min(remaining, self.poll_interval))
+        finally:
+            self._waiters.release()
+
+
+def get_feed_notifier(app=None):
+    app = app or current_app
+    notifier = app.extensions.get('outbox_feed_notifier')
+    if notifier is None:
+        with _notifier_lock:
+            notifier = app.extensions.get('outbox_feed_notifier')
+            if notifier is None:
+                notifier = FeedNotifier(
+                    poll_interval=app.config.get('OUTBOX_FEED_POLL_SECONDS', DEFAULT_FEED_POLL_SECONDS),
+                    max_waiters=app.config.get('OUTBOX_FEED_MAX_WAITERS', DEFAULT_FEED_MAX_WAITERS),
+                )
+                app.extensions['outbox_feed_notifier'] = notifier
+    return notifier
+
+
+class OutboxRelay:
+    """Runs relay_outbox every interval seconds on a daemon thread, waking local long-polls."""
+
+    def __init__(self, app, db, interval, sink, batch_size=DEFAULT_BATCH_SIZE):
+        self.app = app
+        self.db = db
+        self.interval = interval
+        self.sink = sink
+        self.batch_size = batch_size
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='outbox-relay', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        db = self.db
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    result = relay_outbox(db.session, self.sink, batch_size=self.batch_size)
+                    if result['last_sequence'] is not None:
+                        get_feed_notifier(self.app).notify(result['last_sequence'])
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Outbox relay failed')
+                finally:
+                    db.session.remove()
+
+
+def start_outbox_relay(app, db):
+    relay = OutboxRelay(
+        app,
+        db,
+        interval=app.config['OUTBOX_RELAY_INTERVAL_SECONDS'],
+        sink=make_sink(app.config.get('OUTBOX_SINK'), app),
+        batch_size=app.config.get('OUTBOX_RELAY_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+    )
+    app.extensions['outbox_relay'] = relay
+    return relay.start()
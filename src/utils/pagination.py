@@ -0,0 +1,91 @@
+from collections import namedtuple
+from flask import current_app, request, stream_with_context
+from sqlalchemy import and_, or_
+from src.utils.serialization import encode_rows, json_response
+from datetime import datetime
+from urllib.parse import urlencode
+
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 500
+
+Page = namedtuple('Page', ['limit', 'cursor', 'stream'])
+
+
+def encode_cursor(start_date, row_id):
+    """Opaque cursor pointing just past (start_date, id) in start_date DESC, id DESC order."""
+    raw = json.dumps([start_date.isoformat(), row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        start_date, row_id = json.loads(raw)
+        return datetime.fromisoformat(start_date), int(row_id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def parse_page_args():
+    """Read limit/cursor/stream from the query string, raises ValueError on bad input."""
+    max_size = current_app.config.get('HISTORY_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', DEFAULT_PAGE_SIZE)))
+    except ValueError as exc:
+        raise ValueError('limit must be an integer') from exc
+    if limit < 1 or limit > max_size:
+        raise ValueError(f'limit must be between 1 and {max_size}')
+
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    return Page(limit=limit, cursor=decode_cursor(cursor) if cursor else None, stream=stream)
+
+
+def keyset_before(start_date_column, id_column, cursor):
+    """Rows strictly after the cursor in (start_date DESC, id DESC) order."""
+    start_date, row_id = cursor
+    return or_(start_date_column < start_date, and_(start_date_column == start_date, id_column < row_id))
+
+
+def paginated_response(rows, page, encode, key):
+    """
+    Build the response for one page fetched with limit + 1 rows:
+    - The body stays a plain JSON list, each row turned into JSON text by encode
+    - X-Next-Cursor / Link carry the cursor for the following page, if any
+    """
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    response = json_response(encode_rows(rows, encode))
+    if has_more:
+        cursor = encode_cursor(*key(rows[-1]))
+        args = request.args.to_dict()
+        args.update(cursor=cursor, limit=page.limit)
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def stream_json_array(rows, encode):
+    """Stream rows as one JSON array, encoding one row at a time."""
+
+    def generate():
+        yield '['
+        for index, row in enumerate(rows):
+            yield (',' if index else '') + encode(row)
+        yield ']'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+
+async def stream_json_array_async(rows, encode):
+    """stream_json_array() for an async iterator; yields the encoded chunks."""
+    yield b'['
+    first = True
+    async for row in rows:
+        yield (b'' if first else b',') + encode(row).encode('utf-8')
+        first = False
+    yield b']'
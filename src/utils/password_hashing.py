@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as ResultTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import os
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_MAX_PENDING = 64
+DEFAULT_QUEUE_TIMEOUT = 0.5
+DEFAULT_RESULT_TIMEOUT = 10
+EXECUTORS = ('process', 'thread', 'inline')
+
+_hasher_lock = Lock()
+
+
+class HashingBusy(ServiceUnavailable):
+    """Every hashing slot is taken; the client should retry shortly."""
+
+    description = 'Password hashing is saturated, retry shortly'
+
+    def __init__(self, retry_after=1):
+        super().__init__(retry_after=retry_after)
+
+
+def method_prefix(password_hash):
+    return password_hash.split('$', 1)[0]
+
+
+@lru_cache(maxsize=8)
+def expanded_prefix(method):
+    """
+    werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); this is what it writes.
+    Costs one full hash, so it is cached per process (and warmed before a pre-fork).
+    """
+    return method_prefix(generate_password_hash('', method=method))
+
+
+# Run in the pool's workers, so they must stay importable top-level functions.
+
+def hash_password(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def verify_and_rehash(password_hash, password, method, current_prefix):
+    """(matches, new_hash): new_hash is set when the stored hash used other parameters."""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if method_prefix(password_hash) == current_prefix:
+        return True, None
+    return True, generate_password_hash(password, method=method)
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request thread:
+    - KDF calls run on a process pool (default), a thread pool, or inline
+    - At most max_pending calls are queued or running; a caller waits up to
+      queue_timeout for a slot and then gets HashingBusy (503 + Retry-After)
+    - A caller waiting more than result_timeout also gets HashingBusy, but its slot is
+      only freed when the call itself finishes, so max_pending stays a real bound
+    - A process pool broken by a killed worker (e.g. OOM) is replaced, and the calls
+      it took down get HashingBusy
+    - Hashes made with parameters other than method are flagged for rehashing
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, executor='process', workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING, queue_timeout=DEFAULT_QUEUE_TIMEOUT, result_timeout=DEFAULT_RESULT_TIMEOUT):
+        if executor not in EXECUTORS:
+            raise ValueError(f'PASSWORD_HASH_EXECUTOR must be one of {", ".join(EXECUTORS)}')
+        self.method = method
+        self.prefix = expanded_prefix(method)
+        self.queue_timeout = queue_timeout
+        self.result_timeout = result_timeout
+        self._slots = BoundedSemaphore(max_pending)
+        self._kind = executor
+        self._workers = workers
+        self._executor_lock = Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if self._kind == 'process':
+            return ProcessPoolExecutor(max_workers=self._workers)
+        if self._kind == 'thread':
+            return ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='password-hash')
+        return None
+
+    def _replace_broken(self, executor):
+        with self._executor_lock:
+            # Several callers may see the same broken pool; only the first replaces it.
+            if self._executor is executor:
+                self._executor = self._new_executor()
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, function, *args):
+        executor = self._executor
+        if executor is None:
+            return function(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._replace_broken(executor)
+            raise HashingBusy()
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.result_timeout)
+        except ResultTimeout:
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Returns (matches, new_hash); store new_hash when it is not None."""
+        return self._run(verify_and_rehash, password_hash, password, self.method, self.prefix)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        # Built once per worker process, after any pre-fork, and never twice: it owns a pool.
+        with _hasher_lock:
+            hasher = current_app.extensions.get('password_hasher')
+            if hasher is None:
+                config = current_app.config
+                hasher = PasswordHasher(
+                    method=config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+                    executor=config.get('PASSWORD_HASH_EXECUTOR', 'process'),
+                    workers=config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS),
+                    max_pending=config.get('PASSWORD_HASH_MAX_PENDING', DEFAULT_MAX_PENDING),
+                    queue_timeout=config.get('PASSWORD_HASH_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT),
+                )
+                current_app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def hashing_busy(error):
+    return {'message': error.description}, 503, {'Retry-After': str(error.retry_after)}
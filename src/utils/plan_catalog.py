@@ -0,0 +1,113 @@
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import insert, select, update
+from threading import Lock
+from src.models import PlanCatalogVersion, SubscriptionPlan
+
+import time
+
+DEFAULT_CHECK_SECONDS = 5
+CATALOG_VERSION_ROW = 1
+
+PlanSnapshot = namedtuple('PlanSnapshot', ['id', 'name', 'price', 'description', 'duration_days'])
+
+
+def _snapshot(plan):
+    return PlanSnapshot(plan.id, plan.name, plan.price, plan.description, plan.duration_days)
+
+
+class PlanCatalog:
+    """
+    Process-local copy of subscription_plans shared by every plan read:
+    - Loaded once, with the GET /plans body serialized up front
+    - Freshness is checked against the single plan_catalog_version row at most
+      once per check_interval, and the catalog reloads only when the version moved
+    - Plans unknown to the catalog fall back to a primary-key lookup, so a plan
+      created on another worker is usable before the next version check
+    """
+
+    def __init__(self, check_interval=DEFAULT_CHECK_SECONDS, clock=time.monotonic):
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = Lock()
+        self._next_check = 0
+        self.version = None
+        self.plans = {}
+        self.body = b'[]'
+
+    def _load(self, session, version):
+        self._install(session.query(SubscriptionPlan).order_by(SubscriptionPlan.id).all(), version)
+
+    def _install(self, plans, version):
+        snapshots = {plan.id: _snapshot(plan) for plan in plans}
+        self.body = current_app.json.dumps(
+            [snapshot._asdict() for snapshot in snapshots.values()], separators=(',', ':')
+        ).encode('utf-8')
+        self.plans = snapshots
+        self.version = version
+
+    def refresh(self, session):
+        if self._clock() < self._next_check:
+            return self
+        with self._lock:
+            if self._clock() < self._next_check:
+                return self
+            version = session.query(PlanCatalogVersion.version).filter_by(id=CATALOG_VERSION_ROW).scalar() or 0
+            if version != self.version:
+                self._load(session, version)
+            self._next_check = self._clock() + self.check_interval
+        return self
+
+    async def refresh_async(self, session):
+        """refresh() for an AsyncSession; the event loop is single-threaded, so no lock."""
+        if self._clock() < self._next_check:
+            return self
+        result = await session.execute(select(PlanCatalogVersion.version).filter_by(id=CATALOG_VERSION_ROW))
+        version = result.scalar() or 0
+        if version != self.version:
+            plans = await session.scalars(select(SubscriptionPlan).order_by(SubscriptionPlan.id))
+            self._install(plans.all(), version)
+        self._next_check = self._clock() + self.check_interval
+        return self
+
+    @property
+    def etag(self):
+        """Strong ETag of GET /plans: the body changes only with the catalog version."""
+        return f'plans.v{self.version}'
+
+    def get(self, session, plan_id):
+        plan = self.refresh(session).plans.get(plan_id)
+        if plan is not None:
+            return plan
+
+        plan = session.get(SubscriptionPlan, plan_id)
+        if plan is None:
+            return None
+        # Created elsewhere since our last load: re-check the version on next use.
+        self.invalidate()
+        return _snapshot(plan)
+
+    def as_list(self, session):
+        return [plan._asdict() for plan in self.refresh(session).plans.values()]
+
+    def invalidate(self):
+        self._next_check = 0
+
+
+def get_plan_catalog():
+    catalog = current_app.extensions.get('plan_catalog')
+    if catalog is None:
+        catalog = PlanCatalog(check_interval=current_app.config.get('PLAN_CATALOG_CHECK_SECONDS', DEFAULT_CHECK_SECONDS))
+        current_app.extensions['plan_catalog'] = catalog
+    return catalog
+
+
+def bump_catalog_version(session):
+    """Advance the catalog version inside the caller's transaction, so it commits with the plan write."""
+    result = session.execute(
+        update(PlanCatalogVersion)
+        .where(PlanCatalogVersion.id == CATALOG_VERSION_ROW)
+        .values(version=PlanCatalogVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(PlanCatalogVersion).values(id=CATALOG_VERSION_ROW, version=1))
@@ -1,16 +1,220 @@
-from src.database import db
-from sqlalchemy import text
+from src import db
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import NoSuchTableError
+from contextlib import contextmanager
+from datetime import datetime
+from src.utils.instrumentation import statement_shape
+
+import re
 import time
 
+_table_ref = re.compile(r'\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|INNER\b|ORDER\b|GROUP\b|LIMIT\b)(\w+))?', re.IGNORECASE)
+_where_clause = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+_order_clause = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+_comparison = re.compile(r'(?:`?(\w+)`?\.)?`?(\w+)`?\s*(=|<=|>=|<|>|\bIN\b|\bIS\b|\bBETWEEN\b)', re.IGNORECASE)
+_column_ref = re.compile(r'(?:`?(\w+)`?\.)?`?(\w+)`?')
+
+
+def dialect_name(session=None):
+    return (session or db.session).get_bind().dialect.name
+
+
+@contextmanager
+def capture_workload():
+    """
+    Record the distinct statement shapes executed inside the block, with the
+    DBAPI parameters of their first execution, ready to be EXPLAINed.
+    """
+    workload = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return
+        workload.setdefault(statement_shape(statement), (statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield workload
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+def explain(statement, params=None, session=None):
+    """
+    Run the dialect's EXPLAIN for a DBAPI-level statement and normalize the result:
+    - full_scans: tables read without an index
+    - filesort: ORDER BY needs a separate sort step
+    - temporary: GROUP BY/DISTINCT needs a temporary structure
+    Raises ValueError for dialects other than SQLite and MySQL.
+    """
+    session = session or db.session
+    dialect = dialect_name(session)
+    connection = session.connection()
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', params or ()).fetchall()
+        plan = [row[-1] for row in rows]
+        findings = sqlite_findings(plan)
+    elif dialect == 'mysql':
+        result = connection.exec_driver_sql(f'EXPLAIN {statement}', params or ())
+        plan = [dict(row._mapping) for row in result]
+        findings = mysql_findings(plan)
+    else:
+        raise ValueError(f'EXPLAIN is not supported for {dialect}')
+    return {'dialect': dialect, 'plan': plan, **findings}
+
+
+def sqlite_findings(plan):
+    full_scans = []
+    filesort = temporary = False
+    for detail in plan:
+        match = re.match(r'SCAN (?:TABLE )?(\w+)(.*)', detail)
+        if match and 'COVERING INDEX' not in match.group(2) and 'USING INDEX' not in match.group(2):
+            full_scans.append(match.group(1))
+        if 'USE TEMP B-TREE FOR ORDER BY' in detail or 'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY' in detail:
+            filesort = True
+        if 'USE TEMP B-TREE FOR GROUP BY' in detail or 'USE TEMP B-TREE FOR DISTINCT' in detail:
+            temporary = True
+    return {'full_scans': full_scans, 'filesort': filesort, 'temporary': temporary}
+
+
+def mysql_findings(plan):
+    full_scans = []
+    filesort = temporary = False
+    for row in plan:
+        extra = row.get('Extra') or ''
+        if (row.get('type') or '').upper() == 'ALL':
+            full_scans.append(row.get('table'))
+        filesort = filesort or 'Using filesort' in extra
+        temporary = temporary or 'Using temporary' in extra
+    return {'full_scans': full_scans, 'filesort': filesort, 'temporary': temporary}
+
+
+def _aliases(statement):
+    aliases = {}
+    for table, alias in _table_ref.findall(statement):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+def _columns_by_table(clause, aliases, pattern):
+    """Columns referenced in a clause, grouped per table, in order of appearance."""
+    single_table = next(iter(set(aliases.values()))) if len(set(aliases.values())) == 1 else None
+    found = {}
+    for match in pattern.finditer(clause):
+        qualifier, column = match.group(1), match.group(2)
+        table = aliases.get(qualifier) if qualifier else single_table
+        if table and column.upper() not in ('AND', 'OR', 'NOT', 'NULL', 'ASC', 'DESC', 'IS'):
+            found.setdefault(table, []).append((column, match.group(3).upper() if match.lastindex >= 3 else None))
+    return found
+
+
+def suggest_index(statement, table):
+    """
+    Composite index for one table of a statement: equality predicates first, then
+    either the ORDER BY columns (so the sort disappears) or the first range column.
+    Returns the column list, or None when the statement gives nothing to index.
+    """
+    aliases = _aliases(statement)
+    where = _where_clause.search(statement)
+    order = _order_clause.search(statement)
+    predicates = _columns_by_table(where.group(1), aliases, _comparison).get(table, []) if where else []
+    order_columns = [column for column, _ in _columns_by_table(order.group(1), aliases, _column_ref).get(table, [])] if order else []
+
+    columns = []
+    for column, operator in predicates:
+        if operator in ('=', 'IN', 'IS') and column not in columns:
+            columns.append(column)
+    ranges = [column for column, operator in predicates if operator not in ('=', 'IN', 'IS') and column not in columns]
+    if order_columns:
+        columns.extend(column for column in order_columns if column not in columns)
+    elif ranges:
+        columns.append(ranges[0])
+    return columns or None
+
+
+def existing_indexes(table, session=None):
+    """
+    Column lists of the primary key, unique constraints and indexes present in the
+    database. Not those declared in src/models.py: without migrations, an index declared
+    there may never have been created, and that is exactly where a suggestion is due.
+    """
+    inspector = inspect((session or db.session).get_bind())
+    try:
+        indexes = [inspector.get_pk_constraint(table)['constrained_columns']]
+        indexes.extend(constraint['column_names'] for constraint in inspector.get_unique_constraints(table))
+        indexes.extend(index['column_names'] for index in inspector.get_indexes(table))
+    except NoSuchTableError:
+        return []
+    return indexes
+
+
+def is_covered(columns, indexes):
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def analyze_workload(workload, session=None):
+    """EXPLAIN every captured statement and attach index suggestions for scans and sorts."""
+    reports = []
+    for shape, (statement, params) in workload.items():
+        report = explain(statement, params, session=session)
+        suggestions = []
+        # MySQL's EXPLAIN names tables by their alias in the statement (us, sp).
+        aliases = _aliases(statement)
+        tables = list(dict.fromkeys(aliases.get(table, table) for table in report['full_scans']))
+        if report['filesort'] or report['temporary']:
+            tables.extend(set(aliases.values()) - set(tables))
+        for table in tables:
+            columns = suggest_index(statement, table)
+            if columns and not is_covered(columns, existing_indexes(table, session)):
+                suggestions.append({
+                    'table': table,
+                    'columns': columns,
+                    'ddl': f"CREATE INDEX idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})",
+                })
+        report.update(statement=shape, suggestions=suggestions)
+        reports.append(report)
+    return reports
+
+
+def capture_route_workload(app, user_id):
+    """Run the read paths the API serves for one user and capture the SQL they emit."""
+    from src.routes import (
+        get_active_subscriptions_optimized_user,
+        get_active_subscriptions_user,
+        get_all_plans,
+        get_subscription_history_optimized_user,
+        get_subscription_history_user,
+    )
+    from src.utils.expiry_sweeper import expired_subscriptions_query
+
+    # Start cold so cached paths still reach the database.
+    for name in ('plan_catalog', 'active_subscription_cache'):
+        app.extensions.pop(name, None)
+
+    with capture_workload() as workload, app.test_request_context('/'):
+        get_all_plans()
+        get_active_subscriptions_user(user_id)
+        get_active_subscriptions_optimized_user(user_id)
+        get_subscription_history_user(user_id)
+        get_subscription_history_optimized_user(user_id)
+        # Only the sweeper's candidate SELECT: a real sweep would flip rows and record
+        # itself in the sweeper metrics.
+        db.session.execute(expired_subscriptions_query(datetime.utcnow())).all()
+        db.session.rollback()
+    return workload
+
 
 def analyze_query_performance(query, params=None):
     """Analyze and optimize query performance"""
     if params is None:
         params = {}
 
-    # Explain query plan
-    explain_query = f"EXPLAIN QUERY PLAN {query}"
-    plan = db.session.execute(text(explain_query), params).fetchall()
+    # Explain query plan with the dialect's own EXPLAIN
+    compiled = text(query).bindparams(**params).compile(dialect=db.session.get_bind().dialect, compile_kwargs={'literal_binds': True})
+    plan = explain(str(compiled))
 
     # Execute and time the query
     start_time = time.time()
@@ -18,7 +222,9 @@ def analyze_query_performance(query, params=None):
     execution_time = time.time() - start_time
 
     return {
-        'query_plan': plan,
+        'query_plan': plan['plan'],
+        'full_scans': plan['full_scans'],
+        'filesort': plan['filesort'],
         'execution_time': execution_time,
         'result_count': len(result)
     }
@@ -28,12 +234,7 @@ def create_index_if_not_exists(columns, table_name):
     """Helper to create composite indexes"""
     index_name = f"idx_{table_name}_{'_'.join(columns)}"
 
-    check_query = text(f"""
-    SELECT name FROM sqlite_master 
-    WHERE type='index' AND name=:index_name
-    """)
-
-    exists = db.session.execute(check_query, {'index_name': index_name}).fetchone()
+    exists = any(index['name'] == index_name for index in inspect(db.session.get_bind()).get_indexes(table_name))
 
     if not exists:
         columns_str = ', '.join(columns)
@@ -45,4 +246,3 @@ def create_index_if_not_exists(columns, table_name):
         return True
 
     return False
-
@@ -0,0 +1,382 @@
+from collections import Counter, namedtuple
+from importlib import import_module
+from sqlalchemy import Boolean, Date, and_, delete, exists, func, insert, or_, select, type_coerce, union_all, update
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from src.models import (
+    ArchivedSubscription,
+    DailySubscriptionRollup,
+    PlanSubscriberRollup,
+    RollupWatermark,
+    SubscriptionRollupState,
+    SubscriptionStatus,
+    UserSubscription,
+)
+
+DEFAULT_SHARDS = 8
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_OVERLAP_SECONDS = 300
+# Normalizes plan prices to a 30-day month for MRR.
+MONTH_DAYS = 30
+
+plan_rollups = PlanSubscriberRollup.__table__
+daily_rollups = DailySubscriptionRollup.__table__
+states = SubscriptionRollupState.__table__
+
+RollupState = namedtuple('RollupState', ('subscription_id', 'shard', 'plan_id', 'status', 'start_day', 'end_day', 'upgraded'))
+
+
+def state_of(subscription, shards=DEFAULT_SHARDS, upgraded=False):
+    """RollupState of an ORM subscription; upgraded marks a row cancelled by an upgrade."""
+    return RollupState(
+        subscription.id,
+        subscription.user_id % shards,
+        subscription.plan_id,
+        subscription.status or SubscriptionStatus.ACTIVE,
+        subscription.start_date.date(),
+        subscription.end_date.date() if subscription.end_date else None,
+        bool(upgraded and subscription.status == SubscriptionStatus.CANCELLED),
+    )
+
+
+def source_states(shards=DEFAULT_SHARDS, model=UserSubscription):
+    """
+    RollupState columns computed from user_subscriptions (or its archive). A CANCELLED
+    row counts as upgraded when the same user has a row, hot or archived, starting the
+    instant it ended, which is how upgrade_subscription and the bulk endpoint write upgrades.
+    """
+    successors = []
+    for table in (UserSubscription, ArchivedSubscription):
+        successor = aliased(table)
+        successors.append(exists().where(
+            successor.user_id == model.user_id,
+            successor.start_date == model.end_date,
+            successor.id != model.id,
+        ))
+    upgraded = and_(model.status == SubscriptionStatus.CANCELLED, or_(*successors))
+    return select(
+        model.id.label('subscription_id'),
+        (model.user_id % shards).label('shard'),
+        model.plan_id,
+        model.status,
+        func.date(model.start_date, type_=Date).label('start_day'),
+        func.date(model.end_date, type_=Date).label('end_day'),
+        type_coerce(upgraded, Boolean).label('upgraded'),
+    )
+
+
+def all_source_states(shards=DEFAULT_SHARDS):
+    """source_states() over hot and archived subscriptions."""
+    return union_all(source_states(shards), source_states(shards, ArchivedSubscription))
+
+
+def _contributions(state):
+    """The counters one subscription adds to: ('plan' | 'daily', key, column)."""
+    yield 'daily', (state.start_day, state.plan_id, state.shard), 'started'
+    if state.status == SubscriptionStatus.ACTIVE:
+        yield 'plan', (state.plan_id, state.shard), 'active_subscribers'
+    elif state.end_day is not None:
+        if state.status == SubscriptionStatus.CANCELLED:
+            column = 'upgraded' if state.upgraded else 'cancelled'
+        else:
+            column = 'expired'
+        yield 'daily', (state.end_day, state.plan_id, state.shard), column
+
+
+def _increment(session, table, key, deltas):
+    """Add deltas to the counters of one rollup row, creating it when missing."""
+    dialect = session.get_bind().dialect.name
+    increments = {column: table.c[column] + delta for column, delta in deltas.items()}
+    # Dialect modules are imported on use: loading all three adds ~70ms to every cold start.
+    if dialect in ('sqlite', 'postgresql'):
+        module = import_module(f'sqlalchemy.dialects.{dialect}')
+        statement = module.insert(table).values(**key, **deltas).on_conflict_do_update(index_elements=list(key), set_=increments)
+    elif dialect in ('mysql', 'mariadb'):
+        statement = import_module('sqlalchemy.dialects.mysql').insert(table).values(**key, **deltas).on_duplicate_key_update(increments)
+    else:
+        where = [table.c[column] == value for column, value in key.items()]
+        if session.execute(update(table).where(*where).values(increments)).rowcount:
+            return
+        statement = insert(table).values(**key, **deltas)
+    session.execute(statement)
+
+
+def apply_states(session, new_states):
+    """
+    Fold new RollupStates into the rollups, in the caller's transaction:
+    - Each subscription's previous contribution (subscription_rollup_states) is
+      subtracted and the new one added, so re-applying a state is a no-op
+    - Counter rows are touched in a fixed order, keeping lock order consistent
+    Returns the number of subscriptions whose contribution changed.
+    """
+    new_states = {state.subscription_id: state for state in new_states}
+    if not new_states:
+        return 0
+    previous = {
+        row.subscription_id: RollupState(*row)
+        for row in session.execute(select(*states.c).where(states.c.subscription_id.in_(new_states)))
+    }
+
+    deltas = {}
+    changed = []
+    for subscription_id, state in new_states.items():
+        old = previous.get(subscription_id)
+        if old == state:
+            continue
+        changed.append(state)
+        for target, key, column in _contributions(state):
+            deltas.setdefault((target, key), Counter())[column] += 1
+        for target, key, column in _contributions(old) if old is not None else ():
+            deltas.setdefault((target, key), Counter())[column] -= 1
+
+    for (target, key), counts in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1])):
+        counts = {column: delta for column, delta in counts.items() if delta}
+        if not counts:
+            continue
+        if target == 'plan':
+            _increment(session, plan_rollups, {'plan_id': key[0], 'shard': key[1]}, counts)
+        else:
+            _increment(session, daily_rollups, {'day': key[0], 'plan_id': key[1], 'shard': key[2]}, counts)
+
+    if changed:
+        session.execute(delete(states).where(states.c.subscription_id.in_([state.subscription_id for state in changed])))
+        session.execute(insert(states), [state._asdict() for state in changed])
+    return len(changed)
+
+
+def record_subscription_changes(session, *changes, shards=DEFAULT_SHARDS):
+    """
+    Request-path hook: changes are subscriptions, or (subscription, upgraded) pairs,
+    written in the current transaction. Keeps the rollups current without waiting
+    for the catch-up job.
+    """
+    changes = [change if isinstance(change, tuple) else (change, False) for change in changes]
+    if any(subscription.id is None for subscription, _upgraded in changes):
+        session.flush()
+    return apply_states(session, [state_of(subscription, shards, upgraded) for subscription, upgraded in changes])
+
+
+def _watermark(session):
+    mark = session.get(RollupWatermark, 1)
+    if mark is None:
+        mark = RollupWatermark(id=1)
+        session.add(mark)
+    return mark
+
+
+def catch_up_rollups(session, shards=DEFAULT_SHARDS, batch_size=DEFAULT_BATCH_SIZE, overlap_seconds=DEFAULT_OVERLAP_SECONDS, max_batches=None):
+    """
+    Fold user_subscriptions rows changed since the watermark into the rollups:
+    - Rows are read in (updated_at, id) order from idx_user_subscriptions_updated_at,
+      one short transaction per batch, and the watermark advances with each batch
+    - Each run starts overlap_seconds before the watermark, so rows committed late
+      with an older updated_at are still seen; re-reading a row changes nothing
+    - Catches what the request paths do not record: the bulk endpoint, the expiry
+      sweeper and writes made outside the app
+    Returns a dict with rows read, changed, batches and the watermark reached.
+    """
+    mark = _watermark(session)
+    cursor = (mark.updated_at - timedelta(seconds=overlap_seconds), 0) if mark.updated_at else None
+    rows = changed = batches = 0
+    while max_batches is None or batches < max_batches:
+        query = source_states(shards).add_columns(UserSubscription.updated_at)
+        if cursor is not None:
+            query = query.where(or_(
+                UserSubscription.updated_at > cursor[0],
+                and_(UserSubscription.updated_at == cursor[0], UserSubscription.id > cursor[1]),
+            ))
+        batch = session.execute(
+            query.where(UserSubscription.updated_at.isnot(None))
+            .order_by(UserSubscription.updated_at, UserSubscription.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        changed += apply_states(session, [RollupState(*row[:-1]) for row in batch])
+        last = batch[-1]
+        cursor = (last.updated_at, last.subscription_id)
+        mark = _watermark(session)
+        if mark.updated_at is None or cursor > (mark.updated_at, mark.subscription_id or 0):
+            mark.updated_at, mark.subscription_id = cursor
+        session.commit()
+        rows += len(batch)
+        batches += 1
+        if len(batch) < batch_size:
+            break
+    session.commit()
+    return {'rows': rows, 'changed': changed, 'batches': batches, 'watermark': mark.updated_at}
+
+
+def aggregate_states(session, source):
+    """
+    GROUP BY a selectable with RollupState columns into rollup counters:
+    ({(plan_id, shard): active}, {(day, plan_id, shard): Counter(started=..., ...)}).
+    """
+    source = source.subquery()
+    active = dict(((plan_id, shard), count) for plan_id, shard, count in session.execute(
+        select(source.c.plan_id, source.c.shard, func.count())
+        .where(source.c.status == SubscriptionStatus.ACTIVE)
+        .group_by(source.c.plan_id, source.c.shard)
+    ))
+    daily = {}
+    for day, plan_id, shard, count in session.execute(
+        select(source.c.start_day, source.c.plan_id, source.c.shard, func.count())
+        .group_by(source.c.start_day, source.c.plan_id, source.c.shard)
+    ):
+        daily.setdefault((day, plan_id, shard), Counter())['started'] += count
+    for day, plan_id, shard, status, upgraded, count in session.execute(
+        select(source.c.end_day, source.c.plan_id, source.c.shard, source.c.status, source.c.upgraded, func.count())
+        .where(source.c.status != SubscriptionStatus.ACTIVE, source.c.end_day.isnot(None))
+        .group_by(source.c.end_day, source.c.plan_id, source.c.shard, source.c.status, source.c.upgraded)
+    ):
+        if status == SubscriptionStatus.CANCELLED:
+            column = 'upgraded' if upgraded else 'cancelled'
+        else:
+            column = 'expired'
+        daily.setdefault((day, plan_id, shard), Counter())[column] += count
+    return active, daily
+
+
+def rebuild_rollups(session, shards=DEFAULT_SHARDS):
+    """
+    Recompute the rollups, the per-subscription states and the watermark from
+    user_subscriptions and its archive, in one transaction. Concurrent writes that land during the
+    rebuild are picked up by the next catch-up run.
+    """
+    for table in (plan_rollups, daily_rollups, states):
+        session.execute(delete(table))
+    session.execute(insert(states).from_select(list(RollupState._fields), all_source_states(shards)))
+
+    active, daily = aggregate_states(session, select(*states.c))
+    if active:
+        session.execute(insert(plan_rollups), [
+            {'plan_id': plan_id, 'shard': shard, 'active_subscribers': count} for (plan_id, shard), count in active.items()
+        ])
+    if daily:
+        session.execute(insert(daily_rollups), [
+            {'day': day, 'plan_id': plan_id, 'shard': shard, 'started': counts['started'], 'cancelled': counts['cancelled'],
+             'upgraded': counts['upgraded'], 'expired': counts['expired']}
+            for (day, plan_id, shard), counts in daily.items()
+        ])
+
+    newest = session.execute(
+        select(UserSubscription.updated_at, UserSubscription.id)
+        .where(UserSubscription.updated_at.isnot(None))
+        .order_by(UserSubscription.updated_at.desc(), UserSubscription.id.desc())
+        .limit(1)
+    ).first()
+    mark = _watermark(session)
+    mark.updated_at, mark.subscription_id = newest if newest else (None, None)
+    session.commit()
+    return {'plans': len(active), 'days': len(daily), 'subscriptions': session.execute(select(func.count()).select_from(states)).scalar()}
+
+
+def _by_plan(active):
+    totals = Counter()
+    for (plan_id, _shard), count in active.items():
+        totals[plan_id] += count
+    return totals
+
+
+def _by_day(daily):
+    totals = {}
+    for (day, plan_id, _shard), counts in daily.items():
+        totals.setdefault((day, plan_id), Counter()).update(counts)
+    # Rows whose counters are all zero carry no information.
+    return {key: {column: count for column, count in counts.items() if count} for key, counts in totals.items()}
+
+
+def verify_rollups(session, sample_size=20):
+    """
+    Compare the rollups with a fresh GROUP BY over hot and archived subscriptions
+    (shards summed), returns the plans and (day, plan_id) pairs that disagree. Rows
+    changed since the last catch-up run show up as drift until it runs.
+    """
+    expected_active, expected_daily = aggregate_states(session, all_source_states())
+    expected_active, expected_daily = _by_plan(expected_active), _by_day(expected_daily)
+
+    actual_active = _by_plan({
+        (row.plan_id, row.shard): row.active_subscribers for row in session.execute(select(plan_rollups))
+    })
+    actual_daily = _by_day({
+        (row.day, row.plan_id, row.shard): Counter(started=row.started, cancelled=row.cancelled, upgraded=row.upgraded, expired=row.expired)
+        for row in session.execute(select(daily_rollups))
+    })
+
+    plans = sorted(
+        plan_id for plan_id in set(expected_active) | set(actual_active)
+        if expected_active[plan_id] != actual_active[plan_id]
+    )
+    days = sorted(
+        key for key in set(expected_daily) | set(actual_daily)
+        if expected_daily.get(key, {}) != actual_daily.get(key, {})
+    )
+    return {
+        'plans': len(plans),
+        'days': len(days),
+        'sample_plan_ids': plans[:sample_size],
+        'sample_days': [(day.isoformat(), plan_id) for day, plan_id in days[:sample_size]],
+    }
+
+
+def subscriber_report(session, plans):
+    """
+    Active subscribers and MRR per plan, read from plan_subscriber_rollups only: the
+    work is bounded by plans x shards, not by the size of user_subscriptions. plans
+    maps plan id to the catalog's plan rows.
+    """
+    rows = []
+    for plan_id, active in session.execute(
+        select(plan_rollups.c.plan_id, func.sum(plan_rollups.c.active_subscribers))
+        .group_by(plan_rollups.c.plan_id)
+        .order_by(plan_rollups.c.plan_id)
+    ):
+        plan = plans.get(plan_id)
+        mrr = active * plan.price * MONTH_DAYS / plan.duration_days if plan and plan.duration_days else 0
+        rows.append({'plan_id': plan_id, 'name': plan.name if plan else None, 'active_subscribers': int(active), 'mrr': round(mrr, 2)})
+    mark = session.get(RollupWatermark, 1)
+    return {
+        'plans': rows,
+        'active_subscribers': sum(row['active_subscribers'] for row in rows),
+        'mrr': round(sum(row['mrr'] for row in rows), 2),
+        'caught_up_to': mark.updated_at if mark else None,
+    }
+
+
+def daily_report(session, days, plan_id=None, today=None):
+    """
+    Per-day started / cancelled / upgraded / expired over the last days days, from
+    daily_subscription_rollups only. Active subscribers at the end of each day are
+    walked back from the current total, and churn_rate is that day's cancellations
+    over the active subscribers at the start of the day.
+    """
+    today = today or datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    columns = ('started', 'cancelled', 'upgraded', 'expired')
+
+    active_now = select(func.coalesce(func.sum(plan_rollups.c.active_subscribers), 0))
+    query = (
+        select(daily_rollups.c.day, *(func.sum(daily_rollups.c[column]) for column in columns))
+        .where(daily_rollups.c.day >= first)
+        .group_by(daily_rollups.c.day)
+    )
+    if plan_id is not None:
+        active_now = active_now.where(plan_rollups.c.plan_id == plan_id)
+        query = query.where(daily_rollups.c.plan_id == plan_id)
+    totals = {day: dict(zip(columns, map(int, counts))) for day, *counts in session.execute(query)}
+    active = int(session.execute(active_now).scalar())
+
+    report = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        counts = totals.get(day, dict.fromkeys(columns, 0))
+        at_start = active - counts['started'] + counts['cancelled'] + counts['upgraded'] + counts['expired']
+        report.append({
+            'day': day.isoformat(),
+            **counts,
+            'active_subscribers': active,
+            'churn_rate': round(counts['cancelled'] / at_start, 6) if at_start > 0 else None,
+        })
+        active = at_start
+    report.reverse()
+    return report
@@ -0,0 +1,124 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from json.encoder import encode_basestring_ascii
+
+import json
+
+try:
+    import orjson
+    # Datetimes pass through to default() so they come out as HTTP dates, like jsonify().
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:  # optional, `pip install orjson`
+    orjson = None
+
+JSON_BACKENDS = ('auto', 'orjson', 'json')
+
+# Lookup tables for format_http_date(), which runs for every datetime in every row.
+_DAYS = ('Mon, ', 'Tue, ', 'Wed, ', 'Thu, ', 'Fri, ', 'Sat, ', 'Sun, ')
+_MONTHS = (None, ' Jan ', ' Feb ', ' Mar ', ' Apr ', ' May ', ' Jun ', ' Jul ', ' Aug ', ' Sep ', ' Oct ', ' Nov ', ' Dec ')
+_TWO_DIGITS = tuple(f'{number:02d}' for number in range(100))
+
+
+def format_http_date(value):
+    """Same text as werkzeug's http_date(), without going through email.utils."""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (f'{_DAYS[value.weekday()]}{_TWO_DIGITS[value.day]}{_MONTHS[value.month]}{value.year:04d} '
+            f'{_TWO_DIGITS[value.hour]}:{_TWO_DIGITS[value.minute]}:{_TWO_DIGITS[value.second]} GMT')
+
+
+def resolve_backend(name):
+    if name not in JSON_BACKENDS:
+        raise ValueError(f'JSON_BACKEND must be one of {", ".join(JSON_BACKENDS)}')
+    if name == 'orjson' and orjson is None:
+        raise ValueError('JSON_BACKEND=orjson but orjson is not installed')
+    return 'orjson' if name != 'json' and orjson is not None else 'json'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider with the same output, served by a faster backend:
+    - orjson when installed (JSON_BACKEND=auto|orjson), the stdlib otherwise
+    - Keys stay sorted and datetimes stay HTTP dates, so bodies match jsonify()
+    - Enums encode as their value
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.backend = resolve_backend(app.config.get('JSON_BACKEND', 'auto'))
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return format_http_date(o)
+        if isinstance(o, Enum):
+            return o.value
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is always compact; anything asking for indentation takes the stdlib path.
+        if self.backend == 'orjson' and 'indent' not in kwargs:
+            try:
+                return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode('utf-8')
+            except TypeError:
+                pass  # e.g. integers past 64 bits; the stdlib encoder handles them
+        return super().dumps(obj, **kwargs)
+
+
+def _encode_other(value):
+    return json.dumps(value, default=FastJSONProvider.default, sort_keys=True, separators=(',', ':'))
+
+
+def _encode_datetime(value):
+    return '"' + format_http_date(value) + '"'
+
+
+# Exact-type dispatch for the values row encoders meet; anything else goes through json.dumps.
+VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: float.__repr__,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    datetime: _encode_datetime,
+    date: _encode_datetime,
+    Decimal: lambda value: encode_basestring_ascii(str(value)),
+}
+
+
+def compile_row_encoder(fields, name='row'):
+    """
+    Build, once, a function turning a result tuple into JSON object text:
+    - fields are the output keys in the row's column order
+    - Keys come out sorted with their quoting precomputed, like jsonify()
+    - No dict is built per row; values go straight from the tuple to text
+    """
+    values = [f'v{index}' for index in range(len(fields))]
+    parts = []
+    for index, (key, position) in enumerate(sorted((key, position) for position, key in enumerate(fields))):
+        prefix = ('{' if index == 0 else ',') + encode_basestring_ascii(key) + ':'
+        parts.append(f'{prefix!r} + _get(type(v{position}), _other)(v{position})')
+    body = ' + '.join(parts) + " + '}'" if parts else "'{}'"
+    unpack = f'    {", ".join(values)}, = row\n' if values else ''
+    source = f'def encode_{name}(row, _get=_get, _other=_other):\n{unpack}    return {body}\n'
+
+    namespace = {'_get': VALUE_ENCODERS.get, '_other': _encode_other}
+    exec(compile(source, f'<row encoder {name}>', 'exec'), namespace)
+    encoder = namespace[f'encode_{name}']
+    encoder.fields = tuple(fields)
+    return encoder
+
+
+def encode_rows(rows, encoder):
+    """JSON array text for rows, one encoder call per row."""
+    return '[' + ','.join(map(encoder, rows)) + ']'
+
+
+def json_response(body):
+    """Response for JSON text/bytes that is already encoded."""
+    return current_app.response_class(body, mimetype='application/json')
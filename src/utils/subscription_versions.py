@@ -0,0 +1,116 @@
+from flask import g, has_request_context
+from importlib import import_module
+from sqlalchemy import insert, select, update
+from datetime import datetime
+from types import SimpleNamespace
+from src.models import UserSubscriptionVersion
+
+versions = UserSubscriptionVersion.__table__
+
+version_lookup = select(versions.c.version, versions.c.expires_at, versions.c.has_archive)
+
+
+def bump_subscription_versions(session, expires_at_by_user):
+    """
+    Advance the version of every user in expires_at_by_user ({user_id: end_date of
+    their ACTIVE subscription after the change, or None}), in the caller's transaction,
+    so the new version commits or rolls back together with the change.
+    """
+    rows = [{'user_id': user_id, 'version': 1, 'expires_at': expires_at} for user_id, expires_at in sorted(expires_at_by_user.items())]
+    _upsert(session, rows, lambda new: {'version': versions.c.version + 1, 'expires_at': new.expires_at})
+
+
+def mark_archived_users(session, user_ids, now=None):
+    """
+    Set has_archive for user_ids, in the caller's (archival) transaction. A version row
+    created here expires at once, so it yields no ETag until a write bumps it.
+    """
+    expires_at = now or datetime.utcnow()
+    rows = [{'user_id': user_id, 'version': 1, 'expires_at': expires_at, 'has_archive': True} for user_id in sorted(user_ids)]
+    _upsert(session, rows, lambda new: {'has_archive': True})
+
+
+def _upsert(session, rows, on_conflict):
+    """
+    Insert rows, or for users that already have one, apply on_conflict(new) to it: new
+    holds the columns of the row that was to be inserted.
+    """
+    if not rows:
+        return
+    # Sorted by the callers, so concurrent bulk writes lock version rows in the same order.
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        statement = import_module(f'sqlalchemy.dialects.{dialect}').insert(versions)
+        statement = statement.on_conflict_do_update(index_elements=['user_id'], set_=on_conflict(statement.excluded))
+    elif dialect in ('mysql', 'mariadb'):
+        statement = import_module('sqlalchemy.dialects.mysql').insert(versions)
+        statement = statement.on_duplicate_key_update(**on_conflict(statement.inserted))
+    else:
+        for row in rows:
+            bumped = session.execute(
+                update(versions)
+                .where(versions.c.user_id == row['user_id'])
+                .values(**on_conflict(SimpleNamespace(**row)))
+            )
+            if not bumped.rowcount:
+                session.execute(insert(versions).values(**row))
+        return
+    session.execute(statement, rows)
+
+
+def _remember(user_id, row):
+    # The history views run after the ETag lookup of the same request and reuse its row.
+    if has_request_context():
+        g.setdefault('subscription_versions', {})[user_id] = row
+    return row
+
+
+def _remembered(user_id):
+    if has_request_context():
+        return g.get('subscription_versions', {}).get(user_id, False)
+    return False
+
+
+def _etag(user_id, row, now):
+    if row is None:
+        return None
+    if row.expires_at is not None and row.expires_at <= (now or datetime.utcnow()):
+        return None
+    return f'u{user_id}.v{row.version}'
+
+
+def subscription_etag(session, user_id, now=None):
+    """
+    Strong ETag of user_id's subscription reads, from one primary-key lookup. None (no
+    conditional GET) when the version cannot vouch for the payload:
+    - the user has no version row yet, i.e. has not changed anything since it was added
+    - their ACTIVE subscription has ended: the payloads change at end_date without a
+      write, and the version only moves again when the expiry sweeper flips the row
+    """
+    row = session.execute(version_lookup.where(versions.c.user_id == user_id)).first()
+    return _etag(user_id, _remember(user_id, row), now)
+
+
+async def subscription_etag_async(session, user_id, now=None):
+    """subscription_etag() for an AsyncSession."""
+    result = await session.execute(version_lookup.where(versions.c.user_id == user_id))
+    return _etag(user_id, _remember(user_id, result.first()), now)
+
+
+def has_archive(session, user_id):
+    """
+    Whether any of user_id's rows were archived, from the version row the request's
+    ETag lookup already read (one primary-key fetch otherwise).
+    """
+    row = _remembered(user_id)
+    if row is False:
+        row = _remember(user_id, session.execute(version_lookup.where(versions.c.user_id == user_id)).first())
+    return row is not None and row.has_archive
+
+
+async def has_archive_async(session, user_id):
+    """has_archive() for an AsyncSession."""
+    row = _remembered(user_id)
+    if row is False:
+        row = _remember(user_id, (await session.execute(version_lookup.where(versions.c.user_id == user_id))).first())
+    return row is not None and row.has_archive
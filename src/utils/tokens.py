@@ -0,0 +1,151 @@
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from threading import Lock
+from datetime import datetime, timedelta
+from src.models import RevokedToken
+from src.utils.identity import AuthenticatedUser
+
+import jwt
+import os
+import time
+import uuid
+
+ACCESS_TOKEN = 'access'
+REFRESH_TOKEN = 'refresh'
+
+TOKEN_EXPIRATION_MINUTES = 30
+REFRESH_TOKEN_EXPIRATION_DAYS = 14
+REVOCATION_SYNC_SECONDS = 5
+REVOCATION_SYNC_OVERLAP_SECONDS = 10
+ALGORITHM = 'HS256'
+
+
+class TokenError(Exception):
+    pass
+
+
+def _secret_key():
+    return current_app.config.get('JWT_SECRET_KEY') or os.environ.get('JWT_SECRET_KEY')
+
+
+def _lifetime(token_type):
+    if token_type == REFRESH_TOKEN:
+        return timedelta(days=current_app.config.get('JWT_REFRESH_TOKEN_DAYS', REFRESH_TOKEN_EXPIRATION_DAYS))
+    return timedelta(minutes=current_app.config.get('JWT_ACCESS_TOKEN_MINUTES', TOKEN_EXPIRATION_MINUTES))
+
+
+def issue_token(user, token_type=ACCESS_TOKEN):
+    """
+    Signed token carrying everything the routes need to act for the user:
+    - user_id and username, so no users lookup is needed on use
+    - type, so a refresh token cannot be used as an access token
+    - jti, so a single token can be revoked before it expires
+    """
+    now = datetime.utcnow()
+    payload = {
+        'user_id': user.id,
+        'username': user.username,
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + _lifetime(token_type),
+    }
+    return jwt.encode(payload, _secret_key(), algorithm=ALGORITHM)
+
+
+def decode_token(token, expected_type=ACCESS_TOKEN):
+    """Validate signature, expiry, type and revocation in-process, returns the claims."""
+    try:
+        claims = jwt.decode(token, _secret_key(), algorithms=[ALGORITHM],
+                            options={'require': ['exp', 'jti', 'user_id', 'username', 'type']})
+    except jwt.PyJWTError as exc:
+        raise TokenError(str(exc)) from exc
+
+    if claims['type'] != expected_type:
+        raise TokenError('Unexpected token type')
+    if get_revocation_list().is_revoked(claims['jti']):
+        raise TokenError('Token has been revoked')
+    return claims
+
+
+def identity_from_claims(claims):
+    return AuthenticatedUser(id=claims['user_id'], username=claims['username'])
+
+
+def revoke_token(claims):
+    """Revoke the token; False when it was already revoked, possibly by another worker."""
+    return get_revocation_list().revoke(claims['jti'], datetime.utcfromtimestamp(claims['exp']))
+
+
+class RevocationList:
+    """
+    Revoked token ids, kept only until the token would have expired anyway:
+    - Lookups are a dict membership test, no DB access per request
+    - Revocations are persisted to revoked_tokens and every worker pulls rows it
+      has not seen yet at most once per sync_interval, so the list converges
+      across processes without a query per request
+    - Each pull starts overlap seconds before the newest revoked_at seen, so a
+      revocation that committed late with an older revoked_at (or on a host whose
+      clock lags) is still picked up; an id watermark would skip it for good
+    """
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_SECONDS, clock=time.monotonic, overlap=REVOCATION_SYNC_OVERLAP_SECONDS):
+        self.sync_interval = sync_interval
+        self.overlap = timedelta(seconds=overlap)
+        self._clock = clock
+        self._revoked = {}
+        self._watermark = None
+        self._next_sync = 0
+        self._lock = Lock()
+
+    def is_revoked(self, jti):
+        if self._clock() >= self._next_sync:
+            self.sync()
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def revoke(self, jti, expires_at):
+        from src import db
+
+        try:
+            db.session.execute(insert(RevokedToken).values(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()))
+            db.session.commit()
+            revoked = True
+        except IntegrityError:
+            # Already in revoked_tokens (unique jti): a replay on a worker that has not
+            # synced it yet, or a concurrent revocation of the same token.
+            db.session.rollback()
+            revoked = False
+        with self._lock:
+            self._revoked[jti] = expires_at
+        return revoked
+
+    def sync(self):
+        from src import db
+
+        with self._lock:
+            self._next_sync = self._clock() + self.sync_interval
+            now = datetime.utcnow()
+            query = db.session.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).filter(
+                RevokedToken.expires_at > now)
+            if self._watermark is not None:
+                query = query.filter(RevokedToken.revoked_at >= self._watermark - self.overlap)
+            for jti, expires_at, revoked_at in query.all():
+                self._revoked[jti] = expires_at
+                self._watermark = max(self._watermark or revoked_at, revoked_at)
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+def get_revocation_list():
+    revocations = current_app.extensions.get('token_revocations')
+    if revocations is None:
+        revocations = RevocationList(
+            sync_interval=current_app.config.get('JWT_REVOCATION_SYNC_SECONDS', REVOCATION_SYNC_SECONDS),
+            overlap=current_app.config.get('JWT_REVOCATION_SYNC_OVERLAP_SECONDS', REVOCATION_SYNC_OVERLAP_SECONDS),
+        )
+        current_app.extensions['token_revocations'] = revocations
+    return revocations
@@ -0,0 +1,37 @@
+"""
+WSGI entry point for production, one app per process tree:
+
+    gunicorn -c gunicorn.conf.py
+
+gunicorn.conf.py preloads this module in the master and forks the workers from it,
+so whatever warm_up() does is paid once rather than in every worker's first request.
+"""
+from sqlalchemy.orm import configure_mappers
+from src import db, get_app
+from src.utils.entitlements import load_entitlement_index, service_tokens
+from src.utils.password_hashing import expanded_prefix
+
+
+def warm_up(app):
+    """Per-process set-up that needs no connection, thread or pool: safe before a fork."""
+    configure_mappers()
+    expanded_prefix(app.config['PASSWORD_HASH_METHOD'])
+
+
+def preload_entitlements(app):
+    """
+    Load the entitlement index before the fork when the service is enabled: its array
+    is then shared copy-on-write by every worker. The connection used for the scan is
+    closed again, so the master keeps no pooled connection around.
+    """
+    if not service_tokens(app):
+        return None
+    index = load_entitlement_index(app, db)
+    with app.app_context():
+        db.engine.dispose()
+    return index
+
+
+app = get_app()
+warm_up(app)
+preload_entitlements(app)
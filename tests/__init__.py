@@ -1,6 +1,27 @@
 from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from unittest.mock import patch
 import pytest
 
+# Per-app state the shared src app keeps between requests. Tests that go through it
+# drop these first, so nothing cached by an earlier test (credentials, plans, buckets,
+# an entitlement index) leaks into theirs.
+APP_STATE_EXTENSIONS = (
+    'credential_cache', 'plan_catalog', 'active_subscription_cache', 'recent_writers', 'idempotency_cache',
+    'rate_limit_backend', 'concurrency_limiter', 'token_revocations', 'outbox_feed_notifier',
+    'entitlement_index', 'entitlement_refresher',
+)
+
+
+def reset_app_state(app, names=APP_STATE_EXTENSIONS):
+    """Drop app's per-app state, stopping any thread that owns it."""
+    for name in names:
+        state = app.extensions.pop(name, None)
+        if hasattr(state, 'stop'):
+            state.stop()
+
 
 @pytest.fixture
 def app():
@@ -9,3 +30,39 @@ def app():
 
     with app.test_request_context():
         yield app
+
+
+@pytest.fixture
+def db_session():
+    """Real in-memory SQLite session standing in for db.session."""
+    from src import db
+    from src.models import Base
+
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    with patch.object(db, 'session', session):
+        yield session
+    session.remove()
+    engine.dispose()
+
+
+@pytest.fixture
+def file_session(tmp_path):
+    """
+    db.session on a SQLite file, for tests that go through the shared src app:
+    every connection (request threads, streamed responses, an async engine on the
+    same file) sees the same data. The app's per-app state is reset around the test.
+    """
+    from src import app as flask_app, db
+    from src.models import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    reset_app_state(flask_app)
+    with patch.object(db, 'session', session):
+        yield session
+    reset_app_state(flask_app)
+    session.remove()
+    engine.dispose()
@@ -0,0 +1,108 @@
+import base64
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash
+from tests import file_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, User
+from src.utils.admission import (
+    ConcurrencyLimiter,
+    LocalRedisStandIn,
+    MemoryRateLimitBackend,
+    RedisRateLimitBackend,
+    admission_metrics,
+    parse_route_limits,
+)
+
+
+def basic(username):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:secret'.encode()).decode('ascii')}
+
+
+@pytest.fixture
+def client(file_session):
+    for user_id, name in ((1, 'alice'), (2, 'bob')):
+        file_session.add(User(id=user_id, username=name, password=generate_password_hash('secret'), email=f'{name}@example.com'))
+    file_session.add(SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30))
+    file_session.commit()
+    return flask_app.test_client()
+
+
+@pytest.mark.parametrize('make_backend', [
+    lambda clock: MemoryRateLimitBackend(clock=clock),
+    lambda clock: RedisRateLimitBackend(LocalRedisStandIn(clock=clock)),
+])
+def test_token_bucket_backends(make_backend):
+    now = [100.0]
+    backend = make_backend(lambda: now[0])
+
+    assert [backend.take('user:1:history', 1.0, 2) for _ in range(3)] == [0, 0, 1.0]
+    assert backend.take('user:2:history', 1.0, 2) == 0
+    now[0] += 0.5
+    assert backend.take('user:1:history', 1.0, 2) == pytest.approx(0.5)
+    now[0] += 0.5
+    assert backend.take('user:1:history', 1.0, 2) == 0
+
+
+def test_route_limits_are_parsed_from_config():
+    assert parse_route_limits('get_subscription_history=2/10, login=0.5') == {
+        'get_subscription_history': (2.0, 10), 'login': (0.5, 1)}
+    with pytest.raises(ValueError):
+        parse_route_limits('login=fast')
+
+
+def test_throttles_per_user_and_route(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'RATE_LIMIT_ROUTES', 'list_plans=0.01/2')
+    statuses = [client.get('/plans', headers=basic('alice')).status_code for _ in range(3)]
+    throttled = client.get('/plans', headers=basic('alice'))
+
+    assert statuses == [200, 200, 429]
+    assert throttled.headers['Retry-After'] == '100'
+    # Other users and other routes have their own buckets.
+    assert client.get('/plans', headers=basic('bob')).status_code == 200
+    assert client.get('/subscriptions/active', headers=basic('alice')).status_code == 404
+    assert admission_metrics.counts[('list_plans', 'throttled')] >= 2
+
+
+def test_direct_clients_cannot_pick_their_bucket_with_x_forwarded_for(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'RATE_LIMIT_ROUTES', 'login=0.01/1')
+
+    def login(address):
+        return client.post('/login', json={'username': 'nobody', 'password': 'x'},
+                           headers={'X-Forwarded-For': address}, environ_base={'REMOTE_ADDR': '203.0.113.5'})
+
+    assert [login(f'198.51.100.{n}').status_code for n in range(2)] == [401, 429]
+
+
+def test_anonymous_routes_are_keyed_on_the_forwarded_client_address(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'RATE_LIMIT_ROUTES', 'login=0.01/1')
+    # What create_app sets up with TRUSTED_PROXY_HOPS=1.
+    monkeypatch.setattr(flask_app, 'wsgi_app', ProxyFix(flask_app.wsgi_app, x_for=1))
+
+    def login(address):
+        # The load balancer appends the address it saw; everything arrives from its own.
+        return client.post('/login', json={'username': 'nobody', 'password': 'x'},
+                           headers={'X-Forwarded-For': f'10.9.9.9, {address}'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    assert [login('203.0.113.5').status_code for _ in range(2)] == [401, 429]
+    assert login('198.51.100.7').status_code == 401
+
+
+def test_sheds_when_every_slot_is_busy(client, monkeypatch):
+    limiter = flask_app.extensions['concurrency_limiter'] = ConcurrencyLimiter(1, queue_timeout=0)
+    assert limiter.acquire()
+    shed = client.get('/plans', headers=basic('alice'))
+    assert shed.status_code == 503 and shed.headers['Retry-After'] == '1'
+
+    limiter.release()
+    assert client.get('/plans', headers=basic('alice')).status_code == 200
+    assert limiter.in_flight == 0
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'admission_requests_total{endpoint="list_plans",outcome="shed"}' in metrics
+    assert 'admission_max_concurrent 1' in metrics
+
+    monkeypatch.setitem(flask_app.config, 'ADMISSION_CONTROL_ENABLED', False)
+    assert limiter.acquire()
+    assert client.get('/plans', headers=basic('alice')).status_code == 200
@@ -0,0 +1,109 @@
+import json
+import os
+import pytest
+import subprocess
+import sys
+from sqlalchemy import create_engine, text
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from src import create_app, db
+from src.models import Base
+
+fork_only = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+
+
+def run_in_child(function):
+    """Fork, run function in the child and return what it returned (JSON-encoded)."""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            payload = json.dumps(function())
+        except BaseException as exc:
+            payload = json.dumps({'error': repr(exc)})
+        os.write(write_end, payload.encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as handle:
+        payload = handle.read()
+    os.waitpid(pid, 0)
+    return json.loads(payload)
+
+
+def test_importing_src_builds_no_app_and_registers_no_routes():
+    code = 'import sys, src; print(src._default_app is None, "src.routes" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env={**os.environ, 'DATABASE_URL': 'sqlite://'}).stdout
+    assert output.split() == ['True', 'False']
+
+
+def test_create_app_builds_independent_apps(tmp_path):
+    first = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'one.db'}", 'HISTORY_PAGE_SIZE': 7})
+    second = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'two.db'}", 'TRUSTED_PROXY_HOPS': 1})
+
+    assert first is not second
+    assert first.config['HISTORY_PAGE_SIZE'] == 7 and second.config['HISTORY_PAGE_SIZE'] == 50
+    assert {rule.endpoint for rule in first.url_map.iter_rules() if rule.rule == '/plans'} == {'api.list_plans', 'api.create_plan'}
+    assert not isinstance(first.wsgi_app, ProxyFix) and isinstance(second.wsgi_app, ProxyFix)
+    assert 'rollups' in first.cli.commands and 'export-subscriptions' in first.cli.commands
+    with first.app_context():
+        assert str(db.engine.url).endswith('one.db')
+    with second.app_context():
+        assert str(db.engine.url).endswith('two.db')
+
+
+@fork_only
+def test_forked_workers_never_share_the_masters_connections(tmp_path):
+    url = f"sqlite:///{tmp_path / 'fork.db'}"
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+    with app.app_context():
+        Base.metadata.create_all(db.engine)
+        # The master (wrongly, but it happens) uses the pool before forking.
+        with db.engine.connect() as connection:
+            master_connection = connection.connection.dbapi_connection
+            connection.execute(text('SELECT 1'))
+    app.extensions['password_hasher'] = object()
+    # An engine the app does not know about shows what sharing looks like.
+    unmanaged = create_engine(url)
+    with unmanaged.connect() as connection:
+        unmanaged_connection = connection.connection.dbapi_connection
+
+    def worker():
+        with app.app_context():
+            with db.engine.connect() as connection:
+                reused = connection.connection.dbapi_connection is master_connection
+                connection.execute(text('SELECT 1'))
+        with unmanaged.connect() as connection:
+            control = connection.connection.dbapi_connection is unmanaged_connection
+        return {'reused': reused, 'control': control, 'hasher': 'password_hasher' in app.extensions}
+
+    assert run_in_child(worker) == {'reused': False, 'control': True, 'hasher': False}
+    # The master's own pool is untouched: the child did not close the inherited connection.
+    with app.app_context(), db.engine.connect() as connection:
+        assert connection.connection.dbapi_connection is master_connection
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+    unmanaged.dispose()
+
+
+@fork_only
+def test_background_threads_start_in_serving_processes_only(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'threads.db'}", 'EXPIRY_SWEEP_INTERVAL_SECONDS': 3600})
+    with app.app_context():
+        Base.metadata.create_all(db.engine)
+    # Built like a preloading master: nothing runs until a process serves a request.
+    assert 'expiry_sweeper' not in app.extensions
+
+    def worker():
+        app.test_client().get('/metrics')
+        return {'sweeping': app.extensions['expiry_sweeper']._thread.is_alive()}
+
+    assert run_in_child(worker) == {'sweeping': True}
+    assert 'expiry_sweeper' not in app.extensions
+
+    app.test_client().get('/metrics')
+    sweeper = app.extensions['expiry_sweeper']
+    try:
+        assert run_in_child(lambda: {'inherited': 'expiry_sweeper' in app.extensions}) == {'inherited': False}
+    finally:
+        sweeper.stop(timeout=1)
@@ -0,0 +1,104 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from tests import app, db_session
+
+from src.models import ArchivedSubscription, SubscriptionPlan, SubscriptionStatus, User, UserSubscription, UserSubscriptionVersion
+from src.routes import get_subscription_history_optimized_user, get_subscription_history_user
+from src.utils.archival import archive_subscriptions
+from src.utils.rollups import rebuild_rollups, verify_rollups
+from src.utils.subscription_versions import subscription_etag
+
+NOW = datetime.utcnow()
+
+
+def seed(session):
+    """User 1: a subscription every 60 days for three years, the latest ACTIVE."""
+    session.add(User(id=1, username="alice", password="x", email="alice@example.com"))
+    session.add(User(id=2, username="bob", password="x", email="bob@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    for index in range(18):
+        start = NOW - timedelta(days=60 * (18 - index))
+        status = SubscriptionStatus.CANCELLED if index % 3 == 0 else SubscriptionStatus.INACTIVE
+        session.add(UserSubscription(id=index + 1, user_id=1, plan_id=1, start_date=start, end_date=start + timedelta(days=30),
+                                     status=status, created_at=start, updated_at=start + timedelta(days=30)))
+    session.add(UserSubscription(id=19, user_id=1, plan_id=1, start_date=NOW, end_date=NOW + timedelta(days=30), status=SubscriptionStatus.ACTIVE))
+    session.add(UserSubscription(id=20, user_id=2, plan_id=1, start_date=NOW - timedelta(days=800),
+                                 end_date=NOW - timedelta(days=770), status=SubscriptionStatus.INACTIVE))
+    session.commit()
+
+
+def history(app, view, limit=None, stream=False, user_id=1):
+    """Every item of a user's history, following X-Next-Cursor page by page."""
+    items, cursor = [], None
+    while True:
+        args = {'stream': '1'} if stream else {'limit': limit, **({'cursor': cursor} if cursor else {})}
+        # A fresh app context per request, as in production: g does not outlive the request.
+        with app.app_context(), app.test_request_context('/', query_string=args):
+            response = view(user_id)
+            response = response[0] if isinstance(response, tuple) else response
+            items.extend((item.get('start_date'), item.get('end_date')) for item in response.get_json())
+            cursor = response.headers.get('X-Next-Cursor')
+        if stream or not cursor:
+            return items
+
+
+def test_archive_moves_old_ended_rows_in_resumable_batches(app, db_session):
+    seed(db_session)
+    rebuild_rollups(db_session)
+
+    first = archive_subscriptions(db_session, older_than_days=365, batch_size=3, max_batches=2)
+    assert (first['rows'], first['batches']) == (6, 2)
+    rest = archive_subscriptions(db_session, older_than_days=365, batch_size=3)
+
+    archived_ids = {row.id for row in db_session.query(ArchivedSubscription)}
+    hot_ids = {row.id for row in db_session.query(UserSubscription)}
+    assert first['rows'] + rest['rows'] == len(archived_ids) == 12
+    assert not archived_ids & hot_ids and len(archived_ids | hot_ids) == 20
+    # Only rows that ended before the cutoff move; the ACTIVE row and the newest id (20, long ended) stay hot.
+    assert all(row.end_date < NOW - timedelta(days=365) for row in db_session.query(ArchivedSubscription))
+    assert {19, 20} <= hot_ids
+    assert archive_subscriptions(db_session, older_than_days=365)['rows'] == 0
+
+    # Rollups still count archived rows, and a rebuild reads them back from the archive.
+    assert verify_rollups(db_session)['days'] == 0
+    rebuild_rollups(db_session)
+    assert verify_rollups(db_session)['days'] == 0
+
+
+@pytest.mark.parametrize('view', [get_subscription_history_user, get_subscription_history_optimized_user])
+def test_history_reads_merge_archived_rows_transparently(app, db_session, view):
+    seed(db_session)
+    before = {'paged': history(app, view, limit=4), 'streamed': history(app, view, stream=True)}
+    assert len(before['paged']) == 19 and before['paged'] == before['streamed']
+
+    archive_subscriptions(db_session, older_than_days=365)
+    statements = []
+    event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    with app.test_request_context('/', query_string={'limit': 4}):
+        view(1)
+    # The first page is all hot rows started after the horizon: no archive read.
+    assert statements and not any('user_subscriptions_archive' in statement for statement in statements)
+
+    assert history(app, view, limit=4) == before['paged']
+    assert history(app, view, limit=7) == before['paged']
+    assert history(app, view, stream=True) == before['streamed']
+    assert any('user_subscriptions_archive' in statement for statement in statements)
+
+
+@pytest.mark.parametrize('view', [get_subscription_history_user, get_subscription_history_optimized_user])
+def test_users_with_nothing_archived_never_read_the_archive(app, db_session, view):
+    seed(db_session)
+    archive_subscriptions(db_session, older_than_days=365)
+    # User 2's only row is long ended but the newest id, so it stayed hot.
+    assert {row.user_id for row in db_session.query(UserSubscriptionVersion).filter_by(has_archive=True)} == {1}
+    with app.test_request_context():
+        # The version row the job created vouches for nothing until a write bumps it.
+        assert subscription_etag(db_session, 1) is None
+
+    statements = []
+    event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    # A short first page and a streamed history, both of which would merge in archived rows.
+    assert len(history(app, view, limit=4, user_id=2)) == len(history(app, view, stream=True, user_id=2)) == 1
+    assert statements and not any('user_subscriptions_archive' in statement for statement in statements)
@@ -0,0 +1,110 @@
+import asyncio
+import base64
+import json
+import pytest
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from tests import file_session
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from src import app as flask_app  # noqa: E402
+from src.asgi import application  # noqa: E402
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription  # noqa: E402
+from src.utils.current_subscription import refresh_current_subscriptions  # noqa: E402
+
+BASIC = {'Authorization': 'Basic ' + base64.b64encode(b'alice:secret').decode('ascii')}
+
+
+@pytest.fixture
+def asgi_db(file_session):
+    """One SQLite file behind both the sync session (auth, writes) and the async engine."""
+    session = file_session
+    session.add(User(id=1, username='alice', password=generate_password_hash('secret'), email='alice@example.com'))
+    session.add(SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30))
+    now = datetime.utcnow()
+    for days_ago in (90, 60, 10):
+        # Only the latest one is still running; the database allows one ACTIVE row per user.
+        status = SubscriptionStatus.ACTIVE if days_ago < 30 else SubscriptionStatus.INACTIVE
+        session.add(UserSubscription(user_id=1, plan_id=1, start_date=now - timedelta(days=days_ago),
+                                     end_date=now - timedelta(days=days_ago) + timedelta(days=30), status=status))
+    refresh_current_subscriptions(session)
+    session.commit()
+
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{session.get_bind().url.database}')
+    flask_app.extensions['async_sessionmakers'] = {
+        flask_app.config['SQLALCHEMY_DATABASE_URI']: async_sessionmaker(async_engine, expire_on_commit=False),
+    }
+    yield session
+    asyncio.run(async_engine.dispose())
+    flask_app.extensions.pop('async_sessionmakers', None)
+
+
+def call(method, path, query='', headers=None):
+    async def run():
+        sent = []
+        request = {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def receive():
+            return request
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+            'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+        }
+        await application(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    start = sent[0]
+    headers = {key.decode(): value.decode() for key, value in start['headers']}
+    return start['status'], headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def test_reads_match_the_sync_views(asgi_db):
+    for path in ('/plans', '/subscriptions/active', '/subscriptions/active/optimized',
+                 '/subscriptions/history', '/subscriptions/history/optimized'):
+        async_status, _, async_body = call('GET', path, headers=BASIC)
+        response = flask_app.test_client().get(path, headers=BASIC)
+        assert async_status == response.status_code == 200, path
+        assert json.loads(async_body) == response.get_json(), path
+
+
+def test_history_pages_and_streams(asgi_db):
+    status, headers, body = call('GET', '/subscriptions/history', 'limit=2', BASIC)
+    assert status == 200 and len(json.loads(body)) == 2
+    cursor = headers['x-next-cursor']
+
+    _, headers, body = call('GET', '/subscriptions/history/optimized', f'limit=2&cursor={cursor}', BASIC)
+    assert len(json.loads(body)) == 1 and 'x-next-cursor' not in headers
+
+    _, _, body = call('GET', '/subscriptions/history', 'stream=1', BASIC)
+    assert len(json.loads(body)) == 3
+
+
+def test_rejects_bad_credentials_and_falls_back_to_wsgi(asgi_db):
+    status, headers, _ = call('GET', '/subscriptions/active', headers={'Authorization': 'Basic Ym9ndXM='})
+    assert status == 401 and headers['www-authenticate'].startswith('Basic')
+
+    # Writes go through the sync Flask views; the async read sees the change.
+    status, _, _ = call('POST', '/subscriptions/cancel', headers=BASIC)
+    assert status == 200
+    status, _, body = call('GET', '/subscriptions/active/optimized', headers=BASIC)
+    assert status == 200 and json.loads(body) == []
+
+
+def test_conditional_reads_match_the_sync_views(asgi_db):
+    assert call('POST', '/subscriptions/cancel', headers=BASIC)[0] == 200
+    for path in ('/plans', '/subscriptions/active/optimized', '/subscriptions/history'):
+        status, headers, _ = call('GET', path, headers=BASIC)
+        etag = headers['etag']
+        assert status == 200 and etag == flask_app.test_client().get(path, headers=BASIC).headers['ETag'], path
+        status, _, body = call('GET', path, headers={**BASIC, 'If-None-Match': etag})
+        assert status == 304 and body == b'', path
@@ -0,0 +1,84 @@
+from datetime import datetime
+from tests import app, db_session
+
+from benchmarks.datagen import generate
+from benchmarks.entitlements import run_index
+from benchmarks.export import run_variant
+from benchmarks.run import compare, percentile, run_benchmarks, run_revalidations
+from benchmarks.serialization import run as run_serialization
+from src import app as flask_app
+from src.models import SubscriptionStatus, UserSubscription
+from src.utils.current_subscription import verify_current_subscriptions
+from sqlalchemy import func
+
+
+def test_generated_data_is_consistent(db_session):
+    now = datetime.utcnow()
+    counts = generate(db_session.get_bind(), 300, chunk_size=100, now=now)
+
+    assert counts['users'] == 300
+    assert db_session.query(UserSubscription).count() == counts['subscriptions']
+    statuses = dict(db_session.query(UserSubscription.status, func.count()).group_by(UserSubscription.status).all())
+    assert set(statuses) == set(SubscriptionStatus)
+    # At most one ACTIVE subscription per user, and only if it has not ended yet.
+    assert db_session.query(UserSubscription.user_id).filter_by(status=SubscriptionStatus.ACTIVE) \
+        .group_by(UserSubscription.user_id).having(func.count() > 1).count() == 0
+    assert db_session.query(UserSubscription).filter(
+        UserSubscription.status == SubscriptionStatus.ACTIVE, UserSubscription.end_date <= now).count() == 0
+    assert verify_current_subscriptions(db_session)['missing'] == 0
+
+
+def test_run_reports_percentiles(db_session):
+    generate(db_session.get_bind(), 50)
+
+    results = run_benchmarks(flask_app, 50, iterations=20, warmup=2)
+
+    assert set(results) == {'active_orm', 'active_optimized', 'history_orm', 'history_optimized'}
+    for result in results.values():
+        assert result['iterations'] == 20
+        assert 0 < result['p50'] <= result['p95'] <= result['p99']
+
+    # Every call is asserted to end in a 304.
+    revalidations = run_revalidations(flask_app, 50, iterations=20, warmup=2)
+    assert set(revalidations) == {'active_304', 'history_304', 'plans_304'}
+
+
+def test_export_variants_cover_every_row(db_session):
+    counts = generate(db_session.get_bind(), 50)
+
+    materialized = run_variant('materialized', chunk_size=20)
+    streamed = run_variant('ndjson', chunk_size=20)
+
+    assert materialized['rows'] == streamed['rows'] == counts['subscriptions']
+    # Same objects either way: '[', ']' and n - 1 commas become n newlines.
+    assert streamed['bytes'] == materialized['bytes'] - 1
+
+
+def test_percentile_and_compare():
+    samples = list(range(1, 101))
+    assert [percentile(samples, pct) for pct in (50, 95, 99)] == [50, 95, 99]
+
+    baseline = {'history_orm': {'p95': 0.010}, 'history_optimized': {'p95': 0.004}}
+    current = {'history_orm': {'p95': 0.011}, 'history_optimized': {'p95': 0.006}, 'new_path': {'p95': 1.0}}
+    regressions = compare(baseline, current, threshold=0.2)
+
+    assert list(regressions) == ['history_optimized']
+    assert round(regressions['history_optimized']['change'], 2) == 0.5
+
+
+def test_serialization_encoders_agree():
+    # run() raises if any encoder's output decodes differently from jsonify's.
+    results = run_serialization(rows=200, repeat=2)
+
+    assert {'jsonify', 'compiled'} <= set(results)
+    assert all(result['best_ms_per_10k'] > 0 for result in results.values())
+
+
+def test_entitlement_index_benchmark(db_session):
+    generate(db_session.get_bind(), 50)
+
+    result = run_index(50, lookups=200)
+
+    # One 8-byte slot per user id, plus the unused slot 0.
+    assert result['memory_bytes'] == 8 * 51 and result['bytes_per_million_users'] == 8 * 51 / 50 * 1_000_000
+    assert 0 < result['active_share'] < 1 and result['lookups_per_second'] > 0
@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import patch
+from tests import app, db_session
+
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import bulk_apply_subscriptions
+from src.utils.current_subscription import verify_current_subscriptions
+from src.utils.identity import AuthenticatedUser
+
+
+@pytest.fixture
+def admin_user():
+    with patch("src.routes.bulk_subscriptions.auth.current_user", return_value=AuthenticatedUser(1, "admin")):
+        yield
+
+
+def seed(session, users=3):
+    for user_id in range(1, users + 1):
+        session.add(User(id=user_id, username=f"user{user_id}", password="x", email=f"user{user_id}@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name="Pro", price=20, duration_days=90))
+    session.commit()
+
+
+def run_bulk(app, operations):
+    with app.test_request_context('/', method='POST', json={'operations': operations}):
+        response, status_code = bulk_apply_subscriptions()
+        return response.get_json(), status_code
+
+
+def active_plans(session):
+    rows = session.query(UserSubscription.user_id, UserSubscription.plan_id).filter_by(status=SubscriptionStatus.ACTIVE)
+    return dict(rows.all())
+
+
+def test_bulk_applies_operations_in_order(app, db_session, admin_user):
+    seed(db_session)
+
+    body, status_code = run_bulk(app, [
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 1},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': 1},
+        {'op': 'upgrade', 'user_id': 1, 'plan_id': 2},
+        {'op': 'cancel', 'user_id': 2},
+        {'op': 'subscribe', 'user_id': 3, 'plan_id': 2},
+    ])
+
+    assert status_code == 200
+    assert body['succeeded'] == 5
+    assert body['failed'] == 0
+    assert body['operations_per_second'] > 0
+    assert active_plans(db_session) == {1: 2, 3: 2}
+    assert db_session.query(UserSubscription).count() == 4
+    assert verify_current_subscriptions(db_session)['sample_user_ids'] == []
+
+
+def test_bulk_reports_per_item_errors(app, db_session, admin_user):
+    seed(db_session)
+
+    body, status_code = run_bulk(app, [
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 1},
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 2},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': 99},
+        {'op': 'cancel', 'user_id': 3},
+        {'op': 'subscribe', 'user_id': 42, 'plan_id': 1},
+        {'op': 'refund', 'user_id': 1},
+    ])
+
+    assert status_code == 200
+    assert [result['status'] for result in body['results']] == ['ok', 'error', 'error', 'error', 'error', 'error']
+    assert body['results'][1]['message'] == 'User already has an active subscription'
+    assert body['results'][2]['message'] == 'Subscription plan not found'
+    assert body['results'][4]['message'] == 'User not found'
+    assert active_plans(db_session) == {1: 1}
+
+
+def test_bulk_rejects_non_integer_ids_per_item(app, db_session, admin_user):
+    seed(db_session)
+
+    body, status_code = run_bulk(app, [
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': [1]},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': {'id': 1}},
+        {'op': 'subscribe', 'user_id': True, 'plan_id': 1},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': True},
+        {'op': 'cancel', 'user_id': [1]},
+        {'op': ['subscribe'], 'user_id': 2},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': 1},
+    ])
+
+    assert status_code == 200
+    assert [result['status'] for result in body['results']] == ['error'] * 6 + ['ok']
+    assert {body['results'][index]['message'] for index in (0, 1, 3)} == {'plan_id must be an integer'}
+    assert {body['results'][index]['message'] for index in (2, 4)} == {'user_id must be an integer'}
+
+
+def test_bulk_chunks_see_previous_chunks(app, db_session, admin_user):
+    seed(db_session)
+    app.config['BULK_CHUNK_SIZE'] = 1
+
+    body, status_code = run_bulk(app, [
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 1},
+        {'op': 'upgrade', 'user_id': 1, 'plan_id': 2},
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 1},
+    ])
+
+    assert [result['status'] for result in body['results']] == ['ok', 'ok', 'error']
+    assert active_plans(db_session) == {1: 2}
+
+
+def test_bulk_requires_admin(app, db_session):
+    with patch("src.routes.bulk_subscriptions.auth.current_user", return_value=AuthenticatedUser(2, "bob")):
+        body, status_code = run_bulk(app, [{'op': 'cancel', 'user_id': 1}])
+    assert status_code == 403
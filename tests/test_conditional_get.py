@@ -0,0 +1,124 @@
+import base64
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, update
+from werkzeug.security import generate_password_hash
+from tests import file_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, User, UserCurrentSubscription, UserSubscription, UserSubscriptionVersion
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.subscription_versions import bump_subscription_versions, subscription_etag
+
+READS = ('/subscriptions/active', '/subscriptions/active/optimized', '/subscriptions/history', '/subscriptions/history/optimized')
+
+
+def basic(username):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:secret'.encode()).decode('ascii')}
+
+
+@pytest.fixture
+def session(file_session, monkeypatch):
+    session = file_session
+    for user_id, name in ((1, 'admin'), (2, 'alice'), (3, 'bob')):
+        session.add(User(id=user_id, username=name, password=generate_password_hash('secret'), email=f'{name}@example.com'))
+    session.add(SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name='Pro', price=60, duration_days=90))
+    session.commit()
+    monkeypatch.setitem(flask_app.config, 'ADMISSION_CONTROL_ENABLED', False)
+    return session
+
+
+def get(path, username='alice', etag=None):
+    headers = basic(username)
+    if etag:
+        headers['If-None-Match'] = f'"{etag}"'
+    return flask_app.test_client().get(path, headers=headers)
+
+
+def test_unchanged_reads_are_304_after_one_version_lookup(session):
+    client = flask_app.test_client()
+    # No version row yet: full responses, untagged.
+    assert 'ETag' not in get('/subscriptions/history').headers
+
+    assert client.post('/subscribe/1', headers=basic('alice')).status_code == 201
+    tags = {}
+    for path in READS:
+        response = get(path)
+        assert response.status_code == 200 and response.headers['Cache-Control'] == 'private, no-cache'
+        tags[path] = response.get_etag()[0]
+    assert set(tags.values()) == {'u2.v1'}
+
+    statements = []
+    event.listen(session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    for path in READS:
+        response = get(path, etag=tags[path])
+        assert response.status_code == 304 and response.data == b'' and response.get_etag() == ('u2.v1', False)
+    # Basic auth comes from the credential cache: one primary-key lookup per request.
+    assert len(statements) == len(READS)
+    assert all('FROM user_subscription_versions' in statement and 'JOIN' not in statement for statement in statements)
+
+    # Another user's tag never matches.
+    assert client.post('/subscribe/2', headers=basic('bob')).status_code == 201
+    assert get('/subscriptions/active', username='bob', etag='u2.v1').status_code == 200
+
+    for write in ('/subscriptions/upgrade/2', '/subscriptions/cancel'):
+        assert client.post(write, headers=basic('alice')).status_code == 200
+        response = get('/subscriptions/history', etag=tags['/subscriptions/history'])
+        assert response.status_code == 200 and response.get_etag()[0] != tags['/subscriptions/history']
+        tags['/subscriptions/history'] = response.get_etag()[0]
+    assert tags['/subscriptions/history'] == 'u2.v3'
+
+
+def test_expired_subscription_is_not_validated_until_swept(session):
+    assert flask_app.test_client().post('/subscribe/1', headers=basic('alice')).status_code == 201
+    etag = get('/subscriptions/history').get_etag()[0]
+
+    # Past end_date the history says Inactive, though nothing was written yet.
+    ended = datetime.utcnow() - timedelta(seconds=1)
+    session.execute(update(UserSubscriptionVersion).values(expires_at=ended))
+    session.commit()
+    assert subscription_etag(session, 2) is None
+    response = get('/subscriptions/history', etag=etag)
+    assert response.status_code == 200 and 'ETag' not in response.headers
+
+    session.execute(update(UserSubscription).values(end_date=ended))
+    session.commit()
+    assert sweep_expired_subscriptions(session)['rows'] == 1
+    assert subscription_etag(session, 2) == 'u2.v2'
+    response = get('/subscriptions/history', etag='u2.v2')
+    assert response.status_code == 304
+
+
+def test_cached_body_is_not_served_under_a_newer_version(session):
+    assert flask_app.test_client().post('/subscribe/1', headers=basic('alice')).status_code == 201
+    assert get('/subscriptions/active/optimized').get_json()[0]['name'] == 'Basic'
+
+    # Another worker changes the plan: this worker's cache still holds the Basic body.
+    session.execute(update(UserCurrentSubscription).values(plan_name='Pro'))
+    bump_subscription_versions(session, {2: datetime.utcnow() + timedelta(days=90)})
+    session.commit()
+    response = get('/subscriptions/active/optimized')
+    assert response.get_etag()[0] == 'u2.v2' and response.get_json()[0]['name'] == 'Pro'
+
+
+def test_bulk_writes_bump_every_changed_user(session):
+    client = flask_app.test_client()
+    operations = [{'op': 'subscribe', 'user_id': 2, 'plan_id': 1}, {'op': 'subscribe', 'user_id': 3, 'plan_id': 2},
+                  {'op': 'cancel', 'user_id': 3}]
+    assert client.post('/admin/subscriptions/bulk', json={'operations': operations}, headers=basic('admin')).status_code == 200
+    versions = {row.user_id: row for row in session.query(UserSubscriptionVersion)}
+    assert versions[2].version == 1 and versions[2].expires_at > datetime.utcnow()
+    assert versions[3].version == 1 and versions[3].expires_at is None
+
+
+def test_plans_etag_follows_the_catalog_version(session):
+    client = flask_app.test_client()
+    response = get('/plans')
+    etag = response.get_etag()[0]
+    assert response.status_code == 200 and etag == 'plans.v0'
+    assert get('/plans', etag=etag).status_code == 304
+
+    assert client.post('/plans', json={'name': 'Team', 'price': 90, 'duration_days': 30}, headers=basic('admin')).status_code == 201
+    response = get('/plans', etag=etag)
+    assert response.status_code == 200 and response.get_etag()[0] == 'plans.v1' and len(response.get_json()) == 3
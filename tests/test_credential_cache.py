@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from werkzeug.security import generate_password_hash
+from src import db, verify_password
+from tests import app
+
+from src.models import User
+from src.utils.credential_cache import CredentialCache, get_credential_cache
+
+
+@pytest.fixture
+def mock_db_session():
+    with patch.object(db, 'session') as mock_session:
+        query_mock = MagicMock()
+        mock_session.query.return_value = query_mock
+        query_mock.filter_by.return_value = query_mock
+        query_mock.first.return_value = None
+        mock_session.query_mock = query_mock
+        yield mock_session
+
+
+def create_user(password="secret"):
+    return User(id=7, username="alice", password=generate_password_hash(password, method='pbkdf2:sha256:1000'), email="alice@example.com")
+
+
+def test_verify_password_caches_successful_verification(app, mock_db_session):
+    with app.app_context():
+        mock_db_session.query_mock.first.return_value = create_user()
+
+        first = verify_password("alice", "secret")
+        second = verify_password("alice", "secret")
+
+        assert first == second
+        assert second.id == 7 and second.username == "alice"
+        assert mock_db_session.query.call_count == 1
+        stats = get_credential_cache().stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+
+def test_verify_password_wrong_password_is_not_cached(app, mock_db_session):
+    with app.app_context():
+        mock_db_session.query_mock.first.return_value = create_user()
+
+        assert verify_password("alice", "secret")
+        assert verify_password("alice", "wrong") is None
+        assert verify_password("alice", "wrong") is None
+        assert mock_db_session.query.call_count == 3
+
+
+def test_password_change_invalidates_cached_credentials(app, mock_db_session):
+    with app.app_context():
+        user = create_user()
+        mock_db_session.query_mock.first.return_value = user
+        assert verify_password("alice", "secret")
+
+        user.password = generate_password_hash("changed", method='pbkdf2:sha256:1000')
+
+        assert verify_password("alice", "secret") is None
+        assert verify_password("alice", "changed")
+        assert mock_db_session.query.call_count == 3
+
+
+def test_credential_cache_expires_entries():
+    cache = CredentialCache(max_size=2, ttl=0)
+    cache.remember("alice", "secret", object())
+    assert cache.lookup("alice", "secret") is None
+
+
+def test_credential_cache_is_bounded():
+    cache = CredentialCache(max_size=2, ttl=60)
+    for name in ("a", "b", "c"):
+        cache.remember(name, "pw", name)
+    assert cache.lookup("a", "pw") is None
+    assert cache.lookup("c", "pw") == "c"
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from tests import app, db_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserCurrentSubscription, UserSubscription
+from src.routes import cancel_subscription, subscribe_user, upgrade_subscription
+from src.utils.current_subscription import refresh_current_subscriptions, verify_current_subscriptions
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.identity import AuthenticatedUser
+
+
+def seed(session):
+    for user_id in (1, 2):
+        session.add(User(id=user_id, username=f"user{user_id}", password="x", email=f"user{user_id}@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name="Pro", price=20, duration_days=90))
+    session.commit()
+
+
+def current(session, user_id):
+    session.expire_all()
+    return session.get(UserCurrentSubscription, user_id)
+
+
+def test_write_paths_maintain_projection(app, db_session):
+    seed(db_session)
+    user = AuthenticatedUser(1, "user1")
+
+    subscribe_user(user, 1)
+    row = current(db_session, 1)
+    assert (row.plan_name, row.price) == ("Basic", 10)
+    assert row.subscription_id == db_session.query(UserSubscription.id).filter_by(status=SubscriptionStatus.ACTIVE).scalar()
+
+    upgrade_subscription(user, 2)
+    row = current(db_session, 1)
+    assert (row.plan_id, row.plan_name, row.duration_days) == (2, "Pro", 90)
+
+    cancel_subscription(user)
+    assert current(db_session, 1) is None
+    assert verify_current_subscriptions(db_session) == {'missing': 0, 'stale': 0, 'sample_user_ids': []}
+
+
+def test_sweeper_clears_projection_of_expired_rows(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+
+    sweep_expired_subscriptions(db_session, now=datetime.utcnow() + timedelta(days=31))
+
+    assert current(db_session, 1) is None
+    assert verify_current_subscriptions(db_session)['stale'] == 0
+
+
+def test_verify_detects_drift_and_rebuild_repairs_it(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    subscribe_user(AuthenticatedUser(2, "user2"), 2)
+    db_session.query(UserCurrentSubscription).filter_by(user_id=1).delete()
+    db_session.query(UserCurrentSubscription).filter_by(user_id=2).update({'plan_id': 1})
+    db_session.commit()
+
+    assert verify_current_subscriptions(db_session) == {'missing': 1, 'stale': 1, 'sample_user_ids': [1, 2]}
+
+    refresh_current_subscriptions(db_session)
+    db_session.commit()
+
+    assert verify_current_subscriptions(db_session)['sample_user_ids'] == []
+    assert current(db_session, 2).plan_name == "Pro"
+
+
+def test_cli_verify_and_rebuild(db_session):
+    seed(db_session)
+    db_session.add(UserSubscription(user_id=1, plan_id=1, end_date=datetime.utcnow() + timedelta(days=1)))
+    db_session.commit()
+    runner = flask_app.test_cli_runner()
+
+    assert runner.invoke(args=['current-subscriptions', 'verify']).exit_code == 1
+    result = runner.invoke(args=['current-subscriptions', 'rebuild'])
+    assert 'Rebuilt 1 current subscriptions' in result.output
+    assert runner.invoke(args=['current-subscriptions', 'verify']).exit_code == 0
@@ -0,0 +1,112 @@
+import pytest
+from flask import Flask, g
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exc, update
+from unittest.mock import patch
+
+from src import db
+from src.models import Base, SubscriptionPlan, User
+from src.routes import get_all_plans, subscribe_user
+from src.utils.db_routing import (
+    READ_YOUR_WRITES_COOKIE,
+    RoutingSession,
+    TimedQueuePool,
+    engine_options,
+    note_write,
+    pool_metrics,
+    replica_binds,
+    wrote_recently,
+)
+from src.utils.identity import AuthenticatedUser
+
+
+@pytest.fixture
+def routed(tmp_path):
+    """A primary and a replica SQLite file, seeded differently so reads show where they went."""
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary}'
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(f'sqlite:///{replica}')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], 2, 0, 0.2, 1800, True)
+    routed_db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    with app.app_context():
+        for key, name in ((None, 'Primary'), ('replica_0', 'Replica')):
+            engine = routed_db.engines[key]
+            Base.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(SubscriptionPlan.__table__.insert(), [{'id': 1, 'name': name, 'price': 10, 'duration_days': 30}])
+                connection.execute(User.__table__.insert(), [{'id': 1, 'username': 'alice', 'password': 'x', 'email': 'a@example.com'}])
+    # Each test_request_context below gets its own app context, so its own g and session.
+    with patch.object(db, 'session', routed_db.session):
+        yield app, routed_db
+    with app.app_context():
+        for engine in routed_db.engines.values():
+            engine.dispose()
+
+
+def test_marked_reads_go_to_the_replica(routed):
+    app, routed_db = routed
+    with app.test_request_context():
+        assert get_all_plans()[0]['name'] == 'Primary'
+
+    with app.test_request_context():
+        g.read_replica = True
+        assert routed_db.session.get(SubscriptionPlan, 1).name == 'Replica'
+        # DML is never routed to a replica, even inside a read-only request.
+        routed_db.session.execute(update(SubscriptionPlan).values(price=99))
+        routed_db.session.commit()
+
+    with app.test_request_context():
+        assert routed_db.session.get(SubscriptionPlan, 1).price == 99
+
+
+def test_write_paths_stay_on_the_primary(routed):
+    app, routed_db = routed
+    with app.test_request_context():
+        g.read_replica = True
+        assert subscribe_user(AuthenticatedUser(1, 'alice'), 1)[1] == 201
+
+    with app.test_request_context():
+        assert routed_db.session.execute(routed_db.text('SELECT COUNT(*) FROM user_subscriptions')).scalar() == 1
+        g.read_replica = True
+        assert routed_db.session.execute(routed_db.text('SELECT COUNT(*) FROM user_subscriptions')).scalar() == 0
+
+
+def test_read_your_writes_window(routed):
+    app, _ = routed
+    app.config['READ_YOUR_WRITES_SECONDS'] = 30
+    with app.test_request_context():
+        assert not wrote_recently(1)
+        note_write(1)
+        assert wrote_recently(1)
+        assert not wrote_recently(2)
+
+    # Another worker only sees the cookie set on the write response.
+    with app.test_request_context(headers={'Cookie': f'{READ_YOUR_WRITES_COOKIE}=9999999999'}):
+        assert wrote_recently(2)
+
+
+def test_pool_metrics_record_waits_and_timeouts(routed):
+    app, routed_db = routed
+    with app.app_context():
+        engine = routed_db.engines[None]
+    assert isinstance(engine.pool, TimedQueuePool)
+
+    held = [engine.connect(), engine.connect()]
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    for connection in held:
+        connection.close()
+
+    lines = []
+    pool_metrics.render(lines)
+    assert pool_metrics.wait['primary'].count >= 3
+    assert pool_metrics.timeouts['primary'] >= 1
+    assert any(line.startswith('db_pool_checkout_wait_seconds_count{pool="primary"}') for line in lines)
+    assert 'db_pool_checked_out{pool="primary"} 0' in lines
+
+
+def test_in_memory_sqlite_keeps_default_pool():
+    options = engine_options('sqlite://', 5, 10, 30, 1800, True)
+    assert 'poolclass' not in options and options['pool_pre_ping'] is True
+    assert engine_options('mysql+pymysql://u:p@db/app', 5, 10, 30, 1800, True)['pool_size'] == 5
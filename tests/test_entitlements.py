@@ -0,0 +1,124 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, update
+from tests import app, db_session, file_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import cancel_subscription, subscribe_user, upgrade_subscription
+from src.utils.entitlements import EPOCH, EntitlementIndex, encode_slot
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.identity import AuthenticatedUser
+
+TOKEN = {'X-Service-Token': 'billing-secret'}
+
+
+def seed(session, users=4):
+    for user_id in range(1, users + 1):
+        session.add(User(id=user_id, username=f'user{user_id}', password='x', email=f'user{user_id}@example.com'))
+    session.add(SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name='Pro', price=60, duration_days=90))
+    session.commit()
+
+
+def epoch(moment):
+    return (moment - EPOCH).total_seconds()
+
+
+def test_index_loads_with_one_scan_and_follows_updated_at(app, db_session):
+    seed(db_session)
+    now = datetime.utcnow()
+    db_session.add(UserSubscription(user_id=1, plan_id=2, start_date=now, end_date=now + timedelta(days=90)))
+    db_session.add(UserSubscription(user_id=2, plan_id=1, start_date=now - timedelta(days=60), end_date=now - timedelta(days=30),
+                                    status=SubscriptionStatus.INACTIVE))
+    db_session.add(UserSubscription(user_id=3, plan_id=1, start_date=now, end_date=None))
+    db_session.commit()
+
+    index = EntitlementIndex(batch_size=2)
+    assert index.load(db_session) == 2
+    assert index.memory_bytes() == 8 * len(index.slots) and len(index.slots) == 5
+    assert index.lookup(1)[0] == 2 and index.lookup(1)[1] >= epoch(now + timedelta(days=90))
+    assert index.lookup(2) is None and index.lookup(3) == (1, None) and index.lookup(4) is None
+    assert index.lookup(10 ** 6) is None and index.lookup(-1) is None
+    # Expiry is a clock comparison, no refresh needed.
+    assert index.lookup(1, now=epoch(now + timedelta(days=91))) is None
+
+    subscribe_user(AuthenticatedUser(2, 'user2'), 2)
+    upgrade_subscription(AuthenticatedUser(1, 'user1'), 1)
+    cancel_subscription(AuthenticatedUser(3, 'user3'))
+    # A user created after the load lands past the end of the array.
+    db_session.add(User(id=5000, username='late', password='x', email='late@example.com'))
+    db_session.add(UserSubscription(user_id=5000, plan_id=1, start_date=now, end_date=now + timedelta(days=30)))
+    db_session.commit()
+
+    result = index.refresh(db_session)
+    assert result['users'] == 4 and result['batches'] >= 2
+    assert index.lookup(1)[0] == 1 and index.lookup(2)[0] == 2 and index.lookup(3) is None and index.lookup(5000)[0] == 1
+
+    # An ended subscription stops counting before the sweeper flips it...
+    db_session.execute(update(UserSubscription).where(UserSubscription.user_id == 2).values(end_date=now - timedelta(seconds=1)))
+    db_session.commit()
+    index.refresh(db_session)
+    assert index.lookup(2) is None and index.slots[2] != 0
+    # ...and the flip is a change like any other.
+    sweep_expired_subscriptions(db_session)
+    index.refresh(db_session)
+    assert index.slots[2] == 0
+
+    # Overlap: a row committed late with an updated_at behind the watermark is still seen.
+    late = index.watermark[0] - timedelta(seconds=5)
+    db_session.add(UserSubscription(user_id=4, plan_id=2, start_date=now, end_date=now + timedelta(days=90), updated_at=late))
+    db_session.commit()
+    index.refresh(db_session)
+    assert index.lookup(4)[0] == 2
+
+
+def test_slot_encoding():
+    end = datetime(2030, 1, 1, 0, 0, 0, 500000)
+    slot = encode_slot(7, end)
+    assert slot >> 32 == 7 and slot & 0xFFFFFFFF == epoch(end) + 0.5
+    assert encode_slot(7, None) & 0xFFFFFFFF == 0xFFFFFFFF
+    assert encode_slot(7, datetime(1960, 1, 1)) & 0xFFFFFFFF == 1
+
+
+@pytest.fixture
+def session(file_session, monkeypatch):
+    session = file_session
+    seed(session)
+    now = datetime.utcnow()
+    session.add(UserSubscription(user_id=2, plan_id=2, start_date=now, end_date=now + timedelta(days=90)))
+    session.commit()
+    monkeypatch.setitem(flask_app.config, 'ENTITLEMENT_SERVICE_TOKENS', 'old-secret, billing-secret')
+    monkeypatch.setitem(flask_app.config, 'ENTITLEMENT_REFRESH_SECONDS', 0)
+    return session
+
+
+def test_entitlement_routes_answer_from_memory(session):
+    client = flask_app.test_client()
+    assert client.get('/internal/entitlements/2').status_code == 401
+    assert client.get('/internal/entitlements/2', headers={'X-Service-Token': 'guess'}).status_code == 401
+
+    # The first call loads the index; after that no request touches the database.
+    assert client.get('/internal/entitlements/1', headers=TOKEN).get_json()['active'] is False
+    statements = []
+    event.listen(session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    response = client.get('/internal/entitlements/2', headers=TOKEN)
+    body = response.get_json()
+    assert body['active'] is True and body['plan_id'] == 2 and body['end_date'] > datetime.utcnow().isoformat()
+    assert float(response.headers['X-Entitlements-Age-Seconds']) >= 0
+
+    response = client.get('/internal/entitlements?user_ids=1,2,99', headers=TOKEN)
+    assert [(item['user_id'], item['active']) for item in response.get_json()['entitlements']] == [(1, False), (2, True), (99, False)]
+    assert client.get('/internal/entitlements?user_ids=1,x', headers=TOKEN).status_code == 400
+    assert client.get('/internal/entitlements', headers=TOKEN).status_code == 400
+    assert statements == []
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'entitlement_index_memory_bytes' in metrics
+
+
+def test_routes_are_closed_without_configured_tokens(session, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'ENTITLEMENT_SERVICE_TOKENS', '')
+    assert flask_app.test_client().get('/internal/entitlements/2', headers=TOKEN).status_code == 401
+    assert 'entitlement_index' not in flask_app.extensions
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from unittest.mock import patch
+from tests import db_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription, UserSubscriptionVersion
+from src.utils.expiry_sweeper import metrics, sweep_expired_subscriptions
+from src.utils.subscription_versions import bump_subscription_versions
+
+
+def seed(session, expired=5, current=2, now=None):
+    now = now or datetime.utcnow()
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    for user_id in range(1, expired + current + 1):
+        session.add(User(id=user_id, username=f"user{user_id}", password="x", email=f"user{user_id}@example.com"))
+        end_date = now - timedelta(days=user_id) if user_id <= expired else now + timedelta(days=user_id)
+        session.add(UserSubscription(user_id=user_id, plan_id=1, start_date=end_date - timedelta(days=30), end_date=end_date))
+    session.add(UserSubscription(user_id=1, plan_id=1, end_date=now - timedelta(days=60), status=SubscriptionStatus.CANCELLED))
+    session.commit()
+
+
+def statuses(session):
+    return [status for (status,) in session.query(UserSubscription.status).order_by(UserSubscription.id)]
+
+
+def test_sweep_flips_only_expired_active_rows_in_batches(db_session):
+    now = datetime.utcnow()
+    seed(db_session, now=now)
+
+    result = sweep_expired_subscriptions(db_session, batch_size=2, now=now)
+
+    assert result['rows'] == 5
+    assert result['batches'] == 3
+    assert result['lag_seconds'] >= timedelta(days=5).total_seconds()
+    assert statuses(db_session) == [SubscriptionStatus.INACTIVE] * 5 + [SubscriptionStatus.ACTIVE] * 2 + [SubscriptionStatus.CANCELLED]
+    assert metrics.snapshot()['last_rows'] == 5
+
+
+def test_sweep_respects_max_batches_and_resumes(db_session):
+    now = datetime.utcnow()
+    seed(db_session, now=now)
+
+    assert sweep_expired_subscriptions(db_session, batch_size=2, max_batches=1, now=now)['rows'] == 2
+    assert sweep_expired_subscriptions(db_session, batch_size=2, now=now)['rows'] == 3
+    assert sweep_expired_subscriptions(db_session, batch_size=2, now=now)['rows'] == 0
+
+
+def test_sweep_cli_command(db_session):
+    seed(db_session)
+
+    result = flask_app.test_cli_runner().invoke(args=['sweep-expired', '--batch-size', '10'])
+
+    assert result.exit_code == 0
+    assert 'Expired 5 subscriptions in 1 batches' in result.output
+
+
+def test_sweep_leaves_rows_replaced_since_the_candidate_select_alone(db_session):
+    now = datetime.utcnow()
+    seed(db_session, expired=1, current=0, now=now)
+    stale = select(UserSubscription.id, UserSubscription.user_id, UserSubscription.end_date).where(UserSubscription.id == 1)
+    # Between the candidate SELECT and the flip, user 1 cancels and subscribes again.
+    db_session.query(UserSubscription).filter_by(id=1).update({'status': SubscriptionStatus.CANCELLED})
+    renewed_until = now + timedelta(days=30)
+    db_session.add(UserSubscription(user_id=1, plan_id=1, start_date=now, end_date=renewed_until))
+    bump_subscription_versions(db_session, {1: renewed_until})
+    db_session.commit()
+
+    with patch('src.utils.expiry_sweeper.expired_subscriptions_query', return_value=stale):
+        assert sweep_expired_subscriptions(db_session, now=now, max_batches=1)['rows'] == 0
+
+    version = db_session.get(UserSubscriptionVersion, 1)
+    assert version.version == 1 and version.expires_at == renewed_until
+    assert db_session.get(UserSubscription, 1).status == SubscriptionStatus.CANCELLED
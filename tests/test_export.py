@@ -0,0 +1,70 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from tests import file_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.utils.export import gzip_chunks, iter_export, parse_export_filters
+
+START = datetime(2024, 1, 1)
+
+
+def basic(username):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:secret'.encode()).decode('ascii')}
+
+
+@pytest.fixture
+def session(file_session, monkeypatch):
+    session = file_session
+    for user_id, name in ((1, 'admin'), (2, 'alice')):
+        session.add(User(id=user_id, username=name, password=generate_password_hash('secret'), email=f'{name}@example.com'))
+    session.add(SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30))
+    statuses = [SubscriptionStatus.INACTIVE, SubscriptionStatus.CANCELLED] * 4 + [SubscriptionStatus.ACTIVE]
+    for index, status in enumerate(statuses):
+        start = START + timedelta(days=31 * index)
+        session.add(UserSubscription(id=index + 1, user_id=2, plan_id=1, status=status, start_date=start,
+                                     end_date=start + timedelta(days=30), created_at=start, updated_at=start))
+    session.commit()
+    monkeypatch.setitem(flask_app.config, 'ADMISSION_CONTROL_ENABLED', False)
+    return session
+
+
+def test_iter_export_filters_and_chunks(session):
+    filters = parse_export_filters('cancelled,active', 'start_date', '2024-02-01', '2024-09-01')
+    chunks = list(iter_export(session, filters, 'ndjson', chunk_size=2))
+
+    rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    assert [row['subscription_id'] for row in rows] == [2, 4, 6, 8]
+    assert len(chunks) == 2
+    assert rows[0]['username'] == 'alice' and rows[0]['plan_name'] == 'Basic' and rows[0]['status'] == 'cancelled'
+
+    with pytest.raises(ValueError):
+        parse_export_filters('EXPIRED')
+    with pytest.raises(ValueError):
+        parse_export_filters(since='yesterday')
+
+
+def test_gzip_chunks_round_trip():
+    assert gzip.decompress(b''.join(gzip_chunks(iter(['a\n', 'b\n'])))) == b'a\nb\n'
+
+
+def test_export_route_streams_csv_and_gzip(session):
+    client = flask_app.test_client()
+    assert client.get('/admin/subscriptions/export', headers=basic('alice')).status_code == 403
+    assert client.get('/admin/subscriptions/export?format=xml', headers=basic('admin')).status_code == 400
+
+    response = client.get('/admin/subscriptions/export?format=csv&status=ACTIVE', headers=basic('admin'))
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['subscription_id'], row['status'], row['start_date']) for row in rows] == [('9', 'active', '2024-09-05T00:00:00')]
+
+    response = client.get('/admin/subscriptions/export', headers={**basic('admin'), 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.get_data()).splitlines()) == 9
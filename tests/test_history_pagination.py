@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from tests import app, db_session
+
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import get_subscription_history_optimized_user, get_subscription_history_user
+from src.utils.pagination import decode_cursor, encode_cursor
+
+
+def seed_history(session):
+    session.add(User(id=1, username="alice", password="x", email="alice@example.com"))
+    session.add(User(id=2, username="bob", password="x", email="bob@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    base = datetime(2024, 1, 1)
+    # Two rows share a start_date to exercise the id tie-breaker.
+    start_dates = [base, base + timedelta(days=30), base + timedelta(days=30), base + timedelta(days=60), base + timedelta(days=90)]
+    for index, start_date in enumerate(start_dates, start=1):
+        session.add(UserSubscription(id=index, user_id=1, plan_id=1, start_date=start_date,
+                                     end_date=start_date + timedelta(days=30), status=SubscriptionStatus.CANCELLED))
+    session.add(UserSubscription(id=99, user_id=2, plan_id=1, start_date=base, end_date=base, status=SubscriptionStatus.CANCELLED))
+    session.commit()
+
+
+def fetch_all_pages(app, handler, limit):
+    pages = []
+    cursor = None
+    while True:
+        query = f'/?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        with app.test_request_context(query):
+            result = handler(1)
+            response = result[0] if isinstance(result, tuple) else result
+            pages.append(response.get_json())
+            cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return pages
+
+
+def test_cursor_round_trip():
+    start_date = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(start_date, 42)) == (start_date, 42)
+
+
+def test_history_keyset_pages_cover_every_row_once(app, db_session):
+    seed_history(db_session)
+
+    pages = fetch_all_pages(app, get_subscription_history_optimized_user, limit=2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [row['id'] for page in pages for row in page] == [5, 4, 3, 2, 1]
+
+
+def test_orm_history_keyset_pages_match_optimized(app, db_session):
+    seed_history(db_session)
+
+    pages = fetch_all_pages(app, get_subscription_history_user, limit=2)
+
+    rows = [row for page in pages for row in page]
+    assert len(rows) == 5
+    assert rows[0]['start_date'] == 'Sun, 31 Mar 2024 00:00:00 GMT'
+    assert rows[-1]['start_date'] == 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+def test_history_rejects_bad_cursor_and_limit(app, db_session):
+    with app.test_request_context('/?cursor=not-a-cursor'):
+        response, status_code = get_subscription_history_optimized_user(1)
+        assert status_code == 400
+    with app.test_request_context('/?limit=100000'):
+        response, status_code = get_subscription_history_user(1)
+        assert status_code == 400
+
+
+def test_history_stream_yields_full_json_array(app, db_session):
+    seed_history(db_session)
+
+    with app.test_request_context('/?stream=1'):
+        response = get_subscription_history_optimized_user(1)
+        body = response.get_data()
+
+    assert [row['id'] for row in json.loads(body)] == [5, 4, 3, 2, 1]
+
+
+def test_orm_history_never_lazy_loads_plans(app, db_session):
+    seed_history(db_session)
+    # Nothing in the identity map, so a lazy load would have to query.
+    db_session.expunge_all()
+    lazy_loads = []
+    event.listen(db_session, 'do_orm_execute', lambda state: lazy_loads.append(state) if state.is_relationship_load else None)
+
+    with app.test_request_context('/?stream=1'):
+        body = get_subscription_history_user(1)[0].get_data()
+    assert len(json.loads(body)) == 5
+    db_session.expunge_all()
+    assert len(fetch_all_pages(app, get_subscription_history_user, limit=2)) == 3
+    assert lazy_loads == []
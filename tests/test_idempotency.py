@@ -0,0 +1,134 @@
+import base64
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from unittest.mock import MagicMock, patch
+from werkzeug.security import generate_password_hash
+from tests import file_session
+
+from src import app as flask_app
+from src.models import IdempotencyKey, SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import subscribe_user
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.idempotency import get_idempotency_cache, purge_expired_idempotency_keys
+from src.utils.identity import AuthenticatedUser
+
+BASIC = {'Authorization': 'Basic ' + base64.b64encode(b'alice:secret').decode('ascii')}
+
+
+@pytest.fixture
+def session(file_session):
+    file_session.add(User(id=1, username='alice', password=generate_password_hash('secret'), email='alice@example.com'))
+    file_session.add_all([SubscriptionPlan(id=1, name='Basic', price=10, duration_days=30),
+                          SubscriptionPlan(id=2, name='Pro', price=20, duration_days=90)])
+    file_session.commit()
+    return file_session
+
+
+def post(path, key=None):
+    headers = dict(BASIC, **({'Idempotency-Key': key} if key else {}))
+    return flask_app.test_client().post(path, headers=headers)
+
+
+def test_retry_replays_the_first_response(session):
+    first = post('/subscribe/1', 'k1')
+    assert first.status_code == 201 and 'Idempotent-Replayed' not in first.headers
+
+    replayed = post('/subscribe/1', 'k1')
+    assert replayed.status_code == 201 and replayed.headers['Idempotent-Replayed'] == 'true'
+    assert replayed.get_json() == first.get_json()
+
+    # Another worker has no memory of the key and replays from the table.
+    with flask_app.app_context():
+        get_idempotency_cache().clear()
+    assert post('/subscribe/1', 'k1').get_json() == first.get_json()
+    assert session.query(UserSubscription).count() == 1
+
+    # Without a key the view runs again and finds the active subscription.
+    assert post('/subscribe/1').status_code == 400
+
+
+def test_key_reuse_in_progress_and_expiry(session):
+    assert post('/subscribe/1', 'k1').status_code == 201
+    assert post('/subscriptions/upgrade/2', 'k1').status_code == 422
+
+    now = datetime.utcnow()
+    session.add(IdempotencyKey(user_id=1, key='running', fingerprint='x', claim='x', expires_at=now + timedelta(hours=1)))
+    session.add(IdempotencyKey(user_id=1, key='old', fingerprint='x', claim='x', status_code=200, body='{}', expires_at=now))
+    session.commit()
+    response = post('/subscriptions/cancel', 'running')
+    assert response.status_code == 409 and response.headers['Retry-After'] == '1'
+
+    # An expired key is claimed afresh and the view really runs.
+    assert post('/subscriptions/cancel', 'old').get_json() == {'message': 'Subscription cancelled'}
+    assert session.get(IdempotencyKey, (1, 'old')).status_code == 200
+
+    assert post('/subscribe/1', 'x' * 256).status_code == 400
+    assert purge_expired_idempotency_keys(session, now=now + timedelta(days=2)) == 3
+
+
+def test_claim_left_by_a_killed_worker_is_taken_over_after_its_lease(session):
+    # The worker claims the key a minute ago, then is killed mid-view (a gunicorn
+    # timeout raises SystemExit, which skips the cleanup that exceptions get).
+    with patch('src.utils.idempotency.datetime') as clock, \
+            patch('src.routes.subscriptions.set_current_subscription', side_effect=SystemExit):
+        clock.utcnow.return_value = datetime.utcnow() - timedelta(seconds=61)
+        with pytest.raises(SystemExit):
+            post('/subscribe/1', 'orphan')
+    assert session.get(IdempotencyKey, (1, 'orphan')).status_code is None
+    session.rollback()
+
+    response = post('/subscribe/1', 'orphan')
+    assert response.status_code == 201 and 'Idempotent-Replayed' not in response.headers
+    stored = session.get(IdempotencyKey, (1, 'orphan'), populate_existing=True)
+    assert stored.status_code == 201 and stored.expires_at > datetime.utcnow() + timedelta(hours=23)
+
+
+def test_claims_survive_a_datetime_column_without_microseconds(session):
+    # MySQL DATETIME stores whole seconds; SQLite would otherwise keep what the request's clock said.
+    def whole_seconds(mapper, connection, target):
+        target.created_at = target.created_at.replace(microsecond=0)
+
+    event.listen(IdempotencyKey, 'before_insert', whole_seconds)
+    try:
+        with patch('src.utils.idempotency.datetime') as clock:
+            clock.utcnow.return_value = datetime.utcnow().replace(microsecond=123456)
+            first = post('/subscribe/1', 'precise')
+    finally:
+        event.remove(IdempotencyKey, 'before_insert', whole_seconds)
+
+    assert first.status_code == 201
+    stored = session.get(IdempotencyKey, (1, 'precise'), populate_existing=True)
+    assert stored.status_code == 201 and stored.created_at.microsecond == 0
+    with flask_app.app_context():
+        get_idempotency_cache().clear()
+    assert post('/subscribe/1', 'precise').headers['Idempotent-Replayed'] == 'true'
+
+
+def test_database_allows_one_active_subscription_per_user(session):
+    now = datetime.utcnow()
+    rows = [{'user_id': 1, 'plan_id': 1, 'start_date': now, 'end_date': now - timedelta(days=1), 'status': status}
+            for status in (SubscriptionStatus.ACTIVE, SubscriptionStatus.CANCELLED, SubscriptionStatus.CANCELLED)]
+    session.execute(insert(UserSubscription), rows)
+    session.commit()
+    with pytest.raises(IntegrityError):
+        session.execute(insert(UserSubscription), rows[:1])
+    session.rollback()
+
+    # Core updates that leave ACTIVE free the slot too.
+    assert sweep_expired_subscriptions(session, now=now)['rows'] == 1
+    session.execute(insert(UserSubscription), rows[:1])
+    session.commit()
+
+
+def test_subscribe_race_loser_gets_conflict(session):
+    with flask_app.test_request_context():
+        assert subscribe_user(AuthenticatedUser(1, 'alice'), 1)[1] == 201
+        # The loser's active-subscription check ran before the winner committed.
+        stale_check = MagicMock()
+        stale_check.return_value.filter_by.return_value.first.return_value = None
+        with patch.object(session, 'query', stale_check):
+            response, status_code = subscribe_user(AuthenticatedUser(1, 'alice'), 2)
+    assert status_code == 409
+    assert session.query(UserSubscription).filter_by(status=SubscriptionStatus.ACTIVE).count() == 1
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from flask import Flask, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from tests import db_session
+
+from src import db
+from src.models import SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.utils.instrumentation import init_instrumentation, statement_shape
+from src.routes.metrics import export_metrics
+
+
+def plan_names(user_id):
+    # One query for the subscriptions, then a lazy load per plan.
+    return jsonify([sub.plan.name for sub in db.session.query(UserSubscription).filter_by(user_id=user_id)])
+
+
+def failing_then_good():
+    try:
+        db.session.execute(text('SELECT * FROM no_such_table'))
+    except OperationalError:
+        db.session.rollback()
+    db.session.execute(text('SELECT 1'))
+    return jsonify(pending=len(db.session.connection().info['query_start_time']))
+
+
+def create_instrumented_app():
+    app = Flask(__name__)
+    app.config['N_PLUS_ONE_THRESHOLD'] = 5
+    init_instrumentation(app)
+    app.add_url_rule('/plans/<int:user_id>', 'plans', plan_names)
+    app.add_url_rule('/metrics', 'metrics', export_metrics)
+    app.add_url_rule('/failing', 'failing', failing_then_good)
+    return app
+
+
+def seed(session, plans=6):
+    session.add(User(id=1, username="alice", password="x", email="alice@example.com"))
+    now = datetime.utcnow()
+    for plan_id in range(1, plans + 1):
+        session.add(SubscriptionPlan(id=plan_id, name=f"Plan {plan_id}", price=plan_id, duration_days=30))
+        session.add(UserSubscription(user_id=1, plan_id=plan_id, start_date=now - timedelta(days=plan_id), end_date=now,
+                                     status=SubscriptionStatus.INACTIVE))
+    session.commit()
+    session.expunge_all()
+
+
+def test_statement_shape_ignores_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM t WHERE id = 12 AND name = 'x'") == "SELECT * FROM t WHERE id = ? AND name = ?"
+    assert statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?)") == statement_shape("SELECT * FROM t WHERE id IN (?)")
+
+
+def test_lazy_plan_loads_are_flagged_as_n_plus_one(db_session, caplog):
+    seed(db_session)
+    app = create_instrumented_app()
+    client = app.test_client()
+
+    response = client.get('/plans/1')
+
+    assert response.status_code == 200
+    assert 'db;dur=' in response.headers['Server-Timing']
+    # Subscriptions, then 6 lazy plan loads.
+    assert '7 queries' in response.headers['Server-Timing']
+    assert any('Possible N+1 on GET /plans/<int:user_id>' in message for message in caplog.messages)
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'db_n_plus_one_requests_total{endpoint="/plans/<int:user_id>"} 1' in body
+    assert 'db_queries_per_request_bucket{endpoint="/plans/<int:user_id>",le="10"} 1' in body
+    assert 'http_requests_total{endpoint="/plans/<int:user_id>",status="200"} 1' in body
+    assert '# TYPE http_request_duration_seconds histogram' in body
+
+
+def test_requests_below_threshold_are_not_flagged(db_session, caplog):
+    seed(db_session, plans=2)
+    app = create_instrumented_app()
+
+    app.test_client().get('/plans/1')
+
+    assert not any('Possible N+1' in message for message in caplog.messages)
+
+
+def test_failed_statements_do_not_leak_their_start_time(db_session):
+    app = create_instrumented_app()
+
+    response = app.test_client().get('/failing')
+
+    assert response.get_json() == {'pending': 0}
+    assert '2 queries' in response.headers['Server-Timing']
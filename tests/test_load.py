@@ -0,0 +1,61 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from unittest.mock import patch
+import pytest
+
+from benchmarks.datagen import generate
+from benchmarks.load import duplicate_active_users, parse_mix, run_load, summarize
+
+
+@pytest.fixture
+def file_session(tmp_path):
+    """Thread-local sessions on a SQLite file, so concurrent clients get their own connections."""
+    from src import db
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'load.db'}", connect_args={'check_same_thread': False})
+    generate(engine, 20)
+    session = scoped_session(sessionmaker(bind=engine))
+    with patch.object(db, 'session', session):
+        yield session
+    session.remove()
+    engine.dispose()
+
+
+def test_mixed_load_reports_per_route(file_session):
+    result = run_load(workers=4, requests=15, users=20, hot_users=4, mix=parse_mix('active=2,history_optimized=1,subscribe=1,cancel=1'))
+
+    routes = result['routes']
+    assert set(routes) <= {'GET /subscriptions/active', 'GET /subscriptions/history/optimized',
+                           'POST /subscribe/{plan_id}', 'POST /subscriptions/cancel'}
+    assert sum(stats['requests'] for stats in routes.values()) == 60
+    for stats in routes.values():
+        assert stats['error_rate'] == 0
+        assert stats['p50'] <= stats['p95'] <= stats['p99']
+        assert set(stats['statuses']) <= {'200', '201', '400', '404', '409'}
+    # uq_user_subscriptions_one_active rejects the losing side of a subscribe race.
+    assert duplicate_active_users(file_session) == 0
+
+
+def test_summarize_counts_conflicts_errors_and_retries():
+    samples = [
+        ('subscribe', 201, 0.010, 0, 0.002),
+        ('subscribe', 400, 0.020, 0, 0.004),
+        ('subscribe', 503, 0.030, 3, None),
+        ('active', 404, 0.001, 0, 0.0005),
+    ]
+
+    report = summarize(samples, wall_seconds=2.0)
+
+    subscribe = report['POST /subscribe/{plan_id}']
+    assert (subscribe['requests'], subscribe['throughput'], subscribe['retries']) == (3, 1.5, 3)
+    assert subscribe['conflict_rate'] == pytest.approx(1 / 3)
+    assert subscribe['error_rate'] == pytest.approx(1 / 3)
+    assert subscribe['db_p95'] == 0.004
+    # A 404 on a read is an answer, not a conflict.
+    assert report['GET /subscriptions/active']['conflict_rate'] == 0
+
+
+def test_parse_mix_rejects_unknown_operations():
+    assert parse_mix('active=3,cancel') == {'active': 3.0, 'cancel': 1.0}
+    with pytest.raises(ValueError):
+        parse_mix('delete=1')
@@ -1,4 +1,5 @@
 import pytest
+from collections import namedtuple
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 from src import db
@@ -35,6 +36,11 @@ from src.routes import (
 )
 
 
+def create_mock_rows(rows):
+    # Result rows are named tuples in SELECT column order.
+    return [namedtuple('Row', row)(**row) for row in rows]
+
+
 def create_mock_subscription(id=1, user_id=1, plan_id=1, end_date=None, status=SubscriptionStatus.ACTIVE, created_at=None, start_date=None):
     if end_date is None:
         end_date = datetime.utcnow() + timedelta(days=30)
@@ -50,7 +56,7 @@ def test_get_active_subscriptions_optimized_success(app, mock_db_session):
             {"id": 1, "name": "Basic", "price": 10, "duration_days": 30, "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-31T00:00:00"},
             {"id": 2, "name": "Pro", "price": 20, "duration_days": 90, "start_date": "2024-02-01T00:00:00", "end_date": "2024-04-30T00:00:00"},
         ]
-        mock_db_session.execute.return_value.fetchall.return_value = expected_result
+        mock_db_session.execute.return_value.fetchall.return_value = create_mock_rows(expected_result)
 
         result = get_active_subscriptions_optimized_user(user_id)
 
@@ -75,12 +81,14 @@ def test_get_subscription_history_optimized_success(app, mock_db_session):
             {"id": 1, "name": "Pro", "price": 20, "duration_days": 90, "start_date": "2024-02-01T00:00:00", "end_date": "2024-04-30T00:00:00", "status": "active"},
             {"id": 2, "name": "Basic", "price": 10, "duration_days": 30, "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-31T00:00:00", "status": "completed"},
         ]
-        mock_db_session.execute.return_value.fetchall.return_value = expected_result
+        # Hot rows, then the archive read that completes the last page of a user with archived rows.
+        mock_db_session.execute.return_value.fetchall.side_effect = [create_mock_rows(expected_result), []]
 
-        result = get_subscription_history_optimized_user(user_id)
+        with patch('src.routes.optimized_subscriptions.has_archive', return_value=True):
+            result = get_subscription_history_optimized_user(user_id)
 
         assert result.get_json() == expected_result
-        mock_db_session.execute.assert_called_once()
+        assert mock_db_session.execute.call_count == 2
 
 
 def test_get_subscription_history_optimized_no_subscriptions(app, mock_db_session):
@@ -88,6 +96,23 @@ def test_get_subscription_history_optimized_no_subscriptions(app, mock_db_sessio
         user_id = 1
         mock_db_session.execute.return_value.fetchall.return_value = []
 
-        result = get_subscription_history_optimized_user(user_id)
+        # Nothing archived: the hot read is the only one.
+        with patch('src.routes.optimized_subscriptions.has_archive', return_value=False):
+            result = get_subscription_history_optimized_user(user_id)
         assert result.get_json() == []
+        assert mock_db_session.execute.call_count == 1
+
+
+def test_get_active_subscriptions_optimized_is_cached(app, mock_db_session):
+    with app.app_context():
+        user_id = 1
+        expected_result = [
+            {"id": 1, "name": "Basic", "price": 10, "duration_days": 30, "start_date": None, "end_date": datetime.utcnow() + timedelta(days=1)},
+        ]
+        mock_db_session.execute.return_value.fetchall.return_value = create_mock_rows(expected_result)
+
+        first = get_active_subscriptions_optimized_user(user_id)
+        second = get_active_subscriptions_optimized_user(user_id)
+
+        assert first.get_json() == second.get_json()
         mock_db_session.execute.assert_called_once()
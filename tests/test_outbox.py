@@ -0,0 +1,201 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import insert, select
+from tests import app, db_session
+
+from src import load_config
+from src.models import OutboxEvent, SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import bulk_apply_subscriptions, cancel_subscription, subscribe_user, upgrade_subscription
+from src.routes.events import get_event_feed
+from src.routes.plans import create_plan
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.identity import AuthenticatedUser
+from src.utils.outbox import FeedNotifier, NDJSONFileSink, QueueSink, get_feed_notifier, relay_outbox
+
+ADMIN = AuthenticatedUser(99, 'admin')
+
+
+def seed(session):
+    for user_id in (1, 2):
+        session.add(User(id=user_id, username=f"user{user_id}", password="x", email=f"user{user_id}@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name="Pro", price=60, duration_days=90))
+    session.commit()
+
+
+def feed(app, current_user=ADMIN, **args):
+    with app.test_request_context('/events', query_string=args), \
+            patch('src.routes.events.auth.current_user', return_value=current_user):
+        response = app.make_response(get_event_feed())
+        return response.status_code, response.get_json(), response.headers.get('X-Next-Cursor')
+
+
+def test_write_paths_record_events_in_their_transaction(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    upgrade_subscription(AuthenticatedUser(1, "user1"), 2)
+    cancel_subscription(AuthenticatedUser(1, "user1"))
+    # Rolled back by the one-active-subscription constraint: no event either.
+    db_session.execute(insert(UserSubscription), [{'user_id': 2, 'plan_id': 1}])
+    db_session.commit()
+    assert subscribe_user(AuthenticatedUser(2, "user2"), 1)[1] == 400
+    with app.test_request_context('/plans', method='POST', json={'name': 'Team', 'price': 90, 'duration_days': 30}), \
+            patch('src.routes.plans.auth.current_user', return_value=ADMIN):
+        assert create_plan()[1] == 201
+
+    events = db_session.execute(select(OutboxEvent.event_type, OutboxEvent.user_id, OutboxEvent.payload, OutboxEvent.sequence)
+                                .order_by(OutboxEvent.id)).all()
+    assert [(event_type, user_id) for event_type, user_id, _, _ in events] == [
+        ('subscription.created', 1), ('subscription.upgraded', 1), ('subscription.cancelled', 1), ('plan.created', None)]
+    assert all(sequence is None for *_, sequence in events)
+    upgraded = json.loads(events[1].payload)
+    first = db_session.execute(select(UserSubscription).order_by(UserSubscription.id)).scalars().first()
+    assert upgraded['previous_subscription_id'] == first.id and upgraded['previous_plan_id'] == 1 and upgraded['plan_id'] == 2
+    assert json.loads(events[2].payload)['status'] == 'CANCELLED'
+    assert json.loads(events[3].payload)['name'] == 'Team'
+
+
+def recorded(session):
+    return [(event_type, user_id, json.loads(payload)) for event_type, user_id, payload in session.execute(
+        select(OutboxEvent.event_type, OutboxEvent.user_id, OutboxEvent.payload).order_by(OutboxEvent.id))]
+
+
+def test_bulk_operations_record_one_event_each(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(2, "user2"), 1)
+    existing = db_session.execute(select(UserSubscription.id)).scalar()
+    app.config['BULK_CHUNK_SIZE'] = 2
+    operations = [
+        {'op': 'subscribe', 'user_id': 1, 'plan_id': 1},
+        {'op': 'upgrade', 'user_id': 1, 'plan_id': 2},
+        {'op': 'cancel', 'user_id': 2},
+        {'op': 'subscribe', 'user_id': 2, 'plan_id': 2},
+        {'op': 'cancel', 'user_id': 1},
+    ]
+    with app.test_request_context('/', method='POST', json={'operations': operations}), \
+            patch('src.routes.bulk_subscriptions.auth.current_user', return_value=AuthenticatedUser(99, 'admin')):
+        assert bulk_apply_subscriptions()[0].get_json()['succeeded'] == 5
+
+    events = recorded(db_session)[1:]
+    assert [(event_type, user_id) for event_type, user_id, _ in events] == [
+        ('subscription.created', 1), ('subscription.upgraded', 1), ('subscription.cancelled', 2),
+        ('subscription.created', 2), ('subscription.cancelled', 1)]
+    rows = {row.id: row for row in db_session.query(UserSubscription)}
+    created, upgraded, cancelled, resubscribed, last = (payload for _, _, payload in events)
+    # Payloads describe each row as the operation left it, with the ids the inserts got.
+    assert created['status'] == 'ACTIVE' and rows[created['subscription_id']].plan_id == 1
+    assert upgraded['previous_subscription_id'] == created['subscription_id'] and upgraded['previous_plan_id'] == 1
+    assert rows[upgraded['subscription_id']].plan_id == 2
+    assert cancelled['subscription_id'] == existing and cancelled['status'] == 'CANCELLED' and cancelled['plan_id'] == 1
+    assert rows[resubscribed['subscription_id']].status == SubscriptionStatus.ACTIVE
+    assert last['subscription_id'] == upgraded['subscription_id'] and last['status'] == 'CANCELLED'
+    assert len({payload['subscription_id'] for _, _, payload in events}) == 4
+
+
+def test_swept_expiries_record_events(app, db_session):
+    seed(db_session)
+    now = datetime.utcnow()
+    for user_id, end_date in ((1, now - timedelta(days=1)), (2, now + timedelta(days=1))):
+        db_session.add(UserSubscription(user_id=user_id, plan_id=user_id, start_date=end_date - timedelta(days=30), end_date=end_date))
+    db_session.commit()
+
+    assert sweep_expired_subscriptions(db_session, now=now)['rows'] == 1
+
+    [(event_type, user_id, payload)] = recorded(db_session)
+    assert (event_type, user_id) == ('subscription.expired', 1)
+    assert payload['status'] == 'INACTIVE' and payload['plan_id'] == 1
+    assert payload['subscription_id'] == db_session.query(UserSubscription.id).filter_by(user_id=1).scalar()
+
+
+def test_relay_numbers_events_densely_and_publishes_once(app, db_session, tmp_path):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    subscribe_user(AuthenticatedUser(2, "user2"), 2)
+    cancel_subscription(AuthenticatedUser(1, "user1"))
+
+    sink = QueueSink()
+    result = relay_outbox(db_session, sink, batch_size=2)
+    assert (result['rows'], result['batches'], result['last_sequence']) == (3, 2, 3)
+    published = [sink.queue.get_nowait() for _ in range(3)]
+    assert [event['sequence'] for event in published] == [1, 2, 3]
+    assert [event['type'] for event in published] == ['subscription.created', 'subscription.created', 'subscription.cancelled']
+    assert published[1]['data']['user_id'] == 2 and published[1]['data']['plan_id'] == 2
+    assert relay_outbox(db_session, sink)['rows'] == 0 and sink.queue.empty()
+
+    # A failing sink publishes nothing: the batch stays unnumbered for the next run.
+    upgrade_subscription(AuthenticatedUser(2, "user2"), 1)
+
+    class BrokenSink:
+        def publish(self, events):
+            raise OSError('disk full')
+
+    try:
+        relay_outbox(db_session, BrokenSink())
+    except OSError:
+        pass
+    assert db_session.execute(select(OutboxEvent.sequence).order_by(OutboxEvent.id.desc())).scalar() is None
+    path = tmp_path / 'events.ndjson'
+    assert relay_outbox(db_session, NDJSONFileSink(str(path)))['last_sequence'] == 4
+    assert [json.loads(line)['type'] for line in path.read_text().splitlines()] == ['subscription.upgraded']
+
+
+def test_feed_pages_by_sequence_and_long_polls(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    subscribe_user(AuthenticatedUser(2, "user2"), 1)
+    assert feed(app, after=0)[1] == []  # not published yet
+    relay_outbox(db_session, QueueSink())
+
+    assert feed(app, current_user=AuthenticatedUser(1, 'user1'))[0] == 403
+    assert feed(app, limit=0)[0] == 400
+    status, events, cursor = feed(app, after=0, limit=1)
+    assert status == 200 and [event['sequence'] for event in events] == [1] and cursor == '1'
+    status, events, cursor = feed(app, after=cursor)
+    assert [event['data']['user_id'] for event in events] == [2] and cursor == '2'
+
+    # Nothing newer: the wait ends empty once it times out...
+    app.config['OUTBOX_FEED_POLL_SECONDS'] = 0.05
+    assert feed(app, after=2, wait=0.1)[1:] == ([], '2')
+
+    # ...or as soon as a relay in this process publishes something, long before the
+    # next poll would have noticed.
+    app.extensions.pop('outbox_feed_notifier')
+    app.config['OUTBOX_FEED_POLL_SECONDS'] = 30
+
+    def publish_later():
+        with app.app_context():
+            cancel_subscription(AuthenticatedUser(1, "user1"))
+            get_feed_notifier(app).notify(relay_outbox(db_session, QueueSink())['last_sequence'])
+
+    timer = threading.Timer(0.2, publish_later)
+    timer.start()
+    status, events, cursor = feed(app, after=2, wait=5)
+    timer.join()
+    assert [event['type'] for event in events] == ['subscription.cancelled'] and cursor == '3'
+
+
+def test_feed_notifier_polls_once_per_interval_and_caps_waiters():
+    calls = []
+    notifier = FeedNotifier(poll_interval=0.05, max_waiters=1)
+
+    def read_latest():
+        calls.append(1)
+        return 7 if len(calls) >= 3 else 0
+
+    assert notifier.wait(after=5, timeout=2, read_latest=read_latest)
+    assert len(calls) == 3
+
+    notifier._waiters.acquire()
+    assert notifier.wait(after=7, timeout=1, read_latest=read_latest) is False
+
+
+def test_waiter_cap_leaves_a_request_thread_free(monkeypatch):
+    monkeypatch.delenv('OUTBOX_FEED_MAX_WAITERS', raising=False)
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    assert load_config()['OUTBOX_FEED_MAX_WAITERS'] == 7
+    monkeypatch.setenv('GUNICORN_THREADS', '1')
+    assert load_config()['OUTBOX_FEED_MAX_WAITERS'] == 0
+    # With no waiter allowed the feed answers at once.
+    assert FeedNotifier(max_waiters=0).wait(after=0, timeout=5, read_latest=lambda: 0) is False
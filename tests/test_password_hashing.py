@@ -0,0 +1,111 @@
+import pytest
+from threading import Event, Thread
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+from tests import app, db_session
+
+from src.models import User
+from src.routes.authen import login, register
+from src.utils.password_hashing import HashingBusy, PasswordHasher, hash_password, hashing_busy
+
+FAST = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def auth_app(app, db_session):
+    app.config.update(JWT_SECRET_KEY='test-secret-key-long-enough-for-hs256', PASSWORD_HASH_METHOD=FAST, PASSWORD_HASH_EXECUTOR='thread')
+    yield app
+    app.extensions.pop('password_hasher').shutdown()
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread', 'inline'])
+def test_hash_verify_and_rehash(executor):
+    hasher = PasswordHasher(method=FAST, executor=executor, workers=1)
+    try:
+        stored = hasher.hash('secret')
+        assert stored.startswith(FAST + '$')
+        assert hasher.verify(stored, 'secret') == (True, None)
+        assert hasher.verify(stored, 'wrong') == (False, None)
+
+        matches, new_hash = hasher.verify(generate_password_hash('secret', method='pbkdf2:sha256:500'), 'secret')
+        assert matches and new_hash.startswith(FAST + '$')
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_sheds_with_retry_after():
+    hasher = PasswordHasher(method=FAST, executor='thread', workers=1, max_pending=1, queue_timeout=0.01)
+    started, release = Event(), Event()
+
+    def slow_hash(password, method):
+        started.set()
+        release.wait(5)
+        return hash_password(password, method)
+
+    with patch('src.utils.password_hashing.hash_password', slow_hash):
+        first = Thread(target=hasher.hash, args=('secret',))
+        first.start()
+        started.wait(5)
+        with pytest.raises(HashingBusy) as busy:
+            hasher.hash('other')
+        release.set()
+        first.join()
+    hasher.shutdown()
+
+    body, status_code, headers = hashing_busy(busy.value)
+    assert status_code == 503 and headers == {'Retry-After': '1'}
+
+
+def test_register_hashes_off_thread_and_login_upgrades_old_hashes(auth_app, db_session):
+    with auth_app.test_request_context(json={'username': 'alice', 'password': 'secret', 'email': 'a@example.com'}):
+        assert register()[1] == 201
+    assert db_session.query(User).one().password.startswith(FAST + '$')
+
+    user = db_session.query(User).one()
+    user.password = generate_password_hash('secret', method='pbkdf2:sha256:500')
+    db_session.commit()
+
+    with auth_app.test_request_context(json={'username': 'alice', 'password': 'wrong'}):
+        assert login()[1] == 401
+    assert db_session.query(User).one().password.startswith('pbkdf2:sha256:500$')
+
+    with auth_app.test_request_context(json={'username': 'alice', 'password': 'secret'}):
+        assert login()[1] == 200
+    assert db_session.query(User).one().password.startswith(FAST + '$')
+
+
+def test_timed_out_call_keeps_its_slot_until_it_finishes():
+    hasher = PasswordHasher(method=FAST, executor='thread', workers=1, max_pending=1, queue_timeout=0.01, result_timeout=0.05)
+    release = Event()
+
+    def slow_hash(password, method):
+        release.wait(5)
+        return hash_password(password, method)
+
+    with patch('src.utils.password_hashing.hash_password', slow_hash):
+        with pytest.raises(HashingBusy):
+            hasher.hash('secret')
+        # The KDF still runs, so the only slot is still taken.
+        with pytest.raises(HashingBusy):
+            hasher.hash('other')
+        release.set()
+        hasher.queue_timeout = 5
+        assert hasher.hash('third').startswith(FAST + '$')
+    hasher.shutdown()
+
+
+def test_broken_process_pool_is_replaced():
+    hasher = PasswordHasher(method=FAST, executor='process', workers=1)
+    try:
+        assert hasher.hash('secret').startswith(FAST + '$')
+        broken = hasher._executor
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+
+        with pytest.raises(HashingBusy):
+            hasher.hash('secret')
+        assert hasher._executor is not broken
+        assert hasher.verify(hasher.hash('secret'), 'secret') == (True, None)
+    finally:
+        hasher.shutdown()
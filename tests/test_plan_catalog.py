@@ -0,0 +1,69 @@
+import json
+from tests import app, db_session
+
+from src.models import SubscriptionPlan
+from src.utils.plan_catalog import PlanCatalog, bump_catalog_version, get_plan_catalog
+from src.routes.plans import get_all_plans_response
+
+
+def add_plan(session, name, price=10, duration_days=30, bump=True):
+    plan = SubscriptionPlan(name=name, price=price, duration_days=duration_days)
+    session.add(plan)
+    if bump:
+        bump_catalog_version(session)
+    session.commit()
+    return plan
+
+
+def test_plans_response_is_served_from_catalog(app, db_session):
+    with app.app_context():
+        add_plan(db_session, "Basic")
+
+        response = get_all_plans_response()
+
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data()) == [
+            {'id': 1, 'name': 'Basic', 'price': 10, 'description': None, 'duration_days': 30}
+        ]
+        assert get_plan_catalog().version == 1
+
+
+def test_catalog_reloads_only_when_version_moves(app, db_session):
+    with app.app_context():
+        catalog = PlanCatalog(check_interval=0)
+        add_plan(db_session, "Basic")
+        assert set(catalog.refresh(db_session).plans) == {1}
+
+        # A write that does not bump the version is not picked up...
+        add_plan(db_session, "Pro", bump=False)
+        assert set(catalog.refresh(db_session).plans) == {1}
+
+        # ...and one that does is.
+        add_plan(db_session, "Enterprise")
+        assert set(catalog.refresh(db_session).plans) == {1, 2, 3}
+        assert catalog.version == 2
+
+
+def test_catalog_skips_version_check_within_interval(app, db_session):
+    with app.app_context():
+        catalog = PlanCatalog(check_interval=3600)
+        add_plan(db_session, "Basic")
+        catalog.refresh(db_session)
+
+        add_plan(db_session, "Pro")
+        assert set(catalog.refresh(db_session).plans) == {1}
+
+        catalog.invalidate()
+        assert set(catalog.refresh(db_session).plans) == {1, 2}
+
+
+def test_catalog_falls_back_to_primary_key_lookup(app, db_session):
+    with app.app_context():
+        catalog = PlanCatalog(check_interval=3600)
+        catalog.refresh(db_session)
+        add_plan(db_session, "Basic", bump=False)
+
+        plan = catalog.get(db_session, 1)
+
+        assert plan.name == "Basic"
+        assert catalog.get(db_session, 99) is None
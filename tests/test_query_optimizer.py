@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from unittest.mock import patch
+from tests import app, db_session
+
+from src import app as flask_app
+from src.models import SubscriptionPlan, User, UserSubscription
+from src.utils.expiry_sweeper import metrics as sweep_metrics
+from src.utils.query_optimizer import (
+    analyze_workload,
+    capture_route_workload,
+    capture_workload,
+    create_index_if_not_exists,
+    explain,
+    mysql_findings,
+    suggest_index,
+)
+
+UNINDEXED = "SELECT id FROM user_subscriptions WHERE plan_id = ? ORDER BY created_at DESC"
+
+
+def seed(session):
+    session.add(User(id=1, username="user1", password="x", email="user1@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    now = datetime.utcnow()
+    session.add(UserSubscription(user_id=1, plan_id=1, start_date=now, end_date=now + timedelta(days=30)))
+    session.commit()
+
+
+def test_sqlite_explain_flags_scan_and_sort(db_session):
+    report = explain(UNINDEXED, (1,), session=db_session)
+
+    assert report['dialect'] == 'sqlite'
+    assert report['full_scans'] == ['user_subscriptions']
+    assert report['filesort'] is True
+
+
+def test_suggestion_puts_equality_before_order_columns(db_session):
+    assert suggest_index(UNINDEXED, 'user_subscriptions') == ['plan_id', 'created_at']
+
+    history = "SELECT us.id FROM user_subscriptions AS us JOIN subscription_plans AS sp ON us.plan_id = sp.id " \
+              "WHERE us.user_id = ? AND us.start_date < ? ORDER BY us.start_date DESC, us.id DESC"
+    assert suggest_index(history, 'user_subscriptions') == ['user_id', 'start_date', 'id']
+
+
+def test_workload_report_and_emit(db_session):
+    with capture_workload() as workload:
+        db_session.execute(UserSubscription.__table__.select().where(UserSubscription.plan_id == 1)
+                           .order_by(UserSubscription.created_at.desc())).all()
+
+    [report] = analyze_workload(workload, session=db_session)
+    [suggestion] = report['suggestions']
+    assert suggestion['columns'] == ['plan_id', 'created_at']
+    assert suggestion['ddl'] == 'CREATE INDEX idx_user_subscriptions_plan_id_created_at ON user_subscriptions (plan_id, created_at)'
+
+    assert create_index_if_not_exists(suggestion['columns'], suggestion['table']) is True
+    assert create_index_if_not_exists(suggestion['columns'], suggestion['table']) is False
+    [report] = analyze_workload(workload, session=db_session)
+    assert report['full_scans'] == [] and report['suggestions'] == []
+
+
+def test_route_workload_is_served_by_indexes(db_session):
+    seed(db_session)
+
+    before = sweep_metrics.snapshot()
+    workload = capture_route_workload(flask_app, 1)
+    assert sweep_metrics.snapshot() == before
+    assert any('user_subscriptions.end_date <=' in shape for shape in workload)
+    reports = analyze_workload(workload, session=db_session)
+
+    assert any('user_current_subscriptions' in report['statement'] for report in reports)
+    history = [report for report in reports if 'ORDER BY user_subscriptions.start_date' in report['statement']]
+    assert history and not history[0]['filesort'] and not history[0]['suggestions']
+
+
+def test_mysql_findings():
+    plan = [
+        {'table': 'us', 'type': 'ALL', 'Extra': 'Using where; Using filesort'},
+        {'table': 'sp', 'type': 'eq_ref', 'Extra': None},
+    ]
+
+    assert mysql_findings(plan) == {'full_scans': ['us'], 'filesort': True, 'temporary': False}
+
+
+def test_mysql_aliases_map_to_tables_before_suggesting(db_session):
+    statement = "SELECT us.id FROM user_subscriptions us JOIN subscription_plans sp ON us.plan_id = sp.id " \
+                "WHERE us.created_at > %s"
+    findings = mysql_findings([{'table': 'us', 'type': 'ALL', 'Extra': 'Using where'},
+                               {'table': 'sp', 'type': 'eq_ref', 'Extra': None}])
+    with patch('src.utils.query_optimizer.explain', return_value={'dialect': 'mysql', 'plan': [], **findings}):
+        [report] = analyze_workload({'shape': (statement, ())}, session=db_session)
+
+    [suggestion] = report['suggestions']
+    assert suggestion['table'] == 'user_subscriptions' and suggestion['columns'] == ['created_at']
+    assert suggestion['ddl'] == 'CREATE INDEX idx_user_subscriptions_created_at ON user_subscriptions (created_at)'
+
+
+def test_indexes_declared_in_models_but_missing_are_suggested(db_session):
+    seed(db_session)
+    # Declared in src/models.py, never created on this database.
+    db_session.execute(text('DROP INDEX idx_user_subscriptions_user_id_start_date'))
+
+    reports = analyze_workload(capture_route_workload(flask_app, 1), session=db_session)
+
+    history = [report for report in reports if 'ORDER BY user_subscriptions.start_date' in report['statement']]
+    assert any(suggestion['columns'][:2] == ['user_id', 'start_date'] for suggestion in history[0]['suggestions'])
+
+
+def test_unsupported_dialects_are_reported_by_the_cli(db_session):
+    with patch('src.utils.query_optimizer.dialect_name', return_value='oracle'):
+        result = flask_app.test_cli_runner().invoke(args=['analyze-queries', '--user-id', '1'])
+
+    assert result.exit_code == 1
+    assert 'EXPLAIN is not supported for oracle' in result.output
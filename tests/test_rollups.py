@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from unittest.mock import patch
+from tests import app, db_session
+
+from src import auth
+from src.models import DailySubscriptionRollup, SubscriptionPlan, SubscriptionStatus, User, UserSubscription
+from src.routes import cancel_subscription, subscribe_user, upgrade_subscription
+from src.routes.reports import get_daily_report, get_subscriber_report
+from src.utils.expiry_sweeper import sweep_expired_subscriptions
+from src.utils.identity import AuthenticatedUser
+from src.utils.rollups import catch_up_rollups, daily_report, rebuild_rollups, subscriber_report, verify_rollups
+
+CLEAN = {'plans': 0, 'days': 0, 'sample_plan_ids': [], 'sample_days': []}
+
+
+def seed(session):
+    for user_id in (1, 2, 3):
+        session.add(User(id=user_id, username=f"user{user_id}", password="x", email=f"user{user_id}@example.com"))
+    session.add(SubscriptionPlan(id=1, name="Basic", price=10, duration_days=30))
+    session.add(SubscriptionPlan(id=2, name="Pro", price=60, duration_days=90))
+    session.commit()
+
+
+def plans(session):
+    return {plan.id: plan for plan in session.query(SubscriptionPlan)}
+
+
+def test_write_paths_keep_rollups_current(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    subscribe_user(AuthenticatedUser(2, "user2"), 1)
+    subscribe_user(AuthenticatedUser(3, "user3"), 2)
+    upgrade_subscription(AuthenticatedUser(1, "user1"), 2)
+    cancel_subscription(AuthenticatedUser(2, "user2"))
+
+    report = subscriber_report(db_session, plans(db_session))
+    assert [(row['plan_id'], row['active_subscribers'], row['mrr']) for row in report['plans']] == [(1, 0, 0), (2, 2, 40.0)]
+    assert (report['active_subscribers'], report['mrr']) == (2, 40.0)
+
+    today = daily_report(db_session, 2)[-1]
+    assert {key: today[key] for key in ('started', 'cancelled', 'upgraded', 'expired', 'active_subscribers')} == {
+        'started': 4, 'cancelled': 1, 'upgraded': 1, 'expired': 0, 'active_subscribers': 2}
+    assert today['churn_rate'] is None  # nobody was active at the start of the day
+    assert verify_rollups(db_session) == CLEAN
+
+    # The catch-up job finds nothing left to count.
+    assert catch_up_rollups(db_session)['changed'] == 0
+    assert verify_rollups(db_session) == CLEAN
+
+
+def test_catch_up_counts_bulk_and_sweeper_writes_once(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    catch_up_rollups(db_session)
+
+    # Written outside the request paths: a Core insert (as the bulk endpoint does) and an expiry.
+    past = datetime.utcnow() - timedelta(days=40)
+    db_session.execute(insert(UserSubscription), [{
+        'user_id': 2, 'plan_id': 2, 'start_date': past, 'end_date': past + timedelta(days=30),
+        'status': SubscriptionStatus.ACTIVE, 'created_at': past, 'updated_at': datetime.utcnow(),
+    }])
+    db_session.commit()
+    assert verify_rollups(db_session)['plans'] == 1
+
+    assert catch_up_rollups(db_session, batch_size=1)['changed'] == 1
+    sweep_expired_subscriptions(db_session)
+    assert catch_up_rollups(db_session)['changed'] == 1
+    assert catch_up_rollups(db_session)['changed'] == 0
+    assert verify_rollups(db_session) == CLEAN
+
+    expired = db_session.query(DailySubscriptionRollup).filter_by(plan_id=2, day=(past + timedelta(days=30)).date()).one()
+    assert (expired.started, expired.expired) == (0, 1)
+
+
+def test_verify_detects_drift_and_rebuild_repairs_it(app, db_session):
+    seed(db_session)
+    subscribe_user(AuthenticatedUser(1, "user1"), 1)
+    upgrade_subscription(AuthenticatedUser(1, "user1"), 2)
+    db_session.query(DailySubscriptionRollup).update({'cancelled': DailySubscriptionRollup.cancelled + 3})
+    db_session.commit()
+
+    report = verify_rollups(db_session)
+    assert report['days'] == 2 and report['plans'] == 0
+
+    assert rebuild_rollups(db_session)['subscriptions'] == 2
+    assert verify_rollups(db_session) == CLEAN
+    assert daily_report(db_session, 1)[0]['upgraded'] == 1
+
+
+def test_report_routes_are_admin_only_and_validate_days(app, db_session):
+    seed(db_session)
+    db_session.add(User(id=4, username="admin", password="x", email="admin@example.com"))
+    db_session.commit()
+    subscribe_user(AuthenticatedUser(1, "user1"), 2)
+
+    with patch.object(auth, 'current_user', return_value=AuthenticatedUser(1, "user1")):
+        assert get_subscriber_report()[1] == 403
+    with patch.object(auth, 'current_user', return_value=AuthenticatedUser(4, "admin")):
+        response, status_code = get_subscriber_report()
+        assert status_code == 200 and response.get_json()['mrr'] == 20.0
+        with app.test_request_context('/admin/reports/daily?days=7&plan_id=2'):
+            response, status_code = get_daily_report()
+            days = response.get_json()['days']
+            assert status_code == 200 and len(days) == 7 and days[-1]['started'] == 1
+        with app.test_request_context('/admin/reports/daily?days=0'):
+            assert get_daily_report()[1] == 400
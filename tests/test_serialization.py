@@ -0,0 +1,61 @@
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from flask import Flask
+from werkzeug.http import http_date
+
+from src.models import SubscriptionStatus
+from src.utils.serialization import FastJSONProvider, compile_row_encoder, encode_rows, format_http_date, orjson, resolve_backend
+
+FIELDS = ('id', 'name', 'price', 'start_date', 'end_date', 'ratio')
+ROWS = [
+    (1, 'Basic "plan" é', 10, datetime(2024, 3, 31, 12, 5, 9), None, 0.5),
+    (2, 'Pro', Decimal('19.90'), date(2024, 2, 29), datetime(2024, 4, 1, tzinfo=timezone(timedelta(hours=2))), True),
+]
+
+
+def provider(backend):
+    app = Flask(__name__)
+    app.config['JSON_BACKEND'] = backend
+    return FastJSONProvider(app)
+
+
+def test_http_dates_match_werkzeug():
+    for value in (datetime(2024, 3, 31), datetime(1999, 12, 1, 23, 59, 59, 999999), date(2024, 2, 29),
+                  datetime(2024, 1, 1, 1, 30, tzinfo=timezone(timedelta(hours=5)))):
+        assert format_http_date(value) == http_date(value)
+
+
+def test_row_encoder_matches_jsonify_byte_for_byte():
+    encoder = compile_row_encoder(FIELDS, 'sample')
+    flask_app = Flask(__name__)
+    expected = flask_app.json.dumps([dict(zip(FIELDS, row)) for row in ROWS], separators=(',', ':'))
+
+    assert encode_rows(ROWS, encoder) == expected
+    assert encode_rows([], encoder) == '[]'
+    assert compile_row_encoder(())(()) == '{}'
+
+
+def test_row_encoder_falls_back_for_other_types():
+    encoder = compile_row_encoder(('status', 'tags'))
+    assert encoder((SubscriptionStatus.ACTIVE, ['a', 1])) == '{"status":"active","tags":["a",1]}'
+    with pytest.raises(ValueError):
+        encoder((1, 2, 3))
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_provider_keeps_jsonify_output(backend):
+    if backend == 'orjson' and orjson is None:
+        pytest.skip('orjson not installed')
+    compact = {'separators': (',', ':')}
+    payload = {'b': [datetime(2024, 3, 31)], 'a': SubscriptionStatus.CANCELLED, 'c': Decimal('1.5'), 'd': None}
+    assert provider(backend).dumps(payload, **compact) == '{"a":"cancelled","b":["Sun, 31 Mar 2024 00:00:00 GMT"],"c":"1.5","d":null}'
+    # Integers past 64 bits are outside orjson's range and take the stdlib path.
+    assert provider(backend).dumps({'n': 2 ** 70}, **compact) == '{"n":%d}' % 2 ** 70
+
+
+def test_backend_resolution():
+    assert resolve_backend('json') == 'json'
+    assert resolve_backend('auto') == ('orjson' if orjson is not None else 'json')
+    with pytest.raises(ValueError):
+        resolve_backend('simdjson')
@@ -8,6 +8,7 @@ from src.models import (
     SubscriptionPlan,
     SubscriptionStatus,
     User,
+    UserCurrentSubscription,
     UserSubscription
 )
 
@@ -16,12 +17,15 @@ from src.models import (
 def mock_db_session():
     session = MagicMock()
     db.session = session
+    session.get.return_value = None
 
     query_mock = MagicMock()
     session.query.return_value = query_mock
+    query_mock.options.return_value = query_mock
     query_mock.filter_by.return_value = query_mock
     query_mock.filter.return_value = query_mock
     query_mock.order_by.return_value = query_mock
+    query_mock.limit.return_value = query_mock
     query_mock.first.return_value = None
     query_mock.all.return_value = []
 
@@ -47,6 +51,11 @@ def create_mock_user(id=1):
     return User(id=id)
 
 
+def create_mock_current_subscription(subscription, plan):
+    return UserCurrentSubscription(user_id=subscription.user_id, subscription_id=subscription.id, plan_id=plan.id, plan_name=plan.name,
+                                   start_date=subscription.start_date, end_date=subscription.end_date)
+
+
 def create_mock_subscription(id=1, user_id=1, plan_id=1, end_date=None, status=SubscriptionStatus.ACTIVE, created_at=None, start_date=None):
     if end_date is None:
         end_date = datetime.utcnow() + timedelta(days=30)
@@ -102,10 +111,11 @@ def test_get_active_subscriptions_success(app, mock_db_session):
         now = datetime.utcnow()
         plan = create_mock_plan()
         active_subscription = create_mock_subscription(user_id=user.id, end_date=now + timedelta(days=1), status=SubscriptionStatus.ACTIVE, created_at=datetime(2024, 1, 1))
-        active_subscription.plan = plan
 
-        mock_db_session.query_mock.filter.return_value.first.return_value = active_subscription
+        mock_db_session.get.return_value = create_mock_current_subscription(active_subscription, plan)
         result, status_code = get_active_subscriptions_user(user.id)
+        mock_db_session.get.assert_called_once_with(UserCurrentSubscription, user.id)
+        mock_db_session.query.assert_not_called()
         assert status_code == 200
         assert result.json["plan_name"] == plan.name
         assert result.json["start_date"] == active_subscription.start_date.strftime('%a, %d %b %Y %H:%M:%S GMT')
@@ -114,7 +124,7 @@ def test_get_active_subscriptions_success(app, mock_db_session):
 
 def test_get_active_subscriptions_no_subscription(app, mock_db_session):
     with app.app_context():
-        mock_db_session.query.filter.return_value.first.return_value = None
+        mock_db_session.get.return_value = None
 
         result, status_code = get_active_subscriptions_user(1)
         assert status_code == 404
@@ -129,7 +139,8 @@ def test_get_subscription_history_success(app, mock_db_session):
         subscription1.plan = create_mock_plan()
         subscription2 = create_mock_subscription(user_id=user.id, status=SubscriptionStatus.CANCELLED, created_at=datetime(2024, 2, 1), end_date=now - timedelta(days=1))
         subscription2.plan = create_mock_plan()
-        mock_db_session.query_mock.all.return_value = [subscription1, subscription2]
+        # Hot rows, then the archive read that completes the last page.
+        mock_db_session.query_mock.all.side_effect = [[subscription1, subscription2], []]
         result, status_code = get_subscription_history_user(user.id)
         assert status_code == 200
         assert len(result.json) == 2
@@ -216,3 +227,25 @@ def test_cancel_subscription_no_active_subscription(app, mock_db_session):
         assert status_code == 400
         assert "No active subscription to cancel" in result.json["message"]
         mock_db_session.commit.assert_not_called()
+
+
+def test_get_active_subscriptions_cached_until_write(app, mock_db_session):
+    with app.app_context():
+        user = create_mock_user()
+        active_subscription = create_mock_subscription(user_id=user.id, status=SubscriptionStatus.ACTIVE)
+        mock_db_session.get.return_value = create_mock_current_subscription(active_subscription, create_mock_plan())
+
+        get_active_subscriptions_user(user.id)
+        result, status_code = get_active_subscriptions_user(user.id)
+        assert status_code == 200
+        assert result.json["plan_name"] == "Basic"
+        assert mock_db_session.get.call_count == 1
+
+        mock_db_session.query_mock.filter_by.return_value.first.return_value = active_subscription
+        cancel_subscription(user)
+        mock_db_session.get.return_value = None
+
+        result, status_code = get_active_subscriptions_user(user.id)
+        assert status_code == 404
+        get_active_subscriptions_user(user.id)
+        assert mock_db_session.get.call_count == 2
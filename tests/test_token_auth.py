@@ -0,0 +1,127 @@
+import jwt
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from src import db, verify_token
+from tests import app, db_session
+
+from src.models import RevokedToken, User
+from src.routes.authen import logout, refresh
+from src.utils.tokens import (
+    ACCESS_TOKEN,
+    REFRESH_TOKEN,
+    RevocationList,
+    TokenError,
+    decode_token,
+    issue_token,
+    revoke_token,
+)
+
+
+@pytest.fixture
+def mock_db_session(app):
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-long-enough-for-hs256'
+    with patch.object(db, 'session') as mock_session:
+        mock_session.query.return_value.filter.return_value.all.return_value = []
+        yield mock_session
+
+
+def create_mock_user():
+    return User(id=3, username="bob")
+
+
+def test_access_token_builds_user_from_claims(app, mock_db_session):
+    with app.app_context():
+        token = issue_token(create_mock_user(), ACCESS_TOKEN)
+
+        user = verify_token(token)
+        verify_token(token)
+
+        assert user.id == 3
+        assert user.username == "bob"
+        # Only the periodic revocation sync touches the database.
+        assert mock_db_session.query.call_count == 1
+        mock_db_session.get.assert_not_called()
+
+
+def test_refresh_token_is_not_accepted_as_access_token(app, mock_db_session):
+    with app.app_context():
+        token = issue_token(create_mock_user(), REFRESH_TOKEN)
+
+        assert verify_token(token) is None
+        assert decode_token(token, expected_type=REFRESH_TOKEN)['user_id'] == 3
+
+
+def test_expired_token_is_rejected(app, mock_db_session):
+    with app.app_context():
+        payload = {'user_id': 3, 'username': 'bob', 'type': ACCESS_TOKEN, 'jti': 'x',
+                   'exp': datetime.utcnow() - timedelta(seconds=1)}
+        token = jwt.encode(payload, 'test-secret-key-long-enough-for-hs256', algorithm='HS256')
+
+        with pytest.raises(TokenError):
+            decode_token(token)
+        assert verify_token(token) is None
+
+
+def test_token_signed_with_other_key_is_rejected(app, mock_db_session):
+    with app.app_context():
+        payload = {'user_id': 3, 'username': 'bob', 'type': ACCESS_TOKEN, 'jti': 'x',
+                   'exp': datetime.utcnow() + timedelta(minutes=5)}
+        token = jwt.encode(payload, 'another-secret-key-long-enough-for-hs256', algorithm='HS256')
+
+        assert verify_token(token) is None
+
+
+def test_revoked_token_is_rejected(app, mock_db_session):
+    with app.app_context():
+        token = issue_token(create_mock_user(), ACCESS_TOKEN)
+        revoke_token(decode_token(token))
+
+        assert verify_token(token) is None
+        mock_db_session.execute.assert_called_once()
+        mock_db_session.commit.assert_called_once()
+
+
+def test_replayed_refresh_token_is_rejected_not_a_500(app, db_session):
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-long-enough-for-hs256'
+    db_session.add(User(id=3, username='bob', password='x', email='bob@example.com'))
+    db_session.commit()
+    refresh_token = issue_token(create_mock_user(), REFRESH_TOKEN)
+    access_token = issue_token(create_mock_user(), ACCESS_TOKEN)
+    # Two workers; the second synced before the first one spends the token.
+    first, second = RevocationList(sync_interval=3600), RevocationList(sync_interval=3600)
+    second.sync()
+
+    app.extensions['token_revocations'] = first
+    with app.test_request_context(json={'refresh_token': refresh_token}):
+        assert refresh()[1] == 200
+        assert refresh()[1] == 401
+
+    app.extensions['token_revocations'] = second
+    with app.test_request_context(json={'refresh_token': refresh_token}):
+        response, status_code = refresh()
+        assert status_code == 401 and response.json['message'] == 'Invalid refresh token'
+
+    # Logging out with tokens another worker already revoked still succeeds.
+    first.revoke(decode_token(access_token)['jti'], datetime.utcnow() + timedelta(minutes=30))
+    app.extensions['token_revocations'] = RevocationList(sync_interval=3600)
+    app.extensions['token_revocations'].sync()
+    with app.test_request_context(json={'refresh_token': refresh_token}, headers={'Authorization': f'Bearer {access_token}'}):
+        assert logout()[1] == 200
+    app.extensions.pop('token_revocations')
+
+
+def test_revocations_committed_late_with_a_lower_id_are_still_synced(app, db_session):
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=1)
+    worker = RevocationList(sync_interval=3600)
+    db_session.add(RevokedToken(id=10, jti='fast', expires_at=expires_at, revoked_at=now))
+    db_session.commit()
+    worker.sync()
+
+    # Its id and revoked_at were taken before the row above, but it committed after the sync.
+    db_session.add(RevokedToken(id=5, jti='slow', expires_at=expires_at, revoked_at=now - timedelta(seconds=2)))
+    db_session.commit()
+    worker.sync()
+
+    assert worker.is_revoked('fast') and worker.is_revoked('slow')